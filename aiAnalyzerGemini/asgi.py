@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aiAnalyzerGemini.settings')
+# Lets settings pick ASGI-safe defaults (DB_CONN_MAX_AGE)
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its latency and query counts cover the whole request
+    'analyzer.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -82,13 +85,79 @@ WSGI_APPLICATION = 'aiAnalyzerGemini.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# SQLite (the default) runs in WAL mode, so History writes no longer block history and
+# wallet reads. DB_ENGINE=postgresql|mysql selects a server database configured from
+# DB_NAME/DB_USER/DB_PASSWORD/DB_HOST/DB_PORT; DB_REPLICA_HOST then adds a 'replica'
+# alias that read-heavy views are routed to (analyzer.routers).
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite3')
+# Persistent connections: not under ASGI (asgi.py sets DJANGO_ASGI=1), where each request's
+# sync_to_async thread opens its own connection and nothing reliably closes it
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '0' if os.getenv('DJANGO_ASGI') == '1' else '600'))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '20'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # busy_timeout: seconds to wait for a lock before "database is locked"
+                'timeout': SQLITE_BUSY_TIMEOUT,
+                # Take the write lock at BEGIN; a deferred transaction that later upgrades
+                # its read lock fails at once instead of waiting out the busy timeout
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000;'
+                ),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': os.getenv('DB_NAME', 'aianalyzer'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.getenv('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.getenv('DB_REPLICA_HOST'),
+            'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['analyzer.routers.ReadReplicaRouter']
+
+
+# Shared cache (wallet balances). The default is per process; point CACHE_BACKEND/
+# CACHE_LOCATION at Redis or memcached when running several workers. Balances are
+# only cached with a shared backend: purchases are credited by separate processes
+# (process_mpesa_callbacks, reconcile_payments), and invalidating a per-process
+# cache there would leave every web worker showing the old balance.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
-
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -132,12 +201,140 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Token -> user lookups cached per process (analyzer.authentication)
+AUTH_TOKEN_CACHE_MAXSIZE = int(os.getenv('AUTH_TOKEN_CACHE_MAXSIZE', '10000'))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', '60'))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'analyzer.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
 }
+
+# Gemini analysis
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'models/gemini-flash-latest')
+
+# Shared Gemini client (analyzer.gemini): per-call deadline and retries in seconds, circuit breaker.
+# GEMINI_BACKEND='fake' replaces the API with an offline fake for tests and benchmarks.
+GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'google')
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '60'))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+GEMINI_RETRY_BACKOFF = float(os.getenv('GEMINI_RETRY_BACKOFF', '0.5'))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+GEMINI_BREAKER_RESET = float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+GEMINI_FAKE_LATENCY = float(os.getenv('GEMINI_FAKE_LATENCY', '0.5'))
+GEMINI_FAKE_JITTER = float(os.getenv('GEMINI_FAKE_JITTER', '0'))
+GEMINI_FAKE_FAILURE_RATE = float(os.getenv('GEMINI_FAKE_FAILURE_RATE', '0'))
+GEMINI_FAKE_KEY_CAPACITY = int(os.getenv('GEMINI_FAKE_KEY_CAPACITY', '0'))  # fake 429s beyond this many calls per key
+
+# API keys: calls rotate across GEMINI_API_KEYS (comma-separated); a single GEMINI_API_KEY still works
+GEMINI_API_KEYS = [
+    key.strip() for key in os.getenv('GEMINI_API_KEYS', os.getenv('GEMINI_API_KEY', '')).split(',') if key.strip()
+]
+
+# Outbound call scheduler (analyzer.scheduler): AIMD bounds on concurrent calls per process,
+# per-key requests per minute (0 = untracked), base cooldown of a throttled key in seconds,
+# and how long a call may wait for capacity before failing with 503.
+# The concurrency limit and the interactive > batch > background order hold within one
+# process (run_analysis_worker is its own process, bounded by its --concurrency). Key
+# quotas and cooldowns are shared by the processes of a host through GEMINI_KEY_STATE_DB
+# ('' keeps them per process; the fake backend always does, as its quotas are simulated
+# per process).
+GEMINI_INITIAL_CONCURRENCY = int(os.getenv('GEMINI_INITIAL_CONCURRENCY', '8'))
+GEMINI_MIN_CONCURRENCY = int(os.getenv('GEMINI_MIN_CONCURRENCY', '1'))
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '64'))
+GEMINI_AIMD_INCREASE = float(os.getenv('GEMINI_AIMD_INCREASE', '1'))
+GEMINI_AIMD_DECREASE = float(os.getenv('GEMINI_AIMD_DECREASE', '0.5'))
+GEMINI_KEY_RPM = int(os.getenv('GEMINI_KEY_RPM', '0'))
+GEMINI_KEY_COOLDOWN = float(os.getenv('GEMINI_KEY_COOLDOWN', '2'))
+GEMINI_KEY_STATE_DB = os.getenv('GEMINI_KEY_STATE_DB', str(BASE_DIR / 'gemini-keys.sqlite3'))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', '30'))
+
+# Prompt token budget per Gemini call; longer essays are sampled (head, middle, tail) to fit
+ANALYSIS_MAX_PROMPT_TOKENS = int(os.getenv('ANALYSIS_MAX_PROMPT_TOKENS', '12000'))
+
+# Result cache for repeated essays: in-process LRU tier + CachedAnalysis table.
+# TTLs are in seconds; ANALYSIS_CACHE_DB_TTL=0 keeps DB entries forever.
+ANALYSIS_CACHE_MAXSIZE = int(os.getenv('ANALYSIS_CACHE_MAXSIZE', '1024'))
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', '3600'))
+ANALYSIS_CACHE_DB_TTL = int(os.getenv('ANALYSIS_CACHE_DB_TTL', str(30 * 24 * 3600)))
+
+# Local stylometric pre-screen (analyzer.stylometry). Essays whose local score is at or below
+# the human threshold / at or above the AI threshold are answered without calling Gemini.
+STYLOMETRY_PRESCREEN = os.getenv('STYLOMETRY_PRESCREEN', '1') == '1'
+STYLOMETRY_HUMAN_THRESHOLD = float(os.getenv('STYLOMETRY_HUMAN_THRESHOLD', '0.05'))
+STYLOMETRY_AI_THRESHOLD = float(os.getenv('STYLOMETRY_AI_THRESHOLD', '0.97'))
+STYLOMETRY_MIN_WORDS = int(os.getenv('STYLOMETRY_MIN_WORDS', '20'))  # shorter texts are always scored locally
+STYLOMETRY_MIN_SENTENCES = int(os.getenv('STYLOMETRY_MIN_SENTENCES', '5'))
+
+# Batch analysis (/api/analyze/batch/): max essays per request and concurrent Gemini calls
+ANALYSIS_BATCH_MAX_SIZE = int(os.getenv('ANALYSIS_BATCH_MAX_SIZE', '100'))
+ANALYSIS_BATCH_CONCURRENCY = int(os.getenv('ANALYSIS_BATCH_CONCURRENCY', '8'))
+
+# Chunked analysis ("mode": "chunked"): max characters per segment and segments analyzed at once
+ANALYSIS_CHUNK_MAX_CHARS = int(os.getenv('ANALYSIS_CHUNK_MAX_CHARS', '6000'))
+ANALYSIS_CHUNK_CONCURRENCY = int(os.getenv('ANALYSIS_CHUNK_CONCURRENCY', '8'))
+
+# Background analysis queue (AnalysisJob + `manage.py run_analysis_worker`). Delays in seconds.
+ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', '4'))
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', '3'))
+ANALYSIS_JOB_RETRY_BASE_DELAY = float(os.getenv('ANALYSIS_JOB_RETRY_BASE_DELAY', '5'))
+ANALYSIS_JOB_RETRY_MAX_DELAY = float(os.getenv('ANALYSIS_JOB_RETRY_MAX_DELAY', '300'))
+ANALYSIS_JOB_LEASE = int(os.getenv('ANALYSIS_JOB_LEASE', '300'))
+# Long-poll cap for the status endpoint; each waiting client holds a sync worker, so keep it short
+ANALYSIS_JOB_MAX_WAIT = int(os.getenv('ANALYSIS_JOB_MAX_WAIT', '5'))
+
+# Request instrumentation (analyzer.metrics): phase histograms and query counts served at /metrics
+# (Prometheus text format; only once METRICS_TOKEN is set, to "Authorization: Bearer <METRICS_TOKEN>"),
+# Server-Timing response headers (staff users, or everyone with DEBUG on), and cProfile
+# dumps of a sampled fraction of requests.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', '1') == '1'
+METRICS_PROFILE_RATE = float(os.getenv('METRICS_PROFILE_RATE', '0'))  # e.g. 0.01 profiles 1% of requests
+METRICS_PROFILE_DIR = os.getenv('METRICS_PROFILE_DIR', str(BASE_DIR / 'profiles'))
+
+# Per-user limits on the analysis endpoints (analyzer.ratelimit), shared by the worker
+# processes of one host through a small SQLite file. Exceeding either returns 429.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', str(BASE_DIR / 'ratelimit.sqlite3'))
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', '30'))  # token bucket refill rate; 0 turns the limiter off
+if RATE_LIMIT_PER_MINUTE < 0:
+    raise ImproperlyConfigured("RATE_LIMIT_PER_MINUTE must be 0 (off) or a positive rate.")
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '10'))  # bucket size
+RATE_LIMIT_MAX_IN_FLIGHT = int(os.getenv('RATE_LIMIT_MAX_IN_FLIGHT', '4'))
+RATE_LIMIT_LEASE = int(os.getenv('RATE_LIMIT_LEASE', '300'))  # in-flight slots of crashed workers expire
+
+# Document uploads: limits enforced while extracting text (analyzer.extractors)
+DOCX_MAX_UNCOMPRESSED_BYTES = int(os.getenv('DOCX_MAX_UNCOMPRESSED_BYTES', str(50 * 1024 * 1024)))
+DOCX_MAX_PARAGRAPHS = int(os.getenv('DOCX_MAX_PARAGRAPHS', '20000'))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '400'))
+PDF_TIME_LIMIT = float(os.getenv('PDF_TIME_LIMIT', '30'))  # seconds per document
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(min(8, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '16'))  # smaller PDFs are read in-process
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '8'))
+
+# History listing: keyset-paginated pages (?limit= is capped at the max)
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '200'))
+
+# Wallet balance reads are cached per user and invalidated when the ledger changes;
+# 0 reads the database every time (the default unless the cache is shared, see CACHES)
+WALLET_CACHE_TTL = int(os.getenv('WALLET_CACHE_TTL', '300' if SHARED_CACHE else '0'))
+
+# Daraja (M-Pesa) API client (payments.daraja); credentials stay in MPESA_* env vars
+MPESA_BASE_URL = os.getenv('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
+MPESA_TIMEOUT = float(os.getenv('MPESA_TIMEOUT', '30'))
+MPESA_TOKEN_SKEW = float(os.getenv('MPESA_TOKEN_SKEW', '60'))  # refresh this many seconds before expiry
+MPESA_POOL_SIZE = int(os.getenv('MPESA_POOL_SIZE', '20'))
+MPESA_RETRIES = int(os.getenv('MPESA_RETRIES', '2'))
+MPESA_CALLBACK_UNKNOWN_GRACE = int(os.getenv('MPESA_CALLBACK_UNKNOWN_GRACE', '300'))  # wait this long for an unknown CheckoutRequestID
+MPESA_CALLBACK_MAX_ATTEMPTS = int(os.getenv('MPESA_CALLBACK_MAX_ATTEMPTS', '5'))  # failures and deferrals of unknown ids; at least 2
+MPESA_RECONCILE_AFTER = int(os.getenv('MPESA_RECONCILE_AFTER', '120'))  # seconds a payment may stay PENDING before it is queried
+MPESA_RECONCILE_BATCH = int(os.getenv('MPESA_RECONCILE_BATCH', '50'))
+MPESA_RECONCILE_CONCURRENCY = int(os.getenv('MPESA_RECONCILE_CONCURRENCY', '5'))
+MPESA_STATUS_MAX_WAIT = int(os.getenv('MPESA_STATUS_MAX_WAIT', '5'))  # long-poll cap for the payment status endpoint; holds a sync worker
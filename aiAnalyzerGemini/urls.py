@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from analyzer.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/', include('analyzer.urls')),
     path('api/', include('payments.urls')),
 ]
@@ -5,6 +5,16 @@ from .models import History
 class HistoryAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "ai_probability", "created_at")
     list_filter = ("user", "created_at")
-    search_fields = ("user__username", "reasoning", "essay_text")
+    # Essay bodies are stored compressed (EssayBlob), so they can't be searched in SQL
+    search_fields = ("user__username", "reasoning")
+    exclude = ("essay",)
+    readonly_fields = ("essay_text",)
+
+    # Rows are analysis records (and the essay lives in a shared EssayBlob): view and delete only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 # Register your models here.
@@ -0,0 +1,329 @@
+# analyzer/analysis.py
+
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from .cache import cache_key, result_cache
+from .chunking import chunk_essay
+from .gemini import get_client
+from .metrics import span
+from .scheduler import INTERACTIVE
+from .stylometry import prescreen
+from .tokens import estimate_tokens, fit_to_budget
+
+# Bump whenever PROMPT_TEMPLATE changes so cached results from the old prompt are ignored.
+PROMPT_VERSION = 1
+
+# This is the crucial part: The prompt engineering.
+# We ask the model to act as an expert and analyze the text based on specific criteria.
+PROMPT_TEMPLATE = """
+            Analyze the following essay to determine the likelihood that it was written by an AI.
+            Provide your response as a JSON object with two keys: 'ai_probability' and 'reasoning'.
+            - 'ai_probability': A float value between 0.0 (definitely human) and 1.0 (definitely AI).
+            - 'reasoning': A brief explanation for your score, considering factors like perplexity (predictability of text), burstiness (variation in sentence structure), and linguistic patterns.
+
+            Essay to analyze:
+            ---
+            {essay_text}
+            ---
+            """
+
+
+_TEMPLATE_TOKENS = estimate_tokens(PROMPT_TEMPLATE.format(essay_text=''))
+
+
+def build_prompt(essay_text: str) -> str:
+    return PROMPT_TEMPLATE.format(essay_text=essay_text)
+
+
+def prepare_prompt(essay_text: str) -> tuple[str, bool]:
+    """
+    Build the prompt within ANALYSIS_MAX_PROMPT_TOKENS, sampling the head, middle and
+    tail of essays that would exceed it. Returns (prompt, truncated).
+    """
+    essay_budget = max(1, settings.ANALYSIS_MAX_PROMPT_TOKENS - _TEMPLATE_TOKENS)
+    text, truncated = fit_to_budget(essay_text, essay_budget)
+    return build_prompt(text), truncated
+
+
+def usage_of(response, prompt: str, reply_text: str, truncated: bool) -> dict:
+    """Token usage of one Gemini call, from usage_metadata when the API reports it."""
+    meta = getattr(response, 'usage_metadata', None)
+    return {
+        "model": settings.GEMINI_MODEL,
+        "prompt_tokens": getattr(meta, 'prompt_token_count', 0) or estimate_tokens(prompt),
+        "response_tokens": getattr(meta, 'candidates_token_count', 0) or estimate_tokens(reply_text),
+        "truncated": truncated,
+    }
+
+
+def no_usage(result: dict) -> dict:
+    """`result` with the usage of an answer that made no Gemini call (cache hit or local pre-screen)."""
+    return {**result, "usage": {"model": "", "prompt_tokens": 0, "response_tokens": 0, "truncated": False}}
+
+
+def history_fields(analysis_result: dict) -> dict:
+    """History model fields for an analysis result (cache hits and local scores cost no tokens)."""
+    usage = analysis_result.get("usage") or {}
+    return {
+        "ai_probability": analysis_result["ai_probability"],
+        "reasoning": analysis_result["reasoning"],
+        "scored_locally": analysis_result.get("scored_locally", False),
+        "model_name": usage.get("model", ""),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "response_tokens": usage.get("response_tokens", 0),
+        "prompt_truncated": usage.get("truncated", False),
+    }
+
+
+def parse_analysis(text: str) -> dict:
+    """Parse the model's reply into {'ai_probability': float, 'reasoning': str}."""
+    # The API returns a response that may contain markdown for JSON.
+    # We need to clean it up to parse it correctly.
+    # Example response text: ```json\n{"key": "value"}\n```
+    cleaned_json_str = text.replace('```json', '').replace('```', '').strip()
+    data = json.loads(cleaned_json_str)
+    return {
+        "ai_probability": float(data.get("ai_probability", 0.0)),
+        "reasoning": str(data.get("reasoning", "")),
+    }
+
+
+def generate_analysis(essay_text: str, priority: int = INTERACTIVE) -> dict:
+    """Call Gemini for essay_text at the given scheduler priority; always goes to the network."""
+    with span('prompt'):
+        prompt, truncated = prepare_prompt(essay_text)
+    with span('gemini'):
+        response = get_client().generate(prompt, priority=priority)
+    with span('parse'):
+        result = parse_analysis(response.text)
+    result["usage"] = usage_of(response, prompt, response.text, truncated)
+    return result
+
+
+def analyze_essay(essay_text: str, screen: bool = True, priority: int = INTERACTIVE) -> tuple[dict, bool]:
+    """
+    Return (analysis_result, cached) for essay_text.
+    Essays the local stylometric pre-screen can decide are answered without Gemini
+    (analysis_result then has "scored_locally": True; pass screen=False to skip it).
+    Identical essays (after whitespace normalization) are served from the result
+    cache for the current model and prompt version without calling Gemini.
+    Batch and background callers pass a lower scheduler `priority` (analyzer.scheduler).
+    """
+    if screen:
+        with span('prescreen'):
+            local = prescreen(essay_text)
+        if local is not None:
+            return no_usage(local), False
+    key = cache_key(essay_text, settings.GEMINI_MODEL, PROMPT_VERSION)
+    with span('cache'):
+        result = result_cache.get(key)
+    if result is not None:
+        return no_usage(result), True
+    result = generate_analysis(essay_text, priority)
+    result_cache.set(key, result, model_name=settings.GEMINI_MODEL, prompt_version=PROMPT_VERSION)
+    return result, False
+
+
+_REASONING_START_RE = re.compile(r'"reasoning"\s*:\s*"')
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class ReasoningExtractor:
+    """
+    Incrementally pulls the decoded value of the "reasoning" key out of a JSON
+    reply that arrives in arbitrary chunks, so it can be forwarded as it streams.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = None  # index of the next undecoded char of the reasoning string
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """Add raw model output; return any newly decoded reasoning text."""
+        self.buffer += chunk
+        if self.done:
+            return ''
+        if self.pos is None:
+            match = _REASONING_START_RE.search(self.buffer)
+            if not match:
+                return ''
+            self.pos = match.end()
+
+        out = []
+        buf, i = self.buffer, self.pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != '\\':
+                out.append(ch)
+                i += 1
+                continue
+            # Escape sequence: wait for the rest of it if the chunk ended mid-way
+            if i + 1 >= len(buf):
+                break
+            code = buf[i + 1]
+            if code == 'u':
+                if i + 6 > len(buf):
+                    break
+                cp = int(buf[i + 2:i + 6], 16)
+                if 0xD800 <= cp < 0xDC00:
+                    # High surrogate: decode together with the low half that follows
+                    if i + 12 > len(buf):
+                        break
+                    low = int(buf[i + 8:i + 12], 16) if buf[i + 6:i + 8] == '\\u' else 0
+                    if 0xDC00 <= low < 0xE000:
+                        out.append(chr(0x10000 + ((cp - 0xD800) << 10) + (low - 0xDC00)))
+                        i += 12
+                        continue
+                out.append(chr(cp))
+                i += 6
+            else:
+                out.append(_JSON_ESCAPES.get(code, code))
+                i += 2
+        self.pos = i
+        return ''.join(out)
+
+
+def stream_analysis(essay_text: str):
+    """
+    Generator version of analyze_essay() built on Gemini's streaming API.
+    Yields ("reasoning", text) as reasoning tokens arrive, then exactly one
+    ("result", (analysis_result, cached)) once the full reply has been parsed.
+    """
+    result = prescreen(essay_text)
+    if result is not None:
+        yield "reasoning", result["reasoning"]
+        yield "result", (no_usage(result), False)
+        return
+
+    key = cache_key(essay_text, settings.GEMINI_MODEL, PROMPT_VERSION)
+    result = result_cache.get(key)
+    if result is not None:
+        yield "reasoning", result["reasoning"]
+        yield "result", (no_usage(result), True)
+        return
+
+    with span('prompt'):
+        prompt, truncated = prepare_prompt(essay_text)
+    extractor = ReasoningExtractor()
+    chunk = None
+    # Times establishing the stream; reading it is paced by the client
+    with span('gemini'):
+        stream = get_client().generate(prompt, stream=True)
+    for chunk in stream:
+        delta = extractor.feed(chunk.text)
+        if delta:
+            yield "reasoning", delta
+    result = parse_analysis(extractor.buffer)
+    # The last streamed chunk carries the usage totals
+    result["usage"] = usage_of(chunk, prompt, extractor.buffer, truncated)
+    result_cache.set(key, result, model_name=settings.GEMINI_MODEL, prompt_version=PROMPT_VERSION)
+    yield "result", (result, False)
+
+
+def analyze_many(essays, max_workers: int, screen: bool = True, priority: int = INTERACTIVE) -> list:
+    """
+    Run analyze_essay() over essays with at most max_workers Gemini calls in flight.
+    Returns one entry per essay, in order: (analysis_result, cached) or the exception raised.
+    """
+    def run(essay_text):
+        try:
+            return analyze_essay(essay_text, screen=screen, priority=priority)
+        except Exception as e:
+            return e
+        finally:
+            # Pool threads open their own DB connection for cache lookups
+            connection.close()
+
+    if not essays:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(essays)))) as pool:
+        return list(pool.map(run, essays))
+
+
+def analyze_essay_chunked(essay_text: str, priority: int = INTERACTIVE) -> tuple[dict, bool, list]:
+    """
+    Analyze a long essay as paragraph-aligned segments of at most ANALYSIS_CHUNK_MAX_CHARS,
+    all in parallel, so wall-clock time is bounded by the slowest segment.
+    Returns (analysis_result, cached, breakdown): the overall ai_probability is the
+    length-weighted mean of the segment scores; breakdown lists each segment's score.
+    """
+    chunks = chunk_essay(essay_text, settings.ANALYSIS_CHUNK_MAX_CHARS)
+    if len(chunks) <= 1:
+        analysis_result, cached = analyze_essay(essay_text, priority=priority)
+        return analysis_result, cached, []
+
+    # Pre-screen the essay as a whole; a short trailing segment on its own says little
+    local = prescreen(essay_text)
+    if local is not None:
+        return no_usage(local), False, []
+
+    outcomes = analyze_many([c["text"] for c in chunks], settings.ANALYSIS_CHUNK_CONCURRENCY, screen=False, priority=priority)
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            raise outcome
+
+    breakdown = [
+        {
+            "paragraphs": chunk["paragraphs"],
+            "chars": len(chunk["text"]),
+            "ai_probability": result["ai_probability"],
+            "reasoning": result["reasoning"],
+        }
+        for chunk, (result, _) in zip(chunks, outcomes)
+    ]
+    total_chars = sum(item["chars"] for item in breakdown)
+    probability = sum(item["ai_probability"] * item["chars"] for item in breakdown) / total_chars
+    top = max(range(len(breakdown)), key=lambda i: breakdown[i]["ai_probability"])
+    reasoning = (
+        f"Length-weighted average over {len(breakdown)} segments. "
+        f"Highest-scoring segment (#{top + 1}, paragraphs {breakdown[top]['paragraphs'][0] + 1}-"
+        f"{breakdown[top]['paragraphs'][1] + 1}, {breakdown[top]['ai_probability']:.2f}): {breakdown[top]['reasoning']}"
+    )
+    cached = all(c for _, c in outcomes)
+    usages = [result["usage"] for result, _ in outcomes if result["usage"]["model"]]
+    analysis_result = {"ai_probability": probability, "reasoning": reasoning}
+    if not usages:
+        return no_usage(analysis_result), cached, breakdown
+    analysis_result["usage"] = {
+        "model": settings.GEMINI_MODEL,
+        "prompt_tokens": sum(u["prompt_tokens"] for u in usages),
+        "response_tokens": sum(u["response_tokens"] for u in usages),
+        "truncated": any(u["truncated"] for u in usages),
+    }
+    return analysis_result, cached, breakdown
+
+
+async def generate_analysis_async(essay_text: str) -> dict:
+    """Async twin of generate_analysis(); awaits the SDK's async generation API."""
+    with span('prompt'):
+        prompt, truncated = prepare_prompt(essay_text)
+    with span('gemini'):
+        response = await get_client().generate_async(prompt)
+    with span('parse'):
+        result = parse_analysis(response.text)
+    result["usage"] = usage_of(response, prompt, response.text, truncated)
+    return result
+
+
+async def analyze_essay_async(essay_text: str) -> tuple[dict, bool]:
+    """Async twin of analyze_essay()."""
+    with span('prescreen'):
+        local = prescreen(essay_text)
+    if local is not None:
+        return no_usage(local), False
+    key = cache_key(essay_text, settings.GEMINI_MODEL, PROMPT_VERSION)
+    with span('cache'):
+        result = await result_cache.aget(key)
+    if result is not None:
+        return no_usage(result), True
+    result = await generate_analysis_async(essay_text)
+    await result_cache.aset(key, result, model_name=settings.GEMINI_MODEL, prompt_version=PROMPT_VERSION)
+    return result, False
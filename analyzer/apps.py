@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analyzer'
+
+    def ready(self):
+        # Connect the token cache invalidation signals in every process, not just on first authentication
+        from . import authentication  # noqa: F401
+        from . import metrics
+        metrics.install()
@@ -0,0 +1,115 @@
+# analyzer/authentication.py
+"""
+Token authentication with an in-process token -> user cache.
+
+DRF's TokenAuthentication joins authtoken_token and auth_user on every
+request. CachedTokenAuthentication keeps recent lookups in a bounded LRU with
+TTL (AUTH_TOKEN_CACHE_MAXSIZE / AUTH_TOKEN_CACHE_TTL), so a polling client
+costs no query once its token is cached.
+
+Entries hold field values, not model instances: every request gets a user and
+token built from them (Model.from_db), so attributes and related objects a
+request loads (user.wallet, ...) never reach another request.
+
+Entries are dropped when the token is deleted (logout) and whenever the user
+is saved (deactivation, password or permission changes). The cache is per
+process: another worker may honour a revoked token for up to the TTL.
+"""
+
+import threading
+from cachetools import TTLCache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def _snapshot(instance) -> tuple:
+    """(database alias, concrete field values) of a model instance."""
+    return instance._state.db, tuple(getattr(instance, field.attname) for field in instance._meta.concrete_fields)
+
+
+def _rebuild(model, snapshot):
+    db, values = snapshot
+    return model.from_db(db, [field.attname for field in model._meta.concrete_fields], values)
+
+
+class TokenUserCache:
+    def __init__(self, maxsize: int, ttl: int):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        user_id, user_snapshot, token_snapshot = entry
+        user = _rebuild(get_user_model(), user_snapshot)
+        token = _rebuild(Token, token_snapshot)
+        token.user = user
+        return user, token
+
+    def set(self, key: str, user, token) -> None:
+        entry = (user.pk, _snapshot(user), _snapshot(token))
+        with self._lock:
+            self._entries[key] = entry
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_user(self, user_id) -> None:
+        with self._lock:
+            keys = [key for key, (cached_user_id, _, _) in self._entries.items() if cached_user_id == user_id]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "maxsize": self._entries.maxsize,
+            }
+
+
+token_cache = TokenUserCache(maxsize=settings.AUTH_TOKEN_CACHE_MAXSIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        # Raises AuthenticationFailed for unknown tokens and inactive users; those are never cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
+
+
+@receiver(post_delete, sender=Token)
+def _token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def _user_saved(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
@@ -0,0 +1,68 @@
+# analyzer/bench.py
+"""
+Helpers shared by the offline benchmark management commands.
+Nothing here is imported by the request path.
+"""
+
+import logging
+import os
+import statistics
+import tempfile
+from contextlib import contextmanager
+from django.conf import settings
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextmanager
+def isolated_database():
+    """
+    Run a benchmark against a throwaway on-disk copy of the schema instead of db.sqlite3.
+    An on-disk file (rather than Django's shared in-memory test DB) keeps SQLite's
+    locking behaviour realistic when several threads write at once.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db = settings.DATABASES['default']
+        old_test = dict(db.get('TEST', {}))
+        if db['ENGINE'] == 'django.db.backends.sqlite3':
+            db['TEST'] = {**old_test, 'NAME': os.path.join(tmp, 'bench.sqlite3')}
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            db['TEST'] = old_test
+
+
+@contextmanager
+def quiet_loggers(*names):
+    """Silence loggers that would print a line per expected failure (counted by the benchmark instead)."""
+    loggers = [logging.getLogger(name) for name in names]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed: float, errors: int = 0) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(values) * 1000, 1) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+    }
@@ -0,0 +1,141 @@
+# analyzer/cache.py
+
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from datetime import timedelta
+from cachetools import TTLCache
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from .models import CachedAnalysis
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_essay(essay_text: str) -> str:
+    """Canonical form used for hashing: NFC, whitespace runs collapsed, trimmed."""
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFC', essay_text)).strip()
+
+
+def cache_key(essay_text: str, model_name: str, prompt_version) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{model_name}\x00{prompt_version}\x00".encode())
+    digest.update(normalize_essay(essay_text).encode())
+    return digest.hexdigest()
+
+
+class AnalysisResultCache:
+    """
+    Two-tier cache for analysis results:
+    - an in-process LRU with TTL (per worker, microseconds)
+    - the CachedAnalysis table (shared by all workers, survives restarts)
+    Keys already include the model name and prompt version, so bumping either
+    simply stops matching the old entries.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, db_ttl: int):
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.db_ttl = db_ttl
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        result = self._get_local(key)
+        if result is None:
+            result = self._remember(key, self._db_entry(key).first())
+        return result
+
+    def set(self, key: str, result: dict, model_name: str, prompt_version) -> None:
+        row = self._row(result)
+        try:
+            CachedAnalysis.objects.update_or_create(
+                key=key,
+                defaults={**row, "model_name": model_name, "prompt_version": prompt_version},
+            )
+        except DatabaseError:
+            # The cache is best effort; never fail an analysis because the DB tier is busy
+            logger.warning("Could not store analysis cache entry %s", key[:12], exc_info=True)
+        with self._lock:
+            self._local[key] = row
+
+    async def aget(self, key: str):
+        """Async twin of get() using Django's async ORM API."""
+        result = self._get_local(key)
+        if result is None:
+            result = self._remember(key, await self._db_entry(key).afirst())
+        return result
+
+    async def aset(self, key: str, result: dict, model_name: str, prompt_version) -> None:
+        row = self._row(result)
+        try:
+            await CachedAnalysis.objects.aupdate_or_create(
+                key=key,
+                defaults={**row, "model_name": model_name, "prompt_version": prompt_version},
+            )
+        except DatabaseError:
+            logger.warning("Could not store analysis cache entry %s", key[:12], exc_info=True)
+        with self._lock:
+            self._local[key] = row
+
+    @staticmethod
+    def _row(result: dict) -> dict:
+        return {
+            "ai_probability": float(result["ai_probability"]),
+            "reasoning": str(result["reasoning"]),
+        }
+
+    def _get_local(self, key: str):
+        with self._lock:
+            result = self._local.get(key)
+            if result is not None:
+                self.memory_hits += 1
+                return dict(result)
+        return None
+
+    def _db_entry(self, key: str):
+        entries = CachedAnalysis.objects.filter(key=key)
+        if self.db_ttl > 0:
+            entries = entries.filter(updated_at__gte=timezone.now() - timedelta(seconds=self.db_ttl))
+        return entries.values("ai_probability", "reasoning")
+
+    def _remember(self, key: str, row):
+        """Count a DB-tier lookup and promote a hit into the in-process tier."""
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+            self._local[key] = row
+        return dict(row)
+
+    def clear(self) -> None:
+        """Drop the in-process tier (the DB tier is left alone)."""
+        with self._lock:
+            self._local.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / total if total else 0.0,
+                "memory_size": len(self._local),
+                "memory_maxsize": self._local.maxsize,
+            }
+
+
+result_cache = AnalysisResultCache(
+    maxsize=settings.ANALYSIS_CACHE_MAXSIZE,
+    ttl=settings.ANALYSIS_CACHE_TTL,
+    db_ttl=settings.ANALYSIS_CACHE_DB_TTL,
+)
@@ -0,0 +1,59 @@
+# analyzer/chunking.py
+
+import re
+
+_PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_paragraphs(text: str) -> list[str]:
+    """Split on blank lines, the separator UploadDocxView._extract_docx_text emits."""
+    return [p.strip() for p in _PARAGRAPH_BREAK_RE.split(text) if p.strip()]
+
+
+def _split_long_paragraph(paragraph: str, max_chars: int) -> list[str]:
+    """Break a paragraph longer than max_chars at sentence ends (hard cut as a last resort)."""
+    pieces, current = [], ''
+    for sentence in _SENTENCE_END_RE.split(paragraph):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_essay(text: str, max_chars: int) -> list[dict]:
+    """
+    Group consecutive paragraphs into segments of at most max_chars characters.
+    Returns [{"text": ..., "paragraphs": [first, last]}] with 0-based paragraph indexes.
+    """
+    chunks = []
+    current, first = [], None
+
+    def flush(last):
+        if current:
+            chunks.append({"text": '\n\n'.join(current), "paragraphs": [first, last]})
+            current.clear()
+
+    for index, paragraph in enumerate(split_paragraphs(text)):
+        if len(paragraph) > max_chars:
+            flush(index - 1)
+            for piece in _split_long_paragraph(paragraph, max_chars):
+                chunks.append({"text": piece, "paragraphs": [index, index]})
+            continue
+        if current and sum(len(p) + 2 for p in current) + len(paragraph) > max_chars:
+            flush(index - 1)
+        if not current:
+            first = index
+        current.append(paragraph)
+    flush(first + len(current) - 1 if current else None)
+    return chunks
@@ -0,0 +1,291 @@
+# analyzer/extractors.py
+"""
+Plain-text extraction from uploaded documents.
+
+Output format: one paragraph per block, separated by a blank line ('\n\n'),
+which is what the chunked analysis mode splits on.
+"""
+
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from zipfile import BadZipFile, ZipFile
+import fitz  # PyMuPDF
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .metrics import span
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_HEADER_RE = re.compile(r'word/header\d*\.xml$')
+_NOTE_PARTS = ('word/footnotes.xml', 'word/endnotes.xml')
+
+
+class ExtractionError(ValueError):
+    """The document is malformed or exceeds the configured extraction limits."""
+
+
+class _ParagraphLimit:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.count = 0
+
+    def add(self, parts: list, text: str) -> None:
+        self.count += 1
+        if self.count > self.limit:
+            raise ExtractionError(f"Document has more than {self.limit} paragraphs.")
+        parts.append(text)
+
+
+def _iter_blocks(xml_file):
+    """
+    Stream a WordprocessingML part with iterparse and yield the text of each
+    paragraph, or one line per table row (cells joined by ' | '; nested tables
+    are flattened into their cell). Every finished paragraph/table is cleared
+    and detached from its parent, so memory stays proportional to the block
+    being read rather than the whole part.
+    """
+    stack = []
+    table_depth = 0
+    row, cell = [], []
+    for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            if elem.tag == W + 'tbl':
+                table_depth += 1
+            continue
+
+        stack.pop()
+        tag = elem.tag
+        if tag == W + 'p':
+            text = ''.join(t.text for t in elem.iter(W + 't') if t.text)
+            if table_depth:
+                if text:
+                    cell.append(text)
+                elem.clear()
+                continue
+            if text:
+                yield text
+        elif tag == W + 'tc' and table_depth == 1:
+            row.append(' '.join(cell).strip())
+            cell = []
+            continue
+        elif tag == W + 'tr' and table_depth == 1:
+            line = ' | '.join(row)
+            row = []
+            if line.strip(' |'):
+                yield line
+            continue
+        elif tag == W + 'tbl':
+            table_depth -= 1
+            if table_depth:
+                continue
+        else:
+            continue
+        # Finished a top-level paragraph or table: drop it from the partially built tree
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def _open_checked(zf: ZipFile, name: str, budget: list):
+    """Open a part after charging its declared size against the decompression budget."""
+    info = zf.getinfo(name)
+    budget[0] -= info.file_size
+    if budget[0] < 0:
+        raise ExtractionError(
+            f"Document expands beyond {settings.DOCX_MAX_UNCOMPRESSED_BYTES // (1024 * 1024)} MB of text parts."
+        )
+    # ZipExtFile stops at the declared size, so the charge above bounds what we read
+    return zf.open(info)
+
+
+def extract_docx_text(fileobj) -> str:
+    """
+    Extract text from a .docx given a seekable binary file object (e.g. the
+    uploaded file itself, which Django spools to disk when it is large).
+    Headers come first (each distinct one once), then the body including tables,
+    then footnotes and endnotes. Embedded media is never decompressed.
+    """
+    budget = [settings.DOCX_MAX_UNCOMPRESSED_BYTES]
+    limit = _ParagraphLimit(settings.DOCX_MAX_PARAGRAPHS)
+    parts = []
+    try:
+        with ZipFile(fileobj) as zf:
+            names = zf.namelist()
+            if 'word/document.xml' not in names:
+                raise ExtractionError("Not a Word document (word/document.xml is missing).")
+
+            seen_headers = set()
+            for name in sorted(n for n in names if _HEADER_RE.match(n)):
+                with _open_checked(zf, name, budget) as part:
+                    for text in _iter_blocks(part):
+                        if text not in seen_headers:
+                            seen_headers.add(text)
+                            limit.add(parts, text)
+
+            with _open_checked(zf, 'word/document.xml', budget) as part:
+                for text in _iter_blocks(part):
+                    limit.add(parts, text)
+
+            for name in _NOTE_PARTS:
+                if name in names:
+                    with _open_checked(zf, name, budget) as part:
+                        for text in _iter_blocks(part):
+                            limit.add(parts, text)
+    except BadZipFile as e:
+        raise ExtractionError(f"Not a valid .docx file: {e}") from e
+    except ET.ParseError as e:
+        raise ExtractionError(f"Malformed document XML: {e}") from e
+    return '\n\n'.join(parts).strip()
+
+
+# --- PDF -----------------------------------------------------------------------
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _pdf_page_paragraphs(page) -> list:
+    """Text blocks of one page in reading order, each block's lines joined into a paragraph."""
+    paragraphs = []
+    for block in page.get_text('blocks', flags=fitz.TEXTFLAGS_BLOCKS | fitz.TEXT_DEHYPHENATE, sort=True):
+        if block[6] != 0:  # image block
+            continue
+        text = _WHITESPACE_RE.sub(' ', block[4]).strip()
+        if text:
+            paragraphs.append(text)
+    return paragraphs
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int, deadline: float) -> list:
+    """Worker: paragraphs of pages [start, stop). Gives up (returns None) once the wall-clock deadline passes."""
+    paragraphs = []
+    with fitz.open(path) as doc:
+        for number in range(start, stop):
+            if time.time() > deadline:
+                return None
+            paragraphs.extend(_pdf_page_paragraphs(doc[number]))
+    return paragraphs
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    # Spawned (not forked) workers: the web process holds threads and gRPC channels
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pdf_pool
+
+
+def _discard_pdf_pool() -> None:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pool = None
+
+
+@receiver(setting_changed)
+def _reset_pdf_pool(setting, **kwargs):
+    if setting == 'PDF_WORKERS':
+        _discard_pdf_pool()
+
+
+@contextmanager
+def _local_path(fileobj, suffix: str):
+    """A filesystem path for the upload: Django's temp file when it has one, else a spooled copy."""
+    if hasattr(fileobj, 'temporary_file_path'):
+        yield fileobj.temporary_file_path()
+        return
+    fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        shutil.copyfileobj(fileobj, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def _page_ranges(page_count: int, per_task: int) -> list:
+    return [(start, min(start + per_task, page_count)) for start in range(0, page_count, per_task)]
+
+
+def _extract_pdf_parallel(path: str, page_count: int, deadline: float) -> list:
+    """Fan page ranges out to the process pool; results are stitched back in page order."""
+    # Enough ranges to keep every worker busy, but not so many that per-task open() dominates
+    per_task = max(settings.PDF_PAGES_PER_TASK, math.ceil(page_count / (settings.PDF_WORKERS * 4)))
+    try:
+        pool = _get_pdf_pool()
+        futures = [pool.submit(_extract_pdf_pages, path, start, stop, deadline)
+                   for start, stop in _page_ranges(page_count, per_task)]
+        _, pending = wait(futures, timeout=max(0.0, deadline - time.time()) + 1.0, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        paragraphs = []
+        for future in futures:
+            chunk = None if future in pending else future.result()
+            if chunk is None:
+                raise ExtractionError(f"PDF extraction exceeded {settings.PDF_TIME_LIMIT:g}s.")
+            paragraphs.extend(chunk)
+        return paragraphs
+    except BrokenProcessPool as e:
+        # A worker crashed (e.g. a hostile file); start a fresh pool next time
+        _discard_pdf_pool()
+        raise ExtractionError("PDF extraction failed.") from e
+    except (fitz.FileDataError, RuntimeError) as e:
+        raise ExtractionError(f"Not a valid PDF file: {e}") from e
+
+
+def extract_pdf_text(fileobj) -> str:
+    """
+    Extract text from a PDF, one paragraph per text block in reading order.
+    Documents longer than PDF_PARALLEL_MIN_PAGES are split into page ranges that
+    are extracted concurrently in a process pool. PDF_MAX_PAGES caps the page
+    count and PDF_TIME_LIMIT the wall-clock time for the whole document.
+    """
+    deadline = time.time() + settings.PDF_TIME_LIMIT
+    with _local_path(fileobj, '.pdf') as path:
+        try:
+            with fitz.open(path, filetype='pdf') as doc:
+                if doc.needs_pass:
+                    raise ExtractionError("Password-protected PDFs are not supported.")
+                page_count = doc.page_count
+                if page_count > settings.PDF_MAX_PAGES:
+                    raise ExtractionError(f"Document has more than {settings.PDF_MAX_PAGES} pages.")
+                if page_count < settings.PDF_PARALLEL_MIN_PAGES or settings.PDF_WORKERS < 2:
+                    paragraphs = []
+                    for page in doc:
+                        if time.time() > deadline:
+                            raise ExtractionError(f"PDF extraction exceeded {settings.PDF_TIME_LIMIT:g}s.")
+                        paragraphs.extend(_pdf_page_paragraphs(page))
+                    return '\n\n'.join(paragraphs).strip()
+        except (fitz.FileDataError, RuntimeError) as e:
+            raise ExtractionError(f"Not a valid PDF file: {e}") from e
+        return '\n\n'.join(_extract_pdf_parallel(path, page_count, deadline)).strip()
+
+
+EXTRACTORS = {
+    '.docx': extract_docx_text,
+    '.pdf': extract_pdf_text,
+}
+
+
+def extract_upload_text(upload) -> str:
+    """Dispatch an uploaded file to the extractor for its extension; raises ExtractionError."""
+    extension = os.path.splitext(getattr(upload, 'name', '') or '')[1].lower()
+    if extension not in EXTRACTORS:
+        raise ExtractionError(f"Unsupported file type; expected one of {', '.join(EXTRACTORS)}.")
+    with span(f'extract.{extension[1:]}'):
+        return EXTRACTORS[extension](upload)
@@ -0,0 +1,412 @@
+# analyzer/gemini.py
+"""
+Shared Gemini client used by every analysis path.
+
+- Model objects are created once per model name and reused (the SDK keeps its
+  gRPC channel alive between calls).
+- Every call gets a deadline (GEMINI_TIMEOUT); retryable errors are retried up to
+  GEMINI_MAX_RETRIES times with jittered exponential backoff.
+- A circuit breaker opens after GEMINI_BREAKER_THRESHOLD consecutive failures and
+  rejects calls with GeminiUnavailable for GEMINI_BREAKER_RESET seconds, so workers
+  fail fast instead of queuing behind a degraded API.
+- Calls are leased from a GeminiScheduler (analyzer.scheduler): AIMD concurrency,
+  rotation across GEMINI_API_KEYS, interactive before batch before background.
+  A 429 cools the key down and is retried at once on the next available key; it
+  does not count towards the circuit breaker. The scheduler is per process; key
+  quotas and cooldowns are shared across processes (GEMINI_KEY_STATE_DB).
+- GEMINI_BACKEND='fake' swaps the network for FakeBackend (configurable latency,
+  failure rate and per-key capacity) for offline tests and benchmarks.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import client as genai_client
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from .metrics import span
+from .scheduler import FAILED, INTERACTIVE, OK, THROTTLED, GeminiScheduler, KeySlot, Lease, QueueTimeout, SharedKeyState
+from .tokens import estimate_tokens
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.TooManyRequests,  # 429 / RESOURCE_EXHAUSTED
+    google_exceptions.GatewayTimeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class GeminiUnavailable(Exception):
+    """Gemini is failing and the circuit breaker is open; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini is temporarily unavailable; retry in {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one trial call) -> closed."""
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self._opened_at >= self.reset_timeout else 'open'
+
+    def before_call(self) -> None:
+        """Raise GeminiUnavailable unless a call may go through now."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise GeminiUnavailable(max(remaining, 1.0))
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """The call ended without telling us anything about Gemini's health: free the half-open trial only."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class GoogleBackend:
+    """Real Gemini API for one API key, one long-lived GenerativeModel per model name."""
+
+    def __init__(self, api_key):
+        # A client manager of our own: genai.configure() would switch the key for the whole process
+        self._clients = genai_client._ClientManager()
+        self._clients.configure(api_key=api_key)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, model_name: str):
+        with self._lock:
+            if model_name not in self._models:
+                model = genai.GenerativeModel(model_name)
+                model._client = self._clients.get_default_client('generative')
+                self._models[model_name] = model
+            return self._models[model_name]
+
+    def generate(self, model_name: str, prompt: str, timeout: float, stream: bool = False):
+        return self.model(model_name).generate_content(prompt, stream=stream, request_options={'timeout': timeout})
+
+    async def generate_async(self, model_name: str, prompt: str, timeout: float):
+        model = self.model(model_name)
+        if model._async_client is None:
+            # Created on first use, inside the event loop it will run on
+            model._async_client = self._clients.get_default_client('generative_async')
+        return await model.generate_content_async(prompt, request_options={'timeout': timeout})
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage_metadata: FakeUsage = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeBackend:
+    """
+    Offline stand-in for GoogleBackend. Sleeps `latency` seconds (+/- `jitter`) and
+    fails with ServiceUnavailable at `failure_rate`. With `capacity`, calls beyond that
+    many in flight are rejected with TooManyRequests, like a key over its quota.
+    Replies are valid analysis JSON whose score is derived from the prompt, so
+    repeated prompts answer identically.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, failure_rate: float = 0.0,
+                 capacity: int = 0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.capacity = capacity
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.active = 0
+        self.throttled = 0
+
+    def _start(self) -> tuple[float, bool]:
+        with self._lock:
+            self.calls += 1
+            if self.capacity and self.active >= self.capacity:
+                self.throttled += 1
+                raise google_exceptions.TooManyRequests("fake backend: quota exceeded")
+            self.active += 1
+            fail = self._rng.random() < self.failure_rate
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        return delay, fail
+
+    def _finish(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+    @staticmethod
+    def _reply(prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode()).digest()
+        return json.dumps({
+            "ai_probability": round(digest[0] / 255, 2),
+            "reasoning": "Offline fake Gemini backend; this score is derived from a hash of the prompt.",
+        })
+
+    @staticmethod
+    def _usage(prompt: str, reply: str) -> FakeUsage:
+        return FakeUsage(estimate_tokens(prompt), estimate_tokens(reply))
+
+    def _chunks(self, prompt: str, delay: float):
+        # Stream in a handful of pieces, spreading the latency over them; usage rides on the last one
+        try:
+            text = self._reply(prompt)
+            pieces = [text[i:i + 24] for i in range(0, len(text), 24)]
+            for i, piece in enumerate(pieces):
+                time.sleep(delay / len(pieces))
+                yield FakeResponse(piece, self._usage(prompt, text) if i == len(pieces) - 1 else None)
+        finally:
+            self._finish()
+
+    def generate(self, model_name: str, prompt: str, timeout: float, stream: bool = False):
+        delay, fail = self._start()
+        if stream and not fail and delay <= timeout:
+            return self._chunks(prompt, delay)
+        try:
+            if delay > timeout:
+                time.sleep(timeout)
+                raise google_exceptions.DeadlineExceeded("fake backend: deadline exceeded")
+            time.sleep(delay)
+            if fail:
+                raise google_exceptions.ServiceUnavailable("fake backend: injected failure")
+            reply = self._reply(prompt)
+            return FakeResponse(reply, self._usage(prompt, reply))
+        finally:
+            self._finish()
+
+    async def generate_async(self, model_name: str, prompt: str, timeout: float):
+        delay, fail = self._start()
+        try:
+            if delay > timeout:
+                await asyncio.sleep(timeout)
+                raise google_exceptions.DeadlineExceeded("fake backend: deadline exceeded")
+            await asyncio.sleep(delay)
+            if fail:
+                raise google_exceptions.ServiceUnavailable("fake backend: injected failure")
+            reply = self._reply(prompt)
+            return FakeResponse(reply, self._usage(prompt, reply))
+        finally:
+            self._finish()
+
+
+class GeminiClient:
+    def __init__(self, scheduler: GeminiScheduler, timeout: float, max_retries: int, backoff: float,
+                 breaker: CircuitBreaker, queue_timeout: float = None):
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout
+
+    def _retry_delay(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _stream(self, response, lease: Lease):
+        """Hold the scheduler lease while the caller iterates a streamed response."""
+        outcome = FAILED
+        try:
+            yield from response
+            outcome = OK
+        except google_exceptions.TooManyRequests:
+            outcome = THROTTLED
+            raise
+        finally:
+            self.scheduler.release(lease, outcome)
+
+    def generate(self, prompt: str, model_name: str = None, stream: bool = False, priority: int = INTERACTIVE):
+        """
+        generate_content() with deadline, retries and circuit breaker, on a key leased
+        from the scheduler at `priority` (GeminiUnavailable if none frees up in time).
+        With stream=True only establishing the stream is retried; errors while
+        iterating it propagate to the caller.
+        """
+        model_name = model_name or settings.GEMINI_MODEL
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            try:
+                with span('gemini.queue'):
+                    lease = self.scheduler.acquire(priority, timeout=self.queue_timeout)
+            except QueueTimeout as e:
+                self.breaker.release_trial()
+                raise GeminiUnavailable(e.retry_after) from e
+            try:
+                response = lease.backend.generate(model_name, prompt, timeout=self.timeout, stream=stream)
+            except google_exceptions.TooManyRequests:
+                # Quota, not an outage: the key cools down and the next attempt goes to another one,
+                # or waits like any other retry when no other key is free
+                self.scheduler.release(lease, THROTTLED)
+                self.breaker.release_trial()
+                if attempt == self.max_retries:
+                    raise
+                if not self.scheduler.other_key_available(lease.key):
+                    time.sleep(self._retry_delay(attempt))
+                continue
+            except RETRYABLE_ERRORS:
+                self.scheduler.release(lease, FAILED)
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+            except Exception:
+                # Not Gemini being unhealthy (bad request, blocked prompt...): don't trip the breaker
+                self.scheduler.release(lease, FAILED)
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            if stream:
+                return self._stream(response, lease)
+            self.scheduler.release(lease, OK)
+            return response
+
+    async def generate_async(self, prompt: str, model_name: str = None, priority: int = INTERACTIVE):
+        """Async twin of generate() (no streaming)."""
+        model_name = model_name or settings.GEMINI_MODEL
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            try:
+                with span('gemini.queue'):
+                    lease = await self.scheduler.acquire_async(priority, timeout=self.queue_timeout)
+            except QueueTimeout as e:
+                self.breaker.release_trial()
+                raise GeminiUnavailable(e.retry_after) from e
+            try:
+                response = await lease.backend.generate_async(model_name, prompt, timeout=self.timeout)
+            except google_exceptions.TooManyRequests:
+                self.scheduler.release(lease, THROTTLED)
+                self.breaker.release_trial()
+                if attempt == self.max_retries:
+                    raise
+                if not self.scheduler.other_key_available(lease.key):
+                    await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            except RETRYABLE_ERRORS:
+                self.scheduler.release(lease, FAILED)
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            except BaseException:
+                # Includes cancellation of the awaiting request
+                self.scheduler.release(lease, FAILED)
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            self.scheduler.release(lease, OK)
+            return response
+
+
+def _key_name(api_key) -> str:
+    return f"...{api_key[-4:]}" if api_key else "default"
+
+
+def build_scheduler() -> GeminiScheduler:
+    """One KeySlot per GEMINI_API_KEYS entry (the fake backend gets one fake key per entry, at least one)."""
+    api_keys = settings.GEMINI_API_KEYS
+    key_state = None
+    if settings.GEMINI_BACKEND == 'fake':
+        keys = [
+            KeySlot(f"fake-{i}", FakeBackend(
+                latency=settings.GEMINI_FAKE_LATENCY,
+                jitter=settings.GEMINI_FAKE_JITTER,
+                failure_rate=settings.GEMINI_FAKE_FAILURE_RATE,
+                capacity=settings.GEMINI_FAKE_KEY_CAPACITY,
+            ))
+            for i in range(max(1, len(api_keys)))
+        ]
+    else:
+        # No key configured: the SDK falls back to GOOGLE_API_KEY / application default credentials
+        # The shared store knows keys by a digest, never by the key itself
+        keys = [
+            KeySlot(_key_name(api_key), GoogleBackend(api_key), ident=hashlib.sha256((api_key or '').encode()).hexdigest()[:16])
+            for api_key in api_keys or [None]
+        ]
+        if settings.GEMINI_KEY_STATE_DB:
+            key_state = SharedKeyState(str(settings.GEMINI_KEY_STATE_DB))
+    return GeminiScheduler(
+        keys,
+        min_concurrency=settings.GEMINI_MIN_CONCURRENCY,
+        max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+        initial_concurrency=settings.GEMINI_INITIAL_CONCURRENCY,
+        increase=settings.GEMINI_AIMD_INCREASE,
+        decrease=settings.GEMINI_AIMD_DECREASE,
+        key_rpm=settings.GEMINI_KEY_RPM,
+        cooldown=settings.GEMINI_KEY_COOLDOWN,
+        key_state=key_state,
+    )
+
+
+def build_client() -> GeminiClient:
+    return GeminiClient(
+        build_scheduler(),
+        timeout=settings.GEMINI_TIMEOUT,
+        max_retries=settings.GEMINI_MAX_RETRIES,
+        backoff=settings.GEMINI_RETRY_BACKOFF,
+        breaker=CircuitBreaker(settings.GEMINI_BREAKER_THRESHOLD, settings.GEMINI_BREAKER_RESET),
+        queue_timeout=settings.GEMINI_QUEUE_TIMEOUT,
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> GeminiClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_client()
+    return _client
+
+
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    # Let override_settings(GEMINI_...) in tests and benchmarks take effect
+    global _client
+    if setting.startswith('GEMINI_'):
+        _client = None
@@ -0,0 +1,152 @@
+# analyzer/jobs.py
+"""
+DB-backed analysis queue: no broker, just the AnalysisJob table.
+
+- enqueue() reserves the user's credit (payments.ledger) in the same transaction
+  that creates the job, so a job is charged at most once however often it is retried.
+- Workers claim jobs with a conditional UPDATE and hold a lease (locked_until);
+  a job whose worker died becomes claimable again once the lease expires.
+- Failures are retried with exponential backoff plus jitter; a job that runs out
+  of attempts is marked FAILED and its hold is released (also at most once).
+  That includes a job whose worker died on its last attempt: once its lease
+  expires it is failed and refunded instead of being claimed again.
+"""
+
+import logging
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from payments.ledger import HoldReleased, InsufficientCredits, commit, credit, release, reserve
+from .analysis import analyze_essay, analyze_essay_chunked, history_fields
+from .models import AnalysisJob, History
+from .scheduler import BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(user, essay_text: str, hold=None, mode: str = 'single') -> AnalysisJob:
+    """Queue an analysis job holding one credit (reserved here unless `hold` is given); raises InsufficientCredits."""
+    with transaction.atomic():
+        hold = hold or reserve(user, reference='job')
+        return AnalysisJob.objects.create(
+            user=user, essay_text=essay_text, mode=mode, credit_debited=True, credit_hold=hold
+        )
+
+
+def _claimable(now):
+    return Q(status='QUEUED', run_after__lte=now) | Q(
+        status='RUNNING', locked_until__lt=now, attempts__lt=settings.ANALYSIS_JOB_MAX_ATTEMPTS
+    )
+
+
+def fail_abandoned() -> int:
+    """Fail and refund jobs whose lease expired on their last attempt; returns how many."""
+    abandoned = AnalysisJob.objects.select_related('credit_hold', 'user').filter(
+        status='RUNNING', locked_until__lt=timezone.now(), attempts__gte=settings.ANALYSIS_JOB_MAX_ATTEMPTS
+    )
+    return sum(_give_up(job, "The worker running this job stopped before it finished.") for job in abandoned)
+
+
+def claim_next():
+    """Lease the oldest runnable job to the calling worker, or return None."""
+    fail_abandoned()
+    for _ in range(5):
+        now = timezone.now()
+        job_id = (
+            AnalysisJob.objects.filter(_claimable(now))
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        # Only one worker's conditional update can match; losers try the next job
+        claimed = AnalysisJob.objects.filter(_claimable(now), pk=job_id).update(
+            status='RUNNING',
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=settings.ANALYSIS_JOB_LEASE),
+        )
+        if claimed:
+            return AnalysisJob.objects.select_related('credit_hold').get(pk=job_id)
+    return None
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter, in seconds."""
+    ceiling = min(settings.ANALYSIS_JOB_RETRY_MAX_DELAY, settings.ANALYSIS_JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def run_job(job: AnalysisJob) -> None:
+    """Run a claimed job and record the outcome."""
+    breakdown = None
+    try:
+        if job.mode == 'chunked':
+            analysis_result, _, breakdown = analyze_essay_chunked(job.essay_text, priority=BACKGROUND)
+        else:
+            analysis_result, _ = analyze_essay(job.essay_text, priority=BACKGROUND)
+    except Exception as e:
+        logger.warning("Analysis job %s attempt %s failed: %s", job.pk, job.attempts, e)
+        _fail(job, str(e))
+        return
+
+    try:
+        with transaction.atomic():
+            # Guard against a second worker that picked the job up after our lease expired
+            if not AnalysisJob.objects.filter(pk=job.pk, status='RUNNING', attempts=job.attempts).update(
+                status='SUCCESS', locked_until=None, error=None
+            ):
+                return
+            history = History.objects.create(
+                user_id=job.user_id,
+                essay_text=job.essay_text,
+                **history_fields(analysis_result),
+                breakdown=breakdown or None,
+            )
+            AnalysisJob.objects.filter(pk=job.pk).update(history=history)
+            if job.credit_hold_id:
+                _charge(job)
+    except InsufficientCredits:
+        logger.error("Analysis job %s finished but its credit was released and the wallet is empty", job.pk)
+        AnalysisJob.objects.filter(pk=job.pk, status='RUNNING', attempts=job.attempts).update(
+            status='FAILED', locked_until=None, credit_debited=False,
+            error="The job's credit was refunded before it finished and the wallet has no credits left.",
+        )
+
+
+def _charge(job: AnalysisJob) -> None:
+    try:
+        commit(job.credit_hold)
+    except HoldReleased:
+        # Refunded while the job was still pending (e.g. by a stale-hold sweep): charge the analysis again
+        logger.warning("Credit hold of analysis job %s was released early; debiting again", job.pk)
+        commit(reserve(job.user, reference=f'job:{job.pk}'))
+
+
+def _fail(job: AnalysisJob, error: str) -> None:
+    if job.attempts < settings.ANALYSIS_JOB_MAX_ATTEMPTS:
+        AnalysisJob.objects.filter(pk=job.pk, status='RUNNING', attempts=job.attempts).update(
+            status='QUEUED',
+            locked_until=None,
+            run_after=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            error=error,
+        )
+        return
+    _give_up(job, error)
+
+
+def _give_up(job: AnalysisJob, error: str) -> bool:
+    """Mark the attempt's job FAILED and refund its credit, both at most once."""
+    current = AnalysisJob.objects.filter(pk=job.pk, status='RUNNING', attempts=job.attempts)
+    with transaction.atomic():
+        if current.filter(credit_debited=True).update(status='FAILED', locked_until=None, credit_debited=False, error=error):
+            if job.credit_hold_id:
+                release(job.credit_hold)
+            else:
+                # Queued before the ledger existed: the credit was debited directly
+                credit(job.user, 1, 'RELEASE', reference=f'job:{job.pk}')
+            return True
+        return bool(current.update(status='FAILED', locked_until=None, error=error))
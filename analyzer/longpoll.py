@@ -0,0 +1,18 @@
+# analyzer/longpoll.py
+"""
+The ?wait=<seconds> parameter of the long-polling status endpoints.
+
+The views sleep in the request thread, so the wait must be bounded: anything
+that isn't a finite number (including nan and inf, which float() accepts)
+is rejected, and the rest is clamped to [0, max_wait].
+"""
+
+import math
+
+
+def parse_wait(value, max_wait: float) -> float:
+    """Seconds to long-poll for `value` (a query parameter, possibly None); raises ValueError."""
+    wait = float(value or 0)
+    if not math.isfinite(wait):
+        raise ValueError(f"'{value}' is not a finite number of seconds.")
+    return max(0.0, min(wait, max_wait))
@@ -0,0 +1,123 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+from analyzer.bench import isolated_database, quiet_loggers, summarize
+from analyzer.models import History
+from payments.models import Wallet
+
+
+@contextmanager
+def sqlite_profile(options: dict, conn_max_age: int):
+    """Temporarily connect with different OPTIONS/CONN_MAX_AGE (new connections only)."""
+    db = settings.DATABASES['default']
+    old = db['OPTIONS'], db['CONN_MAX_AGE']
+    connections['default'].close()
+    db['OPTIONS'], db['CONN_MAX_AGE'] = options, conn_max_age
+    try:
+        yield
+    finally:
+        connections['default'].close()
+        db['OPTIONS'], db['CONN_MAX_AGE'] = old
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent read/write benchmark of the SQLite database profile: writer threads post "
+        "analyses (fake Gemini, no latency) while reader threads page through /api/history/. "
+        "Compares the previous defaults (rollback journal, deferred transactions, a connection "
+        "per request) with settings.DATABASES. Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each profile run.')
+        parser.add_argument('--writers', type=int, default=4, help='Threads posting analyses.')
+        parser.add_argument('--readers', type=int, default=8, help='Threads listing history.')
+        parser.add_argument('--seed-rows', type=int, default=500, help='History rows per user before the run.')
+
+    def handle(self, *args, **opts):
+        db = settings.DATABASES['default']
+        if db['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("bench_db_contention compares SQLite profiles; DB_ENGINE is not sqlite3.")
+
+        profiles = [
+            ("previous defaults", {}, 0),
+            ("settings.DATABASES", db['OPTIONS'], db['CONN_MAX_AGE']),
+        ]
+        fake_gemini = override_settings(
+            GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=0, STYLOMETRY_PRESCREEN=False, RATE_LIMIT_ENABLED=False
+        )
+        rows = []
+        # "database is locked" failures are counted; don't log a traceback for each one
+        with quiet_loggers('django.request', 'analyzer.cache'):
+            for name, options, conn_max_age in profiles:
+                with sqlite_profile(options, conn_max_age), isolated_database(), fake_gemini:
+                    writes, reads = self._run(opts)
+                rows.append((f"{name}: writes", writes))
+                rows.append((f"{name}: reads", reads))
+
+        self.stdout.write(
+            f"{opts['writers']} writers / {opts['readers']} readers, {opts['seconds']:g}s per profile\n"
+        )
+        self.stdout.write(f"{'profile':<34}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, stats in rows:
+            self.stdout.write(
+                f"{name:<34}{stats['rps']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}"
+            )
+
+    def _run(self, opts):
+        users = []
+        for i in range(opts['writers']):
+            user = get_user_model().objects.create_user(username=f'bench{i}', password='bench')
+            Wallet.objects.create(user=user, balance=1_000_000)
+            History.objects.bulk_create([
+                History(user=user, essay_text=f'Seed essay {i}-{n} ' * 40, ai_probability=0.5, reasoning='seed')
+                for n in range(opts['seed_rows'])
+            ])
+            users.append(Token.objects.create(user=user).key)
+        connections['default'].close()
+
+        deadline = time.perf_counter() + opts['seconds']
+        results = {'write': [], 'read': []}
+        lock = threading.Lock()
+
+        def worker(kind, token):
+            client = Client(headers={'Authorization': f'Token {token}'})
+            samples = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        essay = f'Contention essay {uuid.uuid4()} ' * 40
+                        ok = client.post('/api/analyze/', {'essay': essay}, content_type='application/json').status_code == 200
+                    else:
+                        ok = client.get('/api/history/?limit=50').status_code == 200
+                except Exception:
+                    # Unhandled "database is locked" surfaces here
+                    ok = False
+                samples.append((time.perf_counter() - started, ok))
+                # The test client skips the request_finished hook that ends (or keeps) the connection
+                close_old_connections()
+            connections.close_all()
+            with lock:
+                results[kind].extend(samples)
+
+        threads = [threading.Thread(target=worker, args=('write', users[i % len(users)])) for i in range(opts['writers'])]
+        threads += [threading.Thread(target=worker, args=('read', users[i % len(users)])) for i in range(opts['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return tuple(
+            summarize([s[0] for s in results[kind]], elapsed, errors=sum(1 for s in results[kind] if not s[1]))
+            for kind in ('write', 'read')
+        )
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+from django.core.management.base import BaseCommand
+from analyzer.extractors import extract_docx_text
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+def legacy_extract_docx_text(blob: bytes) -> str:
+    """The original UploadDocxView._extract_docx_text, kept here as the baseline."""
+    with ZipFile(BytesIO(blob)) as zf:
+        with zf.open('word/document.xml') as doc_xml:
+            xml_bytes = doc_xml.read()
+    ns = {'w': W_NS}
+    root = ET.fromstring(xml_bytes)
+    parts = []
+    for para in root.findall('.//w:p', ns):
+        runs = []
+        for t in para.findall('.//w:t', ns):
+            if t.text:
+                runs.append(t.text)
+        if runs:
+            parts.append(''.join(runs))
+    return '\n\n'.join(parts).strip()
+
+
+def _paragraph(text: str) -> str:
+    # Several runs per paragraph, like real Word output
+    words = text.split(' ')
+    runs = ''.join(f'<w:r><w:rPr><w:b w:val="0"/></w:rPr><w:t xml:space="preserve">{" ".join(words[i:i + 6])} </w:t></w:r>'
+                   for i in range(0, len(words), 6))
+    return f'<w:p><w:pPr><w:spacing w:after="120"/></w:pPr>{runs}</w:p>'
+
+
+def build_docx(path: str, paragraphs: int, media_mb: int) -> None:
+    """Write a synthetic .docx: body paragraphs, a table every 50 paragraphs, header, footnotes, media."""
+    sentence = "The quick brown fox jumps over the lazy dog while the committee reviews the budget proposal"
+    body = []
+    for i in range(paragraphs):
+        body.append(_paragraph(f"Paragraph {i}. {sentence} {sentence}."))
+        if i % 50 == 49:
+            cells = ''.join(f'<w:tc>{_paragraph(f"cell {i}-{c}")}</w:tc>' for c in range(4))
+            body.append(f'<w:tbl>{"".join(f"<w:tr>{cells}</w:tr>" for _ in range(5))}</w:tbl>')
+    document = f'<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w="{W_NS}"><w:body>{"".join(body)}</w:body></w:document>'
+    header = f'<?xml version="1.0" encoding="UTF-8"?><w:hdr xmlns:w="{W_NS}">{_paragraph("Running header")}</w:hdr>'
+    notes = ''.join(f'<w:footnote w:id="{n}">{_paragraph(f"Footnote {n} text")}</w:footnote>' for n in range(1, 21))
+    footnotes = f'<?xml version="1.0" encoding="UTF-8"?><w:footnotes xmlns:w="{W_NS}">{notes}</w:footnotes>'
+    with ZipFile(path, 'w', ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>')
+        zf.writestr('word/document.xml', document)
+        zf.writestr('word/header1.xml', header)
+        zf.writestr('word/footnotes.xml', footnotes)
+        for n in range(media_mb):
+            zf.writestr(f'word/media/image{n + 1}.png', os.urandom(1024 * 1024), compress_type=ZIP_STORED)
+
+
+def measure(fn):
+    """Return (result, seconds, peak traced bytes); timed without tracemalloc, which slows allocation."""
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+class Command(BaseCommand):
+    help = "Compare the streaming .docx extractor with the original read-everything extractor."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paragraphs', type=int, default=8000)
+        parser.add_argument('--media-mb', type=int, default=8, help='Megabytes of embedded (incompressible) media.')
+
+    def handle(self, *args, **opts):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.docx')
+            build_docx(path, opts['paragraphs'], opts['media_mb'])
+            size = os.path.getsize(path)
+            with ZipFile(path) as zf:
+                xml_size = zf.getinfo('word/document.xml').file_size
+
+            def legacy():
+                # What UploadDocxView used to do: upload.read() then parse from bytes
+                with open(path, 'rb') as f:
+                    return legacy_extract_docx_text(f.read())
+
+            def streaming():
+                with open(path, 'rb') as f:
+                    return extract_docx_text(f)
+
+            results = [('legacy (read + fromstring)', *measure(legacy)), ('streaming (iterparse)', *measure(streaming))]
+
+        self.stdout.write(f"file {size / 2**20:.1f} MB, document.xml {xml_size / 2**20:.1f} MB uncompressed, "
+                          f"{opts['paragraphs']} paragraphs")
+        self.stdout.write(f"{'extractor':<30}{'time ms':>10}{'peak MB':>10}{'chars out':>12}")
+        for name, text, elapsed, peak in results:
+            self.stdout.write(f"{name:<30}{elapsed * 1000:>10.0f}{peak / 2**20:>10.1f}{len(text):>12}")
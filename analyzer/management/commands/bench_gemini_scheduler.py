@@ -0,0 +1,106 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from google.api_core import exceptions as google_exceptions
+from analyzer import gemini
+from analyzer.bench import summarize
+from analyzer.scheduler import BACKGROUND, INTERACTIVE
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the Gemini scheduler against fake keys that throttle beyond a fixed capacity. "
+        "Compares a static concurrency limit with AIMD: completed calls per second, 429s, "
+        "calls that failed after retries, and the latency of interactive calls made while "
+        "background work saturates the keys. No network access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run.')
+        parser.add_argument('--keys', type=int, default=2, help='Number of fake API keys.')
+        parser.add_argument('--capacity', type=int, default=4, help='Concurrent calls each fake key accepts.')
+        parser.add_argument('--threads', type=int, default=48, help='Threads issuing background calls.')
+        parser.add_argument('--static', type=int, default=32, help='Concurrency limit of the static run.')
+        parser.add_argument('--latency', type=float, default=0.1, help='Simulated Gemini latency in seconds.')
+
+    def handle(self, *args, **opts):
+        base = dict(
+            GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=opts['latency'], GEMINI_FAKE_FAILURE_RATE=0,
+            GEMINI_FAKE_KEY_CAPACITY=opts['capacity'], GEMINI_API_KEYS=[f'bench-{i}' for i in range(opts['keys'])],
+            GEMINI_BREAKER_THRESHOLD=10 ** 6, GEMINI_QUEUE_TIMEOUT=60,
+        )
+        runs = [
+            ("static", dict(GEMINI_INITIAL_CONCURRENCY=opts['static'], GEMINI_MIN_CONCURRENCY=opts['static'],
+                            GEMINI_MAX_CONCURRENCY=opts['static'], GEMINI_KEY_COOLDOWN=0)),
+            ("aimd", dict(GEMINI_INITIAL_CONCURRENCY=opts['static'], GEMINI_MIN_CONCURRENCY=1,
+                          GEMINI_MAX_CONCURRENCY=opts['static'])),
+        ]
+        self.stdout.write(
+            f"{opts['keys']} fake keys x {opts['capacity']} concurrent calls, latency {opts['latency'] * 1000:.0f} ms, "
+            f"{opts['threads']} background threads, {opts['seconds']:g}s per run\n"
+        )
+        self.stdout.write(
+            f"{'run':<8}{'calls/s':>9}{'429s':>8}{'failed':>8}{'final limit':>13}"
+            f"{'inter. p50':>12}{'inter. p95':>12}{'inter. p99':>12}"
+        )
+        for name, overrides in runs:
+            with override_settings(**base, **overrides):
+                stats = self._run(opts)
+            self.stdout.write(
+                f"{name:<8}{stats['rps']:>9}{stats['throttled']:>8}{stats['failed']:>8}{stats['limit']:>13}"
+                f"{stats['interactive']['p50_ms']:>12}{stats['interactive']['p95_ms']:>12}{stats['interactive']['p99_ms']:>12}"
+            )
+        gemini._client = None
+
+    def _run(self, opts):
+        gemini._client = None
+        client = gemini.get_client()
+        deadline = time.perf_counter() + opts['seconds']
+        lock = threading.Lock()
+        counts = {'ok': 0, 'failed': 0}
+        interactive = []
+
+        def call(prompt, priority):
+            try:
+                client.generate(prompt, priority=priority)
+                return True
+            except (google_exceptions.GoogleAPICallError, gemini.GeminiUnavailable):
+                return False
+
+        def background(n):
+            i = 0
+            while time.perf_counter() < deadline:
+                ok = call(f'background {n} {i}', BACKGROUND)
+                i += 1
+                with lock:
+                    counts['ok' if ok else 'failed'] += 1
+
+        def probe():
+            i = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                ok = call(f'interactive {i}', INTERACTIVE)
+                i += 1
+                with lock:
+                    interactive.append(time.perf_counter() - started)
+                    counts['ok' if ok else 'failed'] += 1
+                time.sleep(0.2)
+
+        threads = [threading.Thread(target=background, args=(n,)) for n in range(opts['threads'])]
+        threads.append(threading.Thread(target=probe))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        scheduler = client.scheduler.stats()
+        return {
+            'rps': round(counts['ok'] / elapsed, 1),
+            'failed': counts['failed'],
+            'throttled': scheduler['throttled'],
+            'limit': scheduler['concurrency_limit'],
+            'interactive': summarize(interactive, elapsed),
+        }
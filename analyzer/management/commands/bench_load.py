@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+import time
+import uuid
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+from analyzer.bench import isolated_database, quiet_loggers, summarize
+from analyzer.management.commands.bench_docx_extraction import build_docx
+from analyzer.models import History
+from payments.daraja_stub import DarajaStub
+from payments.models import Wallet
+
+SCENARIOS = ('analyze', 'history', 'upload_docx', 'wallet', 'initiate', 'callback')
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline load test of the main endpoints: each scenario drives one endpoint from "
+        "--concurrency client threads for --seconds and reports requests/s, p50/p95/p99 latency "
+        "and DB queries per request. Gemini is the fake backend, M-Pesa is a local Daraja stub "
+        "and the database is a throwaway copy, so no network is needed. --save writes the results "
+        "to a baseline file; --check compares against it and exits non-zero on a regression."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma-separated subset of: {', '.join(SCENARIOS)}.")
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each scenario.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads per scenario.')
+        parser.add_argument('--gemini-latency', type=float, default=0.05, help='Simulated Gemini latency in seconds.')
+        parser.add_argument('--daraja-latency', type=float, default=0.02, help='Simulated Daraja latency in seconds.')
+        parser.add_argument('--seed-rows', type=int, default=200, help='History rows per user before the run.')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'bench-load-baseline.json'),
+                            help='Baseline file for --save and --check.')
+        parser.add_argument('--save', action='store_true', help='Write these results to the baseline file.')
+        parser.add_argument('--check', action='store_true', help='Fail if results regressed against the baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative drop in requests/s or rise in p95 before --check fails.')
+
+    def handle(self, *args, **opts):
+        scenarios = [name.strip() for name in opts['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}.")
+        baseline = self._load_baseline(opts) if opts['check'] else None
+
+        results = {}
+        with DarajaStub(latency=opts['daraja_latency']) as stub, override_settings(
+            GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=opts['gemini_latency'], GEMINI_FAKE_FAILURE_RATE=0,
+            GEMINI_FAKE_KEY_CAPACITY=0, STYLOMETRY_PRESCREEN=False, RATE_LIMIT_ENABLED=False,
+            MPESA_BASE_URL=stub.url,
+        ), mock.patch.dict('os.environ', {'MPESA_BASIC_AUTH': 'bench', 'MPESA_BEARER_TOKEN': ''}), \
+                quiet_loggers('django.request'):
+            for name in scenarios:
+                with isolated_database():
+                    results[name] = self._run(name, opts)
+
+        self.stdout.write(
+            f"{opts['concurrency']} client threads, {opts['seconds']:g}s per scenario, "
+            f"Gemini latency {opts['gemini_latency'] * 1000:.0f} ms, Daraja latency {opts['daraja_latency'] * 1000:.0f} ms\n"
+        )
+        self.stdout.write(
+            f"{'scenario':<14}{'requests':>9}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}"
+        )
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<14}{stats['requests']:>9}{stats['rps']:>8}{stats['p50_ms']:>9}{stats['p95_ms']:>9}"
+                f"{stats['p99_ms']:>9}{stats['queries_per_request']:>9}{stats['errors']:>8}"
+            )
+
+        if opts['save']:
+            with open(opts['baseline'], 'w') as f:
+                json.dump({
+                    "config": {key: opts[key] for key in ('seconds', 'concurrency', 'gemini_latency', 'daraja_latency')},
+                    "results": results,
+                }, f, indent=2, sort_keys=True)
+            self.stdout.write(f"\nBaseline written to {opts['baseline']}")
+        if baseline is not None:
+            self._check(results, baseline, opts)
+
+    # --- scenarios -----------------------------------------------------------
+
+    def _requests(self, name, opts):
+        """A function issuing one request of the scenario with a client, and the status code it expects."""
+        if name == 'analyze':
+            return (lambda client: client.post(
+                '/api/analyze/', {'essay': f'Load test essay {uuid.uuid4()} ' * 40}, content_type='application/json'
+            )), 200
+        if name == 'history':
+            return (lambda client: client.get('/api/history/?limit=50')), 200
+        if name == 'upload_docx':
+            path = os.path.join(settings.BASE_DIR, f'.bench-load-{os.getpid()}.docx')
+            try:
+                build_docx(path, paragraphs=100, media_mb=0)
+                with open(path, 'rb') as f:
+                    blob = f.read()
+            finally:
+                os.remove(path)
+            return (lambda client: client.post(
+                '/api/upload-docx', {'file': SimpleUploadedFile('essay.docx', blob)}
+            )), 200
+        if name == 'wallet':
+            return (lambda client: client.get('/api/wallet/')), 200
+        if name == 'initiate':
+            return (lambda client: client.post(
+                '/api/payments/initiate/', {'credits': 10, 'phone': '254700000000'}, content_type='application/json'
+            )), 200
+        # Daraja delivering results; the inbox accepts unknown CheckoutRequestIDs until processed
+        return (lambda client: client.post('/api/payments/callback/', {'Body': {'stkCallback': {
+            'CheckoutRequestID': f'ws_CO_{uuid.uuid4().hex[:20]}', 'ResultCode': 0, 'ResultDesc': 'ok',
+        }}}, content_type='application/json')), 200
+
+    def _clients(self, opts):
+        clients = []
+        for i in range(opts['concurrency']):
+            user = get_user_model().objects.create_user(username=f'load{i}', password='bench')
+            Wallet.objects.create(user=user, balance=1_000_000)
+            History.objects.bulk_create([
+                History(user=user, essay_text=f'Seed essay {i}-{n} ' * 40, ai_probability=0.5, reasoning='seed')
+                for n in range(opts['seed_rows'])
+            ])
+            clients.append(Client(headers={'Authorization': f'Token {Token.objects.create(user=user).key}'}))
+        connections['default'].close()
+        return clients
+
+    def _run(self, name, opts):
+        send, expected = self._requests(name, opts)
+        clients = self._clients(opts)
+        # Warm up (imports, first connection, OAuth token) outside the measured window
+        send(clients[0])
+        close_old_connections()
+
+        samples = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + opts['seconds']
+
+        def worker(client):
+            local = []
+            queries = [0]
+
+            def count_queries(execute, sql, params, many, context):
+                queries[0] += 1
+                return execute(sql, params, many, context)
+
+            # Connections are per thread, so the wrapper only sees this client's queries
+            with connection.execute_wrapper(count_queries):
+                while time.perf_counter() < deadline:
+                    queries[0] = 0
+                    started = time.perf_counter()
+                    try:
+                        ok = send(client).status_code == expected
+                    except Exception:
+                        ok = False
+                    local.append((time.perf_counter() - started, ok, queries[0]))
+                    # The test client skips the request_finished hook that ends (or keeps) the connection
+                    close_old_connections()
+            connections.close_all()
+            with lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stats = summarize([s[0] for s in samples], elapsed, errors=sum(1 for s in samples if not s[1]))
+        stats["queries_per_request"] = round(sum(s[2] for s in samples) / len(samples), 1) if samples else 0.0
+        return stats
+
+    # --- baseline ------------------------------------------------------------
+
+    def _load_baseline(self, opts):
+        try:
+            with open(opts['baseline']) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {opts['baseline']}; record one with --save first.")
+
+    def _check(self, results, baseline, opts):
+        """Compare with the baseline; raises CommandError listing every regression."""
+        config = {key: opts[key] for key in ('seconds', 'concurrency', 'gemini_latency', 'daraja_latency')}
+        if baseline.get("config") != config:
+            self.stderr.write(f"Warning: baseline was recorded with {baseline.get('config')}, this run used {config}.")
+        tolerance = opts['tolerance']
+        regressions = []
+        for name, stats in results.items():
+            before = baseline["results"].get(name)
+            if before is None:
+                self.stdout.write(f"{name}: not in the baseline, skipped")
+                continue
+            if stats['rps'] < before['rps'] * (1 - tolerance):
+                regressions.append(f"{name}: {stats['rps']} requests/s, baseline {before['rps']}")
+            if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {stats['p95_ms']} ms, baseline {before['p95_ms']} ms")
+            # Query counts don't depend on the machine: any extra query per request is a regression
+            if stats['queries_per_request'] > before['queries_per_request'] + 0.5:
+                regressions.append(
+                    f"{name}: {stats['queries_per_request']} queries/request, baseline {before['queries_per_request']}"
+                )
+            if stats['errors'] / max(stats['requests'], 1) > before['errors'] / max(before['requests'], 1):
+                regressions.append(f"{name}: {stats['errors']} errors in {stats['requests']} requests")
+        if regressions:
+            raise CommandError("Regressed against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"\nNo regressions against {opts['baseline']}"))
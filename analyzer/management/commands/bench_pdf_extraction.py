@@ -0,0 +1,55 @@
+import os
+import tempfile
+import time
+import fitz  # PyMuPDF
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from analyzer.extractors import extract_pdf_text, _get_pdf_pool
+
+SENTENCE = ("The committee reviewed the budget proposal and asked for a revised estimate of the "
+            "maintenance costs before the end of the quarter. ")
+
+
+def build_pdf(path: str, pages: int, paragraphs_per_page: int = 6) -> None:
+    """Write a synthetic text-only PDF with a few wrapped paragraphs per page."""
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        y = 50
+        for p in range(paragraphs_per_page):
+            text = f"Page {number + 1}, paragraph {p + 1}. " + SENTENCE * 3
+            rect = fitz.Rect(50, y, page.rect.width - 50, y + 110)
+            page.insert_textbox(rect, text, fontsize=10)
+            y += 120
+    doc.save(path)
+    doc.close()
+
+
+class Command(BaseCommand):
+    help = "Compare serial and process-pool PDF text extraction on a synthetic document."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **opts):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.pdf')
+            build_pdf(path, opts['pages'])
+            self.stdout.write(f"{opts['pages']} pages, {os.path.getsize(path) / 2**20:.1f} MB, "
+                              f"{os.cpu_count()} CPUs")
+            self.stdout.write(f"{'mode':<24}{'best ms':>10}{'chars out':>12}")
+            for label, workers in (('serial', 1), (f"pool ({opts['workers']} workers)", opts['workers'])):
+                with override_settings(PDF_WORKERS=workers, PDF_MAX_PAGES=max(opts['pages'], 1)):
+                    if workers > 1:
+                        # Spawn every worker outside the timing (busy tasks force one process each)
+                        list(_get_pdf_pool().map(time.sleep, [0.5] * workers))
+                    best, text = None, ''
+                    for _ in range(opts['repeat']):
+                        with open(path, 'rb') as f:
+                            started = time.perf_counter()
+                            text = extract_pdf_text(f)
+                            elapsed = time.perf_counter() - started
+                        best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(f"{label:<24}{best * 1000:>10.0f}{len(text):>12}")
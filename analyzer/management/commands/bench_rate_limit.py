@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+from analyzer.bench import isolated_database, quiet_loggers, summarize
+from payments.models import Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        "Tail latency of a well-behaved user while another user floods /api/analyze/, "
+        "with and without the per-user rate limiter. Requests share a fixed pool of worker "
+        "threads (a WSGI server's), Gemini is a fixed-latency fake, and the database is a throwaway copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run.')
+        parser.add_argument('--workers', type=int, default=8, help='Server worker threads.')
+        parser.add_argument('--abusers', type=int, default=32, help='Concurrent request loops of the flooding user.')
+        parser.add_argument('--latency', type=float, default=0.2, help='Simulated Gemini latency in seconds.')
+        parser.add_argument('--interval', type=float, default=0.5, help='Pause between the normal user\'s requests.')
+
+    def handle(self, *args, **opts):
+        rows = []
+        with tempfile.TemporaryDirectory() as tmp, quiet_loggers('django.request'):
+            for enabled in (False, True):
+                with override_settings(
+                    GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=opts['latency'], STYLOMETRY_PRESCREEN=False,
+                    RATE_LIMIT_ENABLED=enabled, RATE_LIMIT_DB=os.path.join(tmp, f'ratelimit-{enabled}.sqlite3'),
+                ), isolated_database():
+                    normal, abuser = self._run(opts)
+                label = "limiter on" if enabled else "limiter off"
+                rows.append((f"{label}: normal user", normal))
+                rows.append((f"{label}: flooding user", abuser))
+
+        self.stdout.write(
+            f"{opts['workers']} worker threads, {opts['abusers']} flooding loops, "
+            f"Gemini latency {opts['latency'] * 1000:.0f} ms, {opts['seconds']:g}s per run\n"
+        )
+        self.stdout.write(f"{'run':<30}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'429s':>7}")
+        for name, (stats, limited) in rows:
+            self.stdout.write(
+                f"{name:<30}{stats['requests']:>9}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{limited:>7}"
+            )
+
+    def _user(self, name):
+        user = get_user_model().objects.create_user(username=name, password='bench')
+        Wallet.objects.create(user=user, balance=1_000_000)
+        return Client(headers={'Authorization': f'Token {Token.objects.create(user=user).key}'})
+
+    def _run(self, opts):
+        clients = {'normal': self._user('normal'), 'abuser': self._user('abuser')}
+        samples = {'normal': [], 'abuser': []}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + opts['seconds']
+
+        def serve(who):
+            # Runs on a server worker thread
+            try:
+                return clients[who].post(
+                    '/api/analyze/', {'essay': f'Benchmark essay {uuid.uuid4()}'}, content_type='application/json'
+                ).status_code
+            finally:
+                close_old_connections()
+
+        def loop(who, pool, pause):
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                code = pool.submit(serve, who).result()
+                with lock:
+                    samples[who].append((time.perf_counter() - started, code))
+                time.sleep(pause)
+
+        with ThreadPoolExecutor(max_workers=opts['workers']) as pool:
+            threads = [threading.Thread(target=loop, args=('normal', pool, opts['interval']))]
+            threads += [threading.Thread(target=loop, args=('abuser', pool, 0)) for _ in range(opts['abusers'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        results = []
+        for who in ('normal', 'abuser'):
+            # Latency of the requests that were served; rejections are counted separately
+            served = [s[0] for s in samples[who] if s[1] != 429]
+            stats = summarize(served, elapsed, errors=sum(1 for s in samples[who] if s[1] not in (200, 429)))
+            results.append((stats, sum(1 for s in samples[who] if s[1] == 429)))
+        return results
@@ -0,0 +1,52 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from analyzer.bench import summarize
+from analyzer.stylometry import features, score
+
+
+def synthetic_essay(words: int, seed: int = 0) -> str:
+    """Pseudo-random prose with varied sentence lengths and punctuation."""
+    rng = random.Random(seed)
+    vocab = [''.join(rng.choice('etaoinshrdlucmfwyp') for _ in range(rng.randint(2, 10))) for _ in range(3000)]
+    out, sentence = [], []
+    for _ in range(words):
+        sentence.append(rng.choice(vocab))
+        if rng.random() < 0.08:
+            sentence[-1] += rng.choice([',', ';', ' -', ':'])
+        if len(sentence) >= rng.randint(4, 35):
+            out.append(' '.join(sentence).capitalize() + rng.choice(['.', '.', '.', '?', '!']))
+            sentence = []
+            if rng.random() < 0.15:
+                out.append('\n\n')
+    if sentence:
+        out.append(' '.join(sentence) + '.')
+    return ' '.join(out)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the local stylometric scorer (analyzer.stylometry) on large synthetic essays."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **opts):
+        text = synthetic_essay(opts['words'])
+        score(features(text))  # warm-up (regex compilation, NumPy dispatch)
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(opts['repeat']):
+            t0 = time.perf_counter()
+            f = features(text)
+            score(f)
+            latencies.append(time.perf_counter() - t0)
+        stats = summarize(latencies, time.perf_counter() - started)
+
+        self.stdout.write(f"{opts['words']} words, {len(text)} chars, {opts['repeat']} runs")
+        self.stdout.write(f"features: { {k: round(v, 3) for k, v in f.items()} }")
+        self.stdout.write(
+            f"per essay: mean {stats['mean_ms']} ms, p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms "
+            f"({opts['words'] * opts['repeat'] / stats['elapsed_s'] / 1e6:.2f}M words/s)"
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+from analyzer.models import EssayBlob, History
+
+
+class Command(BaseCommand):
+    help = "How much space deduplicated, compressed essay storage (EssayBlob) saves over one raw copy per History row."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help='Delete blobs no History row references any more.')
+
+    def handle(self, *args, **opts):
+        if opts['prune']:
+            deleted, _ = EssayBlob.objects.filter(analyses__isnull=True).delete()
+            self.stdout.write(f"pruned {deleted} unreferenced blobs")
+
+        rows = History.objects.aggregate(rows=Count('id'), logical=Sum('essay__size'))
+        blobs = EssayBlob.objects.aggregate(blobs=Count('id'), raw=Sum('size'), stored=Sum(Length('data')))
+        logical, raw, stored = rows['logical'] or 0, blobs['raw'] or 0, blobs['stored'] or 0
+
+        def ratio(a, b):
+            return f"{a / b:.2f}x" if b else "n/a"
+
+        self.stdout.write(f"history rows        {rows['rows']:>12}")
+        self.stdout.write(f"distinct essays     {blobs['blobs']:>12}")
+        self.stdout.write(f"raw text (per row)  {logical / 2**20:>10.2f} MB")
+        self.stdout.write(f"raw text (distinct) {raw / 2**20:>10.2f} MB   dedup {ratio(logical, raw)}")
+        self.stdout.write(f"stored (zlib)       {stored / 2**20:>10.2f} MB   compression {ratio(raw, stored)}")
+        self.stdout.write(f"overall             {ratio(logical, stored):>12}")
@@ -0,0 +1,51 @@
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from analyzer.jobs import claim_next, run_job
+
+
+class Command(BaseCommand):
+    help = "Run queued analysis jobs (AnalysisJob) with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.ANALYSIS_JOB_WORKERS,
+                            help='Jobs processed in parallel (default: ANALYSIS_JOB_WORKERS).')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before checking the queue again.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue has no runnable jobs instead of polling forever.')
+
+    def handle(self, *args, **opts):
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self._work, args=(stop, opts['poll_interval'], opts['once']), daemon=True)
+            for _ in range(max(1, opts['concurrency']))
+        ]
+        self.stdout.write(f"Starting {len(threads)} analysis worker(s)")
+        for t in threads:
+            t.start()
+        try:
+            while any(t.is_alive() for t in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers after their current job...")
+            stop.set()
+            for t in threads:
+                t.join()
+
+    def _work(self, stop, poll_interval, once):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                job = claim_next()
+                if job is None:
+                    if once:
+                        return
+                    stop.wait(poll_interval)
+                    continue
+                run_job(job)
+                self.stdout.write(f"Job {job.pk}: attempt {job.attempts} finished")
+        finally:
+            connection.close()
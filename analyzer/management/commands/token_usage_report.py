@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from analyzer.models import History
+
+
+class Command(BaseCommand):
+    help = "Gemini token usage per user and model, from the prompt/response token counts stored on History."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Only analyses from the last N days (0 = all).')
+        parser.add_argument('--user', help='Limit to one username.')
+
+    def handle(self, *args, **opts):
+        rows = History.objects.all()
+        if opts['days']:
+            rows = rows.filter(created_at__gte=timezone.now() - timedelta(days=opts['days']))
+        if opts['user']:
+            rows = rows.filter(user__username=opts['user'])
+        report = (
+            rows.values('user__username', 'model_name')
+            .annotate(
+                analyses=Count('id'),
+                prompt_tokens=Sum('prompt_tokens'),
+                response_tokens=Sum('response_tokens'),
+                truncated=Count('id', filter=Q(prompt_truncated=True)),
+            )
+            .order_by('-prompt_tokens')
+        )
+
+        self.stdout.write(f"{'user':<24}{'model':<32}{'analyses':>10}{'prompt tok':>12}{'response tok':>14}{'truncated':>11}")
+        for row in report:
+            model = row['model_name'] or '(cache/local)'
+            self.stdout.write(
+                f"{row['user__username']:<24}{model:<32}{row['analyses']:>10}"
+                f"{row['prompt_tokens']:>12}{row['response_tokens']:>14}{row['truncated']:>11}"
+            )
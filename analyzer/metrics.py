@@ -0,0 +1,255 @@
+# analyzer/metrics.py
+"""
+Lightweight request instrumentation: timing spans, histograms and query counts.
+
+- span('gemini') times a phase of the current request. Every span feeds the
+  aianalyzer_phase_seconds histogram. Inside a request handled by MetricsMiddleware,
+  spans are also reported in the response's Server-Timing header, which is only
+  sent to staff users or with DEBUG on.
+- MetricsMiddleware records request latency and DB queries per request (by URL
+  route), and can run a sampled fraction of sync requests under cProfile
+  (METRICS_PROFILE_RATE; .prof files go to METRICS_PROFILE_DIR).
+- render() produces the Prometheus text format served at /metrics (only with a
+  METRICS_TOKEN set, to scrapers presenting it).
+
+With METRICS_ENABLED off, the middleware removes itself from the chain and
+span() returns a shared no-op context manager.
+
+Histograms are kept per process. Under a multi-process server, scrape each
+worker or accept per-worker samples.
+"""
+
+import bisect
+import contextvars
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from contextlib import nullcontext
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_NOOP = nullcontext()
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{{{','.join(base + [le])}}} {cumulative}")
+            suffix = f"{{{','.join(base)}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+phase_seconds = Histogram(
+    'aianalyzer_phase_seconds', 'Time spent in named phases of request handling.', ('phase',))
+request_seconds = Histogram(
+    'aianalyzer_request_seconds', 'HTTP request latency.', ('method', 'route', 'status'))
+request_queries = Histogram(
+    'aianalyzer_request_db_queries', 'Database queries per HTTP request.', ('route',), buckets=QUERY_BUCKETS)
+HISTOGRAMS = (phase_seconds, request_seconds, request_queries)
+
+
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.expose())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """Per-request accumulator behind the Server-Timing header."""
+
+    def __init__(self):
+        self.phases = {}  # name -> [total seconds, count]
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def add(self, name: str, seconds: float) -> None:
+        entry = self.phases.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def header(self, total: float) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in self.phases.items()]
+        parts.append(f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries"')
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+
+class _Span:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        phase_seconds.observe(elapsed, self.name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(self.name, elapsed)
+        return False
+
+
+def span(name: str):
+    """Time the enclosed block as phase `name` (a no-op when METRICS_ENABLED is off)."""
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return _Span(name)
+
+
+def _count_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.query_seconds += time.perf_counter() - started
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    # Connections are reused across requests (CONN_MAX_AGE); install the wrapper once per connection object
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install() -> None:
+    """Count queries on every connection opened from now on (called from AnalyzerConfig.ready)."""
+    if settings.METRICS_ENABLED:
+        connection_created.connect(_install_query_counter, dispatch_uid='metrics_query_counter')
+
+
+def _may_see_timings(request) -> bool:
+    # The phases describe internals (cache, queueing, payment provider): not for every client
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+class MetricsMiddleware:
+    """Request latency, DB query counts, Server-Timing and sampled profiling (METRICS_* settings)."""
+    sync_capable = True
+    async_capable = True
+
+    _profile_lock = threading.Lock()
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token, started = self._start()
+        profiler = self._maybe_profile()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+            self._stop_profile(profiler, request)
+        return self._finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        # cProfile follows a single thread, so async requests are never sampled
+        timings, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, started)
+
+    @staticmethod
+    def _start():
+        timings = RequestTimings()
+        return timings, _timings.set(timings), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, timings, started):
+        total = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        request_seconds.observe(total, request.method, route, str(response.status_code))
+        request_queries.observe(timings.queries, route)
+        if settings.METRICS_SERVER_TIMING and _may_see_timings(request):
+            # Streaming responses only report what happened before the first byte
+            response['Server-Timing'] = timings.header(total)
+        return response
+
+    def _maybe_profile(self):
+        rate = settings.METRICS_PROFILE_RATE
+        if not rate or random.random() >= rate:
+            return None
+        # One profiled request at a time keeps the overhead bounded and the output readable
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profile(self, profiler, request):
+        if profiler is None:
+            return
+        try:
+            profiler.disable()
+            os.makedirs(settings.METRICS_PROFILE_DIR, exist_ok=True)
+            name = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+            profiler.dump_stats(os.path.join(
+                settings.METRICS_PROFILE_DIR, f"{time.time_ns()}-{request.method}-{name}.prof"
+            ))
+        finally:
+            self._profile_lock.release()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0004_history_breakdown'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='scored_locally',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0005_history_scored_locally'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='model_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='prompt_truncated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='response_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0006_history_token_usage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='history_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0007_history_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EssayBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # Nullable until 0010 drops it, so the conversion can also be migrated backwards
+        migrations.AlterField(
+            model_name='history',
+            name='essay_text',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='essay',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='analyses', to='analyzer.essayblob'),
+        ),
+    ]
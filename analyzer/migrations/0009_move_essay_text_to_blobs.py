@@ -0,0 +1,62 @@
+import hashlib
+import zlib
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def move_to_blobs(apps, schema_editor):
+    """Store each distinct essay once, compressed, and point History rows at it."""
+    History = apps.get_model('analyzer', 'History')
+    EssayBlob = apps.get_model('analyzer', 'EssayBlob')
+    rows = History.objects.filter(essay__isnull=True).only('id', 'essay_text').order_by('id')
+    batch = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            _convert(History, EssayBlob, batch)
+            batch = []
+    if batch:
+        _convert(History, EssayBlob, batch)
+
+
+def _convert(History, EssayBlob, rows):
+    texts = {_digest(row.essay_text): row.essay_text for row in rows}
+    known = set(EssayBlob.objects.filter(digest__in=texts).values_list('digest', flat=True))
+    EssayBlob.objects.bulk_create([
+        EssayBlob(digest=digest, data=zlib.compress(text.encode(), 6), size=len(text.encode()))
+        for digest, text in texts.items() if digest not in known
+    ])
+    ids = dict(EssayBlob.objects.filter(digest__in=texts).values_list('digest', 'id'))
+    for row in rows:
+        row.essay_id = ids[_digest(row.essay_text)]
+    History.objects.bulk_update(rows, ['essay'])
+
+
+def restore_text(apps, schema_editor):
+    History = apps.get_model('analyzer', 'History')
+    rows = History.objects.select_related('essay').order_by('id')
+    batch = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        row.essay_text = zlib.decompress(bytes(row.essay.data)).decode()
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            History.objects.bulk_update(batch, ['essay_text'])
+            batch = []
+    if batch:
+        History.objects.bulk_update(batch, ['essay_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0008_essayblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_to_blobs, restore_text),
+    ]
@@ -0,0 +1,21 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0009_move_essay_text_to_blobs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='history',
+            name='essay_text',
+        ),
+        migrations.AlterField(
+            model_name='history',
+            name='essay',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='analyses', to='analyzer.essayblob'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0010_remove_history_essay_text'),
+        ('payments', '0003_ledger_opening_balances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='credit_hold',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job', to='payments.credithold'),
+        ),
+    ]
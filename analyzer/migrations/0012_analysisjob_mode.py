@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0011_analysisjob_credit_hold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='mode',
+            field=models.CharField(choices=[('single', 'single'), ('chunked', 'chunked')], default='single', max_length=12),
+        ),
+    ]
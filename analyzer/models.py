@@ -1,19 +1,166 @@
-from django.db import models
+import hashlib
+import zlib
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 # Create your models here.
 
 User = get_user_model()
 
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode(), 6)
+
+def decompress_text(data) -> str:
+    return zlib.decompress(bytes(data)).decode()
+
+class EssayBlobManager(models.Manager):
+    def for_texts(self, texts) -> dict:
+        """Return {digest: EssayBlob} for the given texts, storing any that are new."""
+        by_digest = {text_digest(text): text for text in texts}
+        blobs = {b.digest: b for b in self.filter(digest__in=by_digest).defer('data')}
+        missing = [
+            EssayBlob(digest=digest, data=compress_text(text), size=len(text.encode()))
+            for digest, text in by_digest.items() if digest not in blobs
+        ]
+        if missing:
+            # Concurrent writers may insert the same text; the unique digest keeps one copy
+            self.bulk_create(missing, ignore_conflicts=True)
+            blobs.update((b.digest, b) for b in self.filter(digest__in=[m.digest for m in missing]).defer('data'))
+        return blobs
+
+    def for_text(self, text: str) -> 'EssayBlob':
+        return self.for_texts([text])[text_digest(text)]
+
+class EssayBlob(models.Model):
+    """Essay text stored once per distinct content (sha256), zlib-compressed."""
+    digest = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()  # uncompressed UTF-8 bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = EssayBlobManager()
+
+    @cached_property
+    def text(self) -> str:
+        return decompress_text(self.data)
+
+    def __str__(self):
+        return f"EssayBlob(digest={self.digest[:12]}, size={self.size})"
+
+class HistoryQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create() skips save(), so resolve pending essay texts to blobs here
+        objs = list(objs)
+        pending = [obj for obj in objs if obj._pending_essay_text is not None]
+        if pending:
+            blobs = EssayBlob.objects.for_texts(obj._pending_essay_text for obj in pending)
+            for obj in pending:
+                obj.essay = blobs[text_digest(obj._pending_essay_text)]
+                obj._pending_essay_text = None
+        return super().bulk_create(objs, *args, **kwargs)
+
 class History(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analyses')
-    essay_text = models.TextField()
+    # Deduplicated, compressed essay body; read and write it through `essay_text`
+    essay = models.ForeignKey(EssayBlob, on_delete=models.PROTECT, related_name='analyses')
     ai_probability = models.FloatField()
     reasoning = models.TextField()
+    breakdown = models.JSONField(blank=True, null=True)  # per-segment scores for chunked analyses
+    scored_locally = models.BooleanField(default=False)  # decided by the stylometric pre-screen, no Gemini call
+    # Gemini usage for this analysis (0 tokens when served from the cache or scored locally)
+    model_name = models.CharField(max_length=100, blank=True, default='')
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    response_tokens = models.PositiveIntegerField(default=0)
+    prompt_truncated = models.BooleanField(default=False)  # essay sampled down to ANALYSIS_MAX_PROMPT_TOKENS
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = HistoryQuerySet.as_manager()
+
+    _pending_essay_text = None
+
+    @property
+    def essay_text(self) -> str:
+        if self._pending_essay_text is not None:
+            return self._pending_essay_text
+        return self.essay.text
+
+    @essay_text.setter
+    def essay_text(self, value: str):
+        # Stored on save(); History(essay_text=...) and objects.create(essay_text=...) both land here
+        self._pending_essay_text = value
+
+    def save(self, *args, **kwargs):
+        if self._pending_essay_text is not None:
+            self.essay = EssayBlob.objects.for_text(self._pending_essay_text)
+            self._pending_essay_text = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'essay'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's history: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='history_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"History(id={self.id}, user={self.user.username}, prob={self.ai_probability:.2f})"
+
+@receiver(post_delete, sender=History)
+def _prune_essay_blob(sender, instance, **kwargs):
+    # Deleting a user or their history must delete the essay text too, unless another row still shares it
+    essay_id = instance.essay_id
+    transaction.on_commit(lambda: EssayBlob.objects.filter(pk=essay_id, analyses__isnull=True).delete())
+
+class CachedAnalysis(models.Model):
+    """Persistent tier of the analysis result cache (see analyzer.cache)."""
+    key = models.CharField(max_length=64, unique=True)  # sha256 of model, prompt version and normalized essay
+    model_name = models.CharField(max_length=100)
+    prompt_version = models.PositiveIntegerField()
+    ai_probability = models.FloatField()
+    reasoning = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"CachedAnalysis(key={self.key[:12]}, v={self.prompt_version}, prob={self.ai_probability:.2f})"
+
+class AnalysisJob(models.Model):
+    """A queued analysis, run by `manage.py run_analysis_worker` (see analyzer.jobs)."""
+    STATUS_CHOICES = (
+        ('QUEUED', 'QUEUED'),
+        ('RUNNING', 'RUNNING'),
+        ('SUCCESS', 'SUCCESS'),
+        ('FAILED', 'FAILED'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analysis_jobs')
+    MODE_CHOICES = (
+        ('single', 'single'),
+        ('chunked', 'chunked'),  # paragraph segments scored in parallel (analyze_essay_chunked)
+    )
+    essay_text = models.TextField()
+    mode = models.CharField(max_length=12, choices=MODE_CHOICES, default='single')
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)  # not claimable before this (retry backoff)
+    locked_until = models.DateTimeField(blank=True, null=True)  # lease held by the worker running it
+    credit_debited = models.BooleanField(default=False)  # True while the job holds the user's credit
+    credit_hold = models.OneToOneField('payments.CreditHold', on_delete=models.SET_NULL, blank=True, null=True, related_name='job')
+    history = models.OneToOneField(History, on_delete=models.SET_NULL, blank=True, null=True, related_name='job')
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"AnalysisJob(id={self.id}, user={self.user.username}, status={self.status}, attempts={self.attempts})"
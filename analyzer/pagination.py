@@ -0,0 +1,65 @@
+# analyzer/pagination.py
+"""
+Keyset (cursor) pagination over (created_at, id), newest first.
+
+Each page is an index range scan starting right after the last row the client
+saw, so fetching page 100 costs the same as page 1 (unlike OFFSET).
+"""
+
+import base64
+from datetime import datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        parsed = parse_datetime(created_at)
+        if parsed is None:
+            raise ValueError(created_at)
+        return parsed, int(pk)
+    except ValueError as e:  # also covers binascii.Error and UnicodeDecodeError
+        raise InvalidCursor("Invalid cursor.") from e
+
+
+def after_cursor(cursor: str) -> Q:
+    """Rows strictly after the cursor in (-created_at, -id) order."""
+    created_at, pk = decode_cursor(cursor)
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+
+
+def parse_bound(value: str, end_of_day: bool = False) -> datetime:
+    """
+    ISO datetime or date -> aware datetime. A bare date used as an upper bound
+    means the end of that day (so until=2025-01-31 includes the 31st).
+    """
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"'{value}' is not an ISO date or datetime.")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def paginate(queryset, limit: int):
+    """Return (rows, next_cursor) for a queryset of dicts already filtered past any cursor."""
+    rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
@@ -0,0 +1,172 @@
+# analyzer/ratelimit.py
+"""
+Per-user rate and concurrency limits for the analysis endpoints.
+
+Two limits apply to each user:
+- a token bucket holding up to RATE_LIMIT_BURST tokens, which refills at
+  RATE_LIMIT_PER_MINUTE. Each analysis costs one token (a batch costs one per
+  essay, capped at the burst).
+- at most RATE_LIMIT_MAX_IN_FLIGHT analyses running at the same time. A slot is
+  a lease that expires after RATE_LIMIT_LEASE seconds, so a worker that dies
+  mid-request cannot hold it forever.
+
+State lives in a small SQLite file (RATE_LIMIT_DB) that every worker process on
+the host opens directly, so the limits hold across processes without a broker.
+Each check is a single IMMEDIATE transaction. If the store itself fails, requests
+are let through rather than rejected. RATE_LIMIT_PER_MINUTE=0 turns the limiter
+off, like RATE_LIMIT_ENABLED=0.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS slot (id TEXT PRIMARY KEY, key TEXT NOT NULL, expires REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS slot_key ON slot (key, expires)",
+)
+
+
+class RateLimited(Exception):
+    """A per-user limit was hit; the client may retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    def __init__(self, path: str, per_minute: float, burst: int, max_in_flight: int, lease: float):
+        if per_minute <= 0:
+            raise ValueError("RateLimiter needs a positive refill rate.")
+        self.path = path
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.lease = lease
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; isolation_level=None so BEGIN IMMEDIATE is ours to issue
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key, cost: int = 1):
+        """Take `cost` tokens and an in-flight slot for `key`; returns the slot id or raises RateLimited."""
+        key = str(key)
+        cost = min(cost, self.burst)
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM slot WHERE key = ? AND expires < ?", (key, now))
+                (in_flight,) = conn.execute("SELECT COUNT(*) FROM slot WHERE key = ?", (key,)).fetchone()
+                if in_flight >= self.max_in_flight:
+                    raise RateLimited(f"At most {self.max_in_flight} analyses may run at once.", 1.0)
+
+                row = conn.execute("SELECT tokens, updated FROM bucket WHERE key = ?", (key,)).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+                if tokens < cost:
+                    raise RateLimited("Too many analysis requests.", (cost - tokens) / self.rate)
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens - cost, now),
+                )
+                slot = uuid.uuid4().hex
+                conn.execute("INSERT INTO slot (id, key, expires) VALUES (?, ?, ?)", (slot, key, now + self.lease))
+                conn.execute("COMMIT")
+                return slot
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logger.warning("Rate limit store unavailable; letting the request through", exc_info=True)
+            return None
+
+    def release(self, slot) -> None:
+        if slot is None:
+            return
+        try:
+            self._connection().execute("DELETE FROM slot WHERE id = ?", (slot,))
+        except sqlite3.Error:
+            # The lease expires on its own
+            logger.warning("Could not release rate limit slot %s", slot, exc_info=True)
+
+    @contextmanager
+    def limit(self, key, cost: int = 1):
+        slot = self.acquire(key, cost)
+        try:
+            yield
+        finally:
+            self.release(slot)
+
+    def reset(self) -> None:
+        """Forget all buckets and slots (tests and benchmarks)."""
+        conn = self._connection()
+        conn.execute("DELETE FROM bucket")
+        conn.execute("DELETE FROM slot")
+
+
+class NoLimit:
+    """Stand-in used when RATE_LIMIT_ENABLED is off or RATE_LIMIT_PER_MINUTE is 0."""
+
+    def acquire(self, key, cost: int = 1):
+        return None
+
+    def release(self, slot) -> None:
+        pass
+
+    @contextmanager
+    def limit(self, key, cost: int = 1):
+        yield
+
+    def reset(self) -> None:
+        pass
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if settings.RATE_LIMIT_ENABLED and settings.RATE_LIMIT_PER_MINUTE > 0:
+                    _limiter = RateLimiter(
+                        str(settings.RATE_LIMIT_DB),
+                        per_minute=settings.RATE_LIMIT_PER_MINUTE,
+                        burst=settings.RATE_LIMIT_BURST,
+                        max_in_flight=settings.RATE_LIMIT_MAX_IN_FLIGHT,
+                        lease=settings.RATE_LIMIT_LEASE,
+                    )
+                else:
+                    _limiter = NoLimit()
+    return _limiter
+
+
+@receiver(setting_changed)
+def _reset_limiter(setting, **kwargs):
+    global _limiter
+    if setting.startswith('RATE_LIMIT_'):
+        _limiter = None
@@ -0,0 +1,54 @@
+# analyzer/routers.py
+"""
+Read routing for the optional 'replica' database alias.
+
+Only code that opts in (the reads_from_replica decorator or replica_reads()
+context) reads from the replica; everything else, including every write and
+the reads that follow them, stays on 'default'. Replicas lag, so opt in only
+for views that can show data a moment old (history listings, not wallet
+balances or payment status). Without a 'replica' alias this is a no-op.
+"""
+
+import contextvars
+import functools
+from contextlib import contextmanager
+from django.conf import settings
+
+REPLICA = 'replica'
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def replica_reads():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def reads_from_replica(method):
+    """Decorate a view handler so the queries it runs read from the replica."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return method(*args, **kwargs)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and REPLICA in settings.DATABASES:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives schema changes through replication
+        return False if db == REPLICA else None
@@ -0,0 +1,431 @@
+# analyzer/scheduler.py
+"""
+Central scheduler for outbound Gemini calls.
+
+Every model call first takes a lease from the scheduler, which decides three
+things:
+- How many calls may be in flight. The limit follows AIMD: it grows by about one
+  call per window of successful calls (+increase / limit each), and shrinks by
+  `decrease` when Gemini throttles us. Only calls started after the last decrease
+  can cause another one, so a burst of 429s from one window counts once.
+- Which API key the call uses. This is the key with the fewest calls in flight
+  (then the one throttled longest ago) among keys that are not cooling down and
+  are under their per-minute quota (`key_rpm`, 0 = untracked). A key is benched only when it keeps throttling
+  window after window; the cooldown doubles each time.
+- Who goes next. Interactive requests are served before batch items, and batch
+  items before background jobs (FIFO within a priority).
+
+Waiters are granted leases directly by whoever frees capacity, so sync (threads)
+and async (event loop futures) callers share one queue.
+
+The scheduler object, and so the concurrency limit and the priority queue, is
+per process. Key quotas and cooldowns are what the processes have to agree on,
+since they all spend the same keys: with a SharedKeyState they live in a small
+SQLite file that every process on the host opens directly (like
+analyzer.ratelimit), otherwise in the process (LocalKeyState).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, BATCH, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch', BACKGROUND: 'background'}
+
+OK, THROTTLED, FAILED = 'ok', 'throttled', 'failed'
+
+
+class QueueTimeout(Exception):
+    """No lease was granted within the caller's timeout."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini capacity exhausted; retry in {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class KeySlot:
+    """
+    One API key: its backend, in-flight count, recent call starts and 429 cooldown.
+    `ident` names the key in a SharedKeyState (default: `name`).
+    """
+
+    def __init__(self, name: str, backend, ident: str = None):
+        self.name = name
+        self.backend = backend
+        self.ident = ident or name
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.strikes = 0  # windows in a row that ended in a 429, drives the cooldown length
+        self.struck_at = 0.0
+        self.cooldown_until = 0.0
+        self.recent = deque()  # call start times within the last minute
+
+    def available_at(self, now: float, rpm: int) -> float:
+        """When this key may take another call (<= now means immediately)."""
+        while self.recent and self.recent[0] <= now - 60:
+            self.recent.popleft()
+        at = self.cooldown_until
+        if rpm and len(self.recent) >= rpm:
+            at = max(at, self.recent[0] + 60)
+        return at
+
+
+class LocalKeyState:
+    """Key quotas and cooldowns kept on the KeySlots, seen by this process only."""
+
+    def take(self, keys: list, now: float, rpm: int):
+        """
+        Record a call start on the first available of `keys` (in order of preference):
+        (key, None), or (None, time the first key frees up) if none is available.
+        """
+        next_at = None
+        for key in keys:
+            at = key.available_at(now, rpm)
+            if at <= now:
+                key.recent.append(now)
+                return key, None
+            next_at = at if next_at is None else min(next_at, at)
+        return None, next_at
+
+    def available_at(self, key: KeySlot, now: float, rpm: int) -> float:
+        return key.available_at(now, rpm)
+
+    def calls_last_minute(self, key: KeySlot, now: float) -> int:
+        return sum(1 for started in key.recent if started > now - 60)
+
+    def throttled(self, key: KeySlot, started: float, now: float, cooldown: float, max_cooldown: float) -> None:
+        """A call started at `started` got a 429."""
+        if started > key.struck_at:
+            # A lone 429 is handled by the limit alone; repeated ones bench the key (0, 1x, 3x, 7x... cooldown)
+            key.cooldown_until = now + min(max_cooldown, cooldown * (2 ** key.strikes - 1))
+            key.strikes += 1
+            key.struck_at = now
+
+    def succeeded(self, key: KeySlot) -> None:
+        key.strikes = 0
+
+
+_KEY_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS key_call (key TEXT NOT NULL, started REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS key_call_key ON key_call (key, started)",
+    "CREATE TABLE IF NOT EXISTS key_state (key TEXT PRIMARY KEY, strikes INTEGER NOT NULL DEFAULT 0, "
+    "struck_at REAL NOT NULL DEFAULT 0, cooldown_until REAL NOT NULL DEFAULT 0)",
+)
+
+
+class SharedKeyState(LocalKeyState):
+    """
+    Key quotas and cooldowns in a SQLite file shared by every process on the host,
+    so N processes together stay within a key's GEMINI_KEY_RPM and all of them
+    bench a key that is throttling. Picking a key and recording the call start is
+    one IMMEDIATE transaction. If the store fails, the KeySlots' own state is used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _KEY_SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _available_at(conn, key: KeySlot, now: float, rpm: int) -> float:
+        row = conn.execute("SELECT cooldown_until FROM key_state WHERE key = ?", (key.ident,)).fetchone()
+        at = row[0] if row else 0.0
+        if rpm:
+            (calls,) = conn.execute(
+                "SELECT COUNT(*) FROM key_call WHERE key = ? AND started > ?", (key.ident, now - 60)
+            ).fetchone()
+            if calls >= rpm:
+                # The oldest of the last `rpm` calls leaves the window first
+                (first,) = conn.execute(
+                    "SELECT started FROM key_call WHERE key = ? AND started > ? ORDER BY started DESC LIMIT 1 OFFSET ?",
+                    (key.ident, now - 60, rpm - 1),
+                ).fetchone()
+                at = max(at, first + 60)
+        return at
+
+    def take(self, keys: list, now: float, rpm: int):
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                next_at = None
+                for key in keys:
+                    conn.execute("DELETE FROM key_call WHERE key = ? AND started <= ?", (key.ident, now - 60))
+                    at = self._available_at(conn, key, now, rpm)
+                    if at <= now:
+                        conn.execute("INSERT INTO key_call (key, started) VALUES (?, ?)", (key.ident, now))
+                        conn.execute("COMMIT")
+                        key.recent.append(now)
+                        return key, None
+                    next_at = at if next_at is None else min(next_at, at)
+                conn.execute("COMMIT")
+                return None, next_at
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logger.warning("Gemini key state store unavailable; using this process's view", exc_info=True)
+            return super().take(keys, now, rpm)
+
+    def available_at(self, key: KeySlot, now: float, rpm: int) -> float:
+        try:
+            return self._available_at(self._connection(), key, now, rpm)
+        except sqlite3.Error:
+            return super().available_at(key, now, rpm)
+
+    def calls_last_minute(self, key: KeySlot, now: float) -> int:
+        try:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM key_call WHERE key = ? AND started > ?", (key.ident, now - 60)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            return super().calls_last_minute(key, now)
+
+    def throttled(self, key: KeySlot, started: float, now: float, cooldown: float, max_cooldown: float) -> None:
+        super().throttled(key, started, now, cooldown, max_cooldown)
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR IGNORE INTO key_state (key) VALUES (?)", (key.ident,))
+                (strikes, struck_at) = conn.execute(
+                    "SELECT strikes, struck_at FROM key_state WHERE key = ?", (key.ident,)
+                ).fetchone()
+                if started > struck_at:
+                    conn.execute(
+                        "UPDATE key_state SET strikes = ?, struck_at = ?, cooldown_until = ? WHERE key = ?",
+                        (strikes + 1, now, now + min(max_cooldown, cooldown * (2 ** strikes - 1)), key.ident),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logger.warning("Could not record a 429 for Gemini key %s", key.name, exc_info=True)
+
+    def succeeded(self, key: KeySlot) -> None:
+        super().succeeded(key)
+        try:
+            self._connection().execute("UPDATE key_state SET strikes = 0 WHERE key = ? AND strikes > 0", (key.ident,))
+        except sqlite3.Error:
+            logger.warning("Could not reset the 429 strikes of Gemini key %s", key.name, exc_info=True)
+
+    def reset(self) -> None:
+        """Forget all call starts and cooldowns (tests and benchmarks)."""
+        conn = self._connection()
+        conn.execute("DELETE FROM key_call")
+        conn.execute("DELETE FROM key_state")
+
+
+class Lease:
+    """Permission for one call on `key`; hand it back with GeminiScheduler.release()."""
+    __slots__ = ('key', 'started')
+
+    def __init__(self, key: KeySlot, started: float):
+        self.key = key
+        self.started = started
+
+    @property
+    def backend(self):
+        return self.key.backend
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'wake', 'lease', 'cancelled')
+
+    def __init__(self, priority: int, seq: int, wake):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.lease = None
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class GeminiScheduler:
+    def __init__(self, keys: list, min_concurrency: int = 1, max_concurrency: int = 64,
+                 initial_concurrency: int = 8, increase: float = 1.0, decrease: float = 0.5,
+                 key_rpm: int = 0, cooldown: float = 2.0, max_cooldown: float = 60.0, key_state: LocalKeyState = None):
+        if not keys:
+            raise ValueError("GeminiScheduler needs at least one API key.")
+        self.keys = keys
+        self.key_state = key_state or LocalKeyState()
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.increase = increase
+        self.decrease = decrease
+        self.key_rpm = key_rpm
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.in_flight = 0
+        self.throttled = 0
+        self.decreases = 0
+        self._decreased_at = float('-inf')
+        self._waiting = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    # --- granting --------------------------------------------------------------
+
+    def _dispatch(self) -> None:
+        """Hand leases to the highest-priority waiters while capacity lasts (lock held)."""
+        # Wall-clock time: call starts and cooldowns may be compared across processes
+        now = time.time()
+        while self._waiting and self.in_flight < int(self.limit):
+            waiter = self._waiting[0]
+            if waiter.cancelled:
+                heapq.heappop(self._waiting)
+                continue
+            # Least busy key first, then the one throttled longest ago (so a retry after a 429 moves on)
+            key, next_at = self.key_state.take(
+                sorted(self.keys, key=lambda k: (k.in_flight, k.struck_at)), now, self.key_rpm
+            )
+            if key is None:
+                self._wake_at(next_at - now)
+                return
+            heapq.heappop(self._waiting)
+            self.in_flight += 1
+            key.in_flight += 1
+            key.calls += 1
+            waiter.lease = Lease(key, now)
+            waiter.wake()
+
+    def _wake_at(self, delay: float) -> None:
+        # Every key is cooling down or over quota: dispatch again once the first one frees up
+        if self._timer is not None:
+            return
+
+        def fire():
+            with self._lock:
+                self._timer = None
+                self._dispatch()
+
+        self._timer = threading.Timer(max(delay, 0.01), fire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _enqueue(self, priority: int, wake) -> _Waiter:
+        waiter = _Waiter(priority, next(self._seq), wake)
+        heapq.heappush(self._waiting, waiter)
+        self._dispatch()
+        return waiter
+
+    def _give_up(self, waiter: _Waiter, timeout: float):
+        """Called on timeout (lock held): a lease granted in the meantime is still returned."""
+        if waiter.lease is not None:
+            return waiter.lease
+        waiter.cancelled = True
+        raise QueueTimeout(retry_after=max(timeout, 1.0))
+
+    def acquire(self, priority: int = INTERACTIVE, timeout: float = None) -> Lease:
+        """Block until a lease is granted. Raises QueueTimeout."""
+        granted = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(priority, granted.set)
+        if not granted.wait(timeout):
+            with self._lock:
+                return self._give_up(waiter, timeout)
+        return waiter.lease
+
+    async def acquire_async(self, priority: int = INTERACTIVE, timeout: float = None) -> Lease:
+        """Async twin of acquire(); waits on a future instead of blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        with self._lock:
+            waiter = self._enqueue(priority, wake)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                return self._give_up(waiter, timeout)
+        except asyncio.CancelledError:
+            # The request went away while queued; hand back a lease that was granted meanwhile
+            with self._lock:
+                waiter.cancelled = True
+                lease = waiter.lease
+            if lease is not None:
+                self.release(lease, FAILED)
+            raise
+        return waiter.lease
+
+    # --- feedback --------------------------------------------------------------
+
+    def release(self, lease: Lease, outcome: str = OK) -> None:
+        """Return a lease and feed the call's outcome into AIMD and the key's cooldown."""
+        key = lease.key
+        with self._lock:
+            now = time.time()
+            self.in_flight -= 1
+            key.in_flight -= 1
+            if outcome == THROTTLED:
+                self.throttled += 1
+                key.throttled += 1
+                self.key_state.throttled(key, lease.started, now, self.cooldown, self.max_cooldown)
+                if lease.started > self._decreased_at:
+                    self.limit = max(float(self.min_concurrency), self.limit * self.decrease)
+                    self._decreased_at = now
+                    self.decreases += 1
+            elif outcome == OK:
+                self.key_state.succeeded(key)
+                self.limit = min(float(self.max_concurrency), self.limit + self.increase / self.limit)
+            self._dispatch()
+
+    def other_key_available(self, key: KeySlot) -> bool:
+        """Whether a key other than `key` could take a call right now."""
+        with self._lock:
+            now = time.time()
+            return any(
+                other is not key and self.key_state.available_at(other, now, self.key_rpm) <= now for other in self.keys
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.time()
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self._waiting:
+                if not waiter.cancelled:
+                    queued[PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))] += 1
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": queued,
+                "throttled": self.throttled,
+                "decreases": self.decreases,
+                "keys": [
+                    {
+                        "key": key.name,
+                        "in_flight": key.in_flight,
+                        "calls": key.calls,
+                        "throttled": key.throttled,
+                        "calls_last_minute": self.key_state.calls_last_minute(key, now),
+                        "cooling_down": self.key_state.available_at(key, now, 0) > now,
+                    }
+                    for key in self.keys
+                ],
+            }
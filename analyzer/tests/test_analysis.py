@@ -0,0 +1,105 @@
+import json
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from analyzer.analysis import ReasoningExtractor, analyze_essay, analyze_essay_chunked, prepare_prompt
+from analyzer.cache import result_cache
+from analyzer.chunking import chunk_essay, split_paragraphs
+from analyzer.tokens import TRUNCATION_MARKER, estimate_tokens, fit_to_budget
+
+
+class ReasoningExtractorTests(SimpleTestCase):
+    reasoning = 'Says "delve" \\ often,\nthen\ttabs. Café – 😀 / done'
+
+    def test_escapes_split_at_every_position(self):
+        reply = '```json\n' + json.dumps({"ai_probability": 0.4, "reasoning": self.reasoning}) + '\n```'
+        for size in range(1, 14):
+            extractor = ReasoningExtractor()
+            text = ''.join(extractor.feed(reply[i:i + size]) for i in range(0, len(reply), size))
+            self.assertEqual(text, self.reasoning, f"chunk size {size}")
+            self.assertTrue(extractor.done)
+
+    def test_nothing_before_the_reasoning_key(self):
+        extractor = ReasoningExtractor()
+        self.assertEqual(extractor.feed('{"ai_probability": 0.4, "reas'), '')
+        self.assertEqual(extractor.feed('oning": "ab'), 'ab')
+        self.assertEqual(extractor.feed('c", "x": "ignored"}'), 'c')
+
+
+class ChunkingTests(SimpleTestCase):
+    def test_paragraphs_split_on_blank_lines(self):
+        self.assertEqual(split_paragraphs('One.\n\nTwo.\n  \n\nThree.\n'), ['One.', 'Two.', 'Three.'])
+
+    def test_consecutive_paragraphs_are_grouped(self):
+        text = '\n\n'.join(['a' * 40, 'b' * 40, 'c' * 40, 'd' * 10])
+        chunks = chunk_essay(text, max_chars=90)
+        self.assertEqual([c["paragraphs"] for c in chunks], [[0, 1], [2, 3]])
+        self.assertEqual(chunks[0]["text"], 'a' * 40 + '\n\n' + 'b' * 40)
+        self.assertTrue(all(len(c["text"]) <= 90 for c in chunks))
+
+    def test_long_paragraph_splits_at_sentences(self):
+        sentences = ['Sentence number %d is here.' % i for i in range(6)]
+        chunks = chunk_essay('Intro.\n\n' + ' '.join(sentences), max_chars=60)
+        self.assertEqual(chunks[0], {"text": 'Intro.', "paragraphs": [0, 0]})
+        self.assertEqual(' '.join(c["text"] for c in chunks[1:]), ' '.join(sentences))
+        self.assertTrue(all(c["paragraphs"] == [1, 1] and len(c["text"]) <= 60 for c in chunks[1:]))
+
+    def test_unbroken_text_is_cut_hard(self):
+        self.assertEqual([len(c["text"]) for c in chunk_essay('x' * 25, max_chars=10)], [10, 10, 5])
+
+
+class TokenBudgetTests(SimpleTestCase):
+    essay = ' '.join(f'Sentence {i} of a long essay.' for i in range(2000))
+
+    def test_short_essays_are_untouched(self):
+        self.assertEqual(fit_to_budget('A short essay.', 100), ('A short essay.', False))
+
+    def test_long_essays_keep_head_middle_and_tail(self):
+        text, truncated = fit_to_budget(self.essay, 1000)
+        self.assertTrue(truncated)
+        self.assertLessEqual(estimate_tokens(text), 1000)
+        head, middle, tail = text.split(TRUNCATION_MARKER)
+        self.assertTrue(head.startswith('Sentence 0 of'))
+        self.assertIn('Sentence 1000 of', middle)
+        self.assertTrue(tail.endswith('Sentence 1999 of a long essay.'))
+        self.assertEqual(fit_to_budget(self.essay, 1000), (text, True))
+
+    @override_settings(ANALYSIS_MAX_PROMPT_TOKENS=2000)
+    def test_prompt_fits_the_budget(self):
+        prompt, truncated = prepare_prompt(self.essay)
+        self.assertTrue(truncated)
+        self.assertLessEqual(estimate_tokens(prompt), 2000)
+
+
+@override_settings(
+    GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=0, STYLOMETRY_PRESCREEN=False, ANALYSIS_MAX_PROMPT_TOKENS=2000,
+    ANALYSIS_CHUNK_MAX_CHARS=400, ANALYSIS_CHUNK_CONCURRENCY=1,
+)
+class AnalysisUsageTests(TransactionTestCase):
+    """Segments are analyzed on worker threads, which write the result cache through their own connections."""
+
+    def setUp(self):
+        result_cache.clear()
+        self.addCleanup(result_cache.clear)
+
+    def test_usage_is_recorded_and_cache_hits_cost_nothing(self):
+        essay = ' '.join(f'Sentence {i} of a long essay.' for i in range(2000))
+        result, cached = analyze_essay(essay)
+        self.assertFalse(cached)
+        self.assertTrue(result["usage"]["truncated"])
+        self.assertLessEqual(result["usage"]["prompt_tokens"], 2000)
+        self.assertGreater(result["usage"]["response_tokens"], 0)
+        result, cached = analyze_essay(essay)
+        self.assertTrue(cached)
+        self.assertEqual((result["usage"]["prompt_tokens"], result["usage"]["model"]), (0, ''))
+
+    def test_chunked_breakdown_and_usage(self):
+        paragraphs = [f'Paragraph {i} talks about something different. ' * 4 for i in range(6)]
+        result, cached, breakdown = analyze_essay_chunked('\n\n'.join(paragraphs))
+        self.assertFalse(cached)
+        self.assertEqual([b["paragraphs"] for b in breakdown], [[0, 1], [2, 3], [4, 5]])
+        total = sum(b["chars"] for b in breakdown)
+        self.assertAlmostEqual(result["ai_probability"],
+                               sum(b["ai_probability"] * b["chars"] for b in breakdown) / total)
+        self.assertIn('over 3 segments', result["reasoning"])
+        segments = ('\n\n'.join(paragraphs[i:i + 2]) for i in (0, 2, 4))
+        self.assertEqual(result["usage"]["prompt_tokens"], sum(estimate_tokens(prepare_prompt(s)[0]) for s in segments))
+        self.assertFalse(result["usage"]["truncated"])
@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from payments.models import Wallet
+from analyzer.authentication import CachedTokenAuthentication, token_cache
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user('reader', password='pw')
+        Wallet.objects.create(user=self.user, balance=3)
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def test_hit_costs_no_query(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, token.key), (self.user.pk, self.token.key))
+        with self.assertNumQueries(0):
+            self.assertEqual(token.user, user)
+
+    def test_requests_share_no_instances(self):
+        first, _ = self.auth.authenticate_credentials(self.token.key)
+        second, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(second.wallet.balance, 3)
+        second.flag = True
+        third, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertIsNot(third, first)
+        self.assertIsNot(third, second)
+        self.assertFalse(hasattr(third, 'flag'))
+        self.assertNotIn('wallet', third._state.fields_cache)
+        self.assertNotIn('wallet', first._state.fields_cache)
+
+    def test_logout_invalidates(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(client.get('/api/wallet/').status_code, 200)
+        self.assertEqual(client.post('/api/auth/logout/').status_code, 200)
+        self.assertEqual(client.get('/api/wallet/').status_code, 401)
+
+    def test_deleted_token_is_rejected(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_is_rejected(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_user_changes_are_seen(self):
+        self.auth.authenticate_credentials(self.token.key)
+        invalidations = token_cache.stats()['invalidations']
+        self.user.is_staff = True
+        self.user.save()
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertTrue(user.is_staff)
+        self.assertEqual(token_cache.stats()['invalidations'], invalidations + 1)
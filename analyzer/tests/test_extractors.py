@@ -0,0 +1,127 @@
+import os
+import tempfile
+from io import BytesIO
+from zipfile import ZipFile
+import fitz
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from analyzer.extractors import ExtractionError, extract_docx_text, extract_pdf_text, extract_upload_text
+from analyzer.management.commands.bench_docx_extraction import W_NS, build_docx
+
+
+def _paragraph(text: str) -> str:
+    return f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>'
+
+
+def docx(*paragraphs, header=None, footnote=None) -> BytesIO:
+    body = ''.join(_paragraph(p) for p in paragraphs)
+    buffer = BytesIO()
+    with ZipFile(buffer, 'w') as zf:
+        zf.writestr('word/document.xml', f'<w:document xmlns:w="{W_NS}"><w:body>{body}</w:body></w:document>')
+        if header:
+            zf.writestr('word/header1.xml', f'<w:hdr xmlns:w="{W_NS}">{_paragraph(header)}</w:hdr>')
+            zf.writestr('word/header2.xml', f'<w:hdr xmlns:w="{W_NS}">{_paragraph(header)}</w:hdr>')
+        if footnote:
+            zf.writestr('word/footnotes.xml', f'<w:footnotes xmlns:w="{W_NS}"><w:footnote>{_paragraph(footnote)}</w:footnote></w:footnotes>')
+    buffer.seek(0)
+    return buffer
+
+
+def pdf(pages: int) -> BytesIO:
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f'Page {n} first block.')
+        page.insert_text((72, 400), f'Page {n} second block.')
+    buffer = BytesIO(doc.tobytes())
+    doc.close()
+    return buffer
+
+
+class DocxTests(SimpleTestCase):
+    def test_headers_body_and_notes_in_order(self):
+        text = extract_docx_text(docx('First paragraph.', 'Second paragraph.', header='Running head', footnote='A note.'))
+        self.assertEqual(text.split('\n\n'), ['Running head', 'First paragraph.', 'Second paragraph.', 'A note.'])
+
+    def test_tables_are_one_line_per_row(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'table.docx')
+            build_docx(path, paragraphs=50, media_mb=0)
+            with open(path, 'rb') as f:
+                text = extract_docx_text(f)
+        self.assertIn('cell 49-0 | cell 49-1 | cell 49-2 | cell 49-3', text.split('\n\n'))
+
+    @override_settings(DOCX_MAX_PARAGRAPHS=2)
+    def test_paragraph_limit(self):
+        extract_docx_text(docx('One.', 'Two.'))
+        with self.assertRaisesMessage(ExtractionError, 'more than 2 paragraphs'):
+            extract_docx_text(docx('One.', 'Two.', 'Three.'))
+
+    @override_settings(DOCX_MAX_UNCOMPRESSED_BYTES=1024)
+    def test_decompression_budget(self):
+        with self.assertRaisesMessage(ExtractionError, 'expands beyond'):
+            extract_docx_text(docx(*['A long paragraph of essay text.'] * 100))
+
+    def test_not_a_word_document(self):
+        with self.assertRaisesMessage(ExtractionError, 'Not a valid .docx'):
+            extract_docx_text(BytesIO(b'not a zip'))
+        buffer = BytesIO()
+        with ZipFile(buffer, 'w') as zf:
+            zf.writestr('word/other.xml', '')
+        with self.assertRaisesMessage(ExtractionError, 'Not a Word document'):
+            extract_docx_text(buffer)
+        buffer = BytesIO()
+        with ZipFile(buffer, 'w') as zf:
+            zf.writestr('word/document.xml', '<w:document')
+        with self.assertRaisesMessage(ExtractionError, 'Malformed'):
+            extract_docx_text(buffer)
+
+
+class PdfTests(SimpleTestCase):
+    def test_one_paragraph_per_block(self):
+        self.assertEqual(extract_pdf_text(pdf(2)).split('\n\n'),
+                         ['Page 0 first block.', 'Page 0 second block.', 'Page 1 first block.', 'Page 1 second block.'])
+
+    @override_settings(PDF_MAX_PAGES=3)
+    def test_page_limit(self):
+        with self.assertRaisesMessage(ExtractionError, 'more than 3 pages'):
+            extract_pdf_text(pdf(4))
+
+    @override_settings(PDF_WORKERS=2, PDF_PARALLEL_MIN_PAGES=4, PDF_PAGES_PER_TASK=2)
+    def test_parallel_extraction_keeps_page_order(self):
+        expected = '\n\n'.join(f'Page {n} first block.\n\nPage {n} second block.' for n in range(9))
+        self.assertEqual(extract_pdf_text(pdf(9)), expected)
+
+    def test_not_a_pdf(self):
+        with self.assertRaises(ExtractionError):
+            extract_pdf_text(BytesIO(b'%PDF-1.4 truncated'))
+
+
+class UploadTests(SimpleTestCase):
+    def test_dispatch_on_extension(self):
+        upload = SimpleUploadedFile('Essay.DOCX', docx('Uploaded.').getvalue())
+        self.assertEqual(extract_upload_text(upload), 'Uploaded.')
+        with self.assertRaisesMessage(ExtractionError, 'Unsupported file type'):
+            extract_upload_text(SimpleUploadedFile('essay.txt', b'plain text'))
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class UploadDocxViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user('uploader', password='pw'))
+
+    def upload(self, name, content):
+        return self.client.post('/api/upload-docx', {'file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_extracts_docx_and_pdf(self):
+        self.assertEqual(self.upload('essay.docx', docx('From Word.').getvalue()).json()['text'], 'From Word.')
+        self.assertEqual(self.upload('essay.pdf', pdf(1).getvalue()).json()['text'],
+                         'Page 0 first block.\n\nPage 0 second block.')
+
+    def test_rejects_other_formats_and_bad_files(self):
+        self.assertEqual(self.upload('essay.txt', b'plain text').status_code, 400)
+        self.assertEqual(self.upload('essay.docx', b'not a zip').status_code, 400)
+        self.assertEqual(self.client.post('/api/upload-docx', {}, format='multipart').status_code, 400)
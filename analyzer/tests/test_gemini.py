@@ -0,0 +1,140 @@
+import asyncio
+import time
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from google.api_core import exceptions as google_exceptions
+from rest_framework.test import APIClient
+from payments.models import Wallet
+from analyzer import gemini
+from analyzer.gemini import CircuitBreaker, FakeResponse, GeminiClient, GeminiUnavailable
+from analyzer.scheduler import GeminiScheduler, KeySlot
+
+
+class ScriptedBackend:
+    """Raises or answers with the next item of `outcomes` (the last one repeats)."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    def generate(self, model_name, prompt, timeout, stream=False):
+        return self._next()
+
+    async def generate_async(self, model_name, prompt, timeout):
+        return self._next()
+
+
+def client(*backends, max_retries=2, threshold=3, reset=30.0):
+    scheduler = GeminiScheduler([KeySlot(f'k{i}', b) for i, b in enumerate(backends)], cooldown=0)
+    return GeminiClient(scheduler, timeout=1, max_retries=max_retries, backoff=0,
+                        breaker=CircuitBreaker(threshold, reset), queue_timeout=1)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(GeminiUnavailable) as raised:
+            breaker.before_call()
+        self.assertGreater(raised.exception.retry_after, 29)
+
+    def test_half_open_allows_one_trial(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertEqual(breaker.state, 'half-open')
+        breaker.before_call()
+        with self.assertRaises(GeminiUnavailable):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(threshold=5, reset_timeout=0.01)
+        for _ in range(5):
+            breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+    def test_release_trial_frees_the_trial_without_closing(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.release_trial()
+        self.assertEqual(breaker.state, 'half-open')
+        breaker.before_call()
+
+
+class RetryTests(SimpleTestCase):
+    def test_retryable_errors_are_retried(self):
+        backend = ScriptedBackend(google_exceptions.ServiceUnavailable('down'), TimeoutError(), '{"ok": 1}')
+        self.assertEqual(client(backend).generate('p').text, '{"ok": 1}')
+        self.assertEqual(backend.calls, 3)
+
+    def test_gives_up_after_max_retries(self):
+        backend = ScriptedBackend(google_exceptions.ServiceUnavailable('down'))
+        c = client(backend, max_retries=2, threshold=10)
+        with self.assertRaises(google_exceptions.ServiceUnavailable):
+            c.generate('p')
+        self.assertEqual(backend.calls, 3)
+        self.assertEqual(c.scheduler.in_flight, 0)
+
+    def test_other_errors_are_not_retried_and_leave_the_breaker_closed(self):
+        backend = ScriptedBackend(google_exceptions.InvalidArgument('bad prompt'))
+        c = client(backend, threshold=1)
+        with self.assertRaises(google_exceptions.InvalidArgument):
+            c.generate('p')
+        self.assertEqual((backend.calls, c.breaker.state), (1, 'closed'))
+
+    def test_429_moves_to_another_key_without_tripping_the_breaker(self):
+        throttled = ScriptedBackend(google_exceptions.TooManyRequests('quota'))
+        healthy = ScriptedBackend('{"ok": 1}')
+        c = client(throttled, healthy, max_retries=1, threshold=1)
+        self.assertEqual(c.generate('p').text, '{"ok": 1}')
+        self.assertEqual((throttled.calls, healthy.calls, c.breaker.state), (1, 1, 'closed'))
+
+    def test_open_breaker_fails_fast(self):
+        backend = ScriptedBackend(google_exceptions.ServiceUnavailable('down'))
+        c = client(backend, max_retries=0, threshold=1)
+        with self.assertRaises(google_exceptions.ServiceUnavailable):
+            c.generate('p')
+        with self.assertRaises(GeminiUnavailable):
+            c.generate('p')
+        self.assertEqual(backend.calls, 1)
+
+    def test_async_retries(self):
+        backend = ScriptedBackend(google_exceptions.DeadlineExceeded('slow'), '{"ok": 1}')
+        response = asyncio.run(client(backend).generate_async('p'))
+        self.assertEqual((response.text, backend.calls), ('{"ok": 1}', 2))
+
+
+@override_settings(
+    GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=0, GEMINI_BREAKER_THRESHOLD=1, STYLOMETRY_PRESCREEN=False,
+    RATE_LIMIT_ENABLED=False,
+)
+class BreakerViewTests(TestCase):
+    def test_open_breaker_is_a_503_with_retry_after(self):
+        user = get_user_model().objects.create_user('breaker', password='pw')
+        Wallet.objects.create(user=user, balance=1)
+        api = APIClient()
+        api.force_authenticate(user)
+        gemini.get_client().breaker.record_failure()
+        response = api.post('/api/analyze/', {'essay': 'An essay while Gemini is down. ' * 5}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(Wallet.objects.get(user=user).balance, 1)
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from analyzer.models import History
+from analyzer.pagination import InvalidCursor, decode_cursor, encode_cursor, parse_bound
+
+User = get_user_model()
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        created_at = timezone.make_aware(datetime(2025, 3, 1, 12, 30, 15, 123456))
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+
+    def test_garbage_is_invalid(self):
+        for cursor in ('', 'not-base64!', encode_cursor(timezone.now(), 1)[:-3], 'bm90IGEgZGF0ZXwx'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_bare_dates(self):
+        self.assertEqual(parse_bound('2025-01-31').date().isoformat(), '2025-01-31')
+        self.assertEqual(parse_bound('2025-01-31', end_of_day=True).date().isoformat(), '2025-02-01')
+        with self.assertRaises(ValueError):
+            parse_bound('last tuesday')
+
+
+@override_settings(HISTORY_PAGE_SIZE=2, HISTORY_MAX_PAGE_SIZE=3, RATE_LIMIT_ENABLED=False)
+class HistoryListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('historian', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        base = timezone.make_aware(datetime(2025, 1, 30, 12))
+        # Two rows share a timestamp, so the cursor has to break the tie on id
+        stamps = [base, base + timedelta(days=1), base + timedelta(days=1), base + timedelta(days=2), base + timedelta(days=3)]
+        self.rows = []
+        for i, stamp in enumerate(stamps):
+            row = History.objects.create(user=self.user, essay_text=f'Essay {i}', ai_probability=i / 10, reasoning='r')
+            History.objects.filter(pk=row.pk).update(created_at=stamp)
+            self.rows.append(row.pk)
+        other = User.objects.create_user('other', password='pw')
+        History.objects.create(user=other, essay_text='Not mine', ai_probability=0.9, reasoning='r')
+
+    def ids(self, query=''):
+        """Every id across all pages, and the number of pages."""
+        ids, pages, url = [], 0, f'/api/history/?{query}'
+        while True:
+            body = self.client.get(url).json()
+            ids += [row['id'] for row in body['results']]
+            pages += 1
+            if body['next_cursor'] is None:
+                return ids, pages
+            url = f'/api/history/?{query}&cursor={body["next_cursor"]}'
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        self.assertEqual(self.ids(), (self.rows[::-1], 3))
+
+    def test_limit_is_capped(self):
+        self.assertEqual(self.ids('limit=100'), (self.rows[::-1], 2))
+        self.assertEqual(self.client.get('/api/history/?limit=0').status_code, 400)
+
+    def test_date_filters(self):
+        # until is exclusive; a bare date includes that whole day
+        self.assertEqual(self.ids('since=2025-01-31&until=2025-02-01')[0], self.rows[3:0:-1])
+        self.assertEqual(self.ids('since=2025-02-02')[0], [self.rows[4]])
+
+    def test_probability_filters(self):
+        self.assertEqual(self.ids('min_prob=0.1&max_prob=0.3')[0], self.rows[3:0:-1])
+
+    def test_text_is_opt_in(self):
+        row = self.client.get('/api/history/?limit=1').json()['results'][0]
+        self.assertNotIn('essay_text', row)
+        row = self.client.get('/api/history/?limit=1&include_text=1').json()['results'][0]
+        self.assertEqual(row['essay_text'], 'Essay 4')
+
+    def test_bad_parameters(self):
+        for query in ('cursor=garbage', 'since=yesterday', 'min_prob=high', 'limit=ten'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/history/?{query}').status_code, 400)
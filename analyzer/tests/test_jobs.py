@@ -0,0 +1,92 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from payments.models import LedgerEntry, Wallet
+from analyzer.cache import result_cache
+from analyzer.jobs import claim_next, enqueue, run_job
+from analyzer.models import AnalysisJob, History
+
+User = get_user_model()
+
+
+def balance(user) -> int:
+    return Wallet.objects.get(user=user).balance
+
+
+@override_settings(
+    GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=0, GEMINI_FAKE_FAILURE_RATE=0, GEMINI_MAX_RETRIES=0,
+    STYLOMETRY_PRESCREEN=False, RATE_LIMIT_ENABLED=False,
+)
+class AnalysisJobTests(TestCase):
+    def setUp(self):
+        result_cache.clear()
+        self.user = User.objects.create_user('worker', password='pw')
+        Wallet.objects.create(user=self.user, balance=2)
+
+    def test_claim_leases_a_job_once(self):
+        job = enqueue(self.user, 'An essay to analyse in the background. ' * 5)
+        claimed = claim_next()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual((claimed.status, claimed.attempts), ('RUNNING', 1))
+        self.assertIsNone(claim_next())
+
+    def test_expired_lease_is_claimable_again(self):
+        job = enqueue(self.user, 'An essay whose worker died. ' * 5)
+        claim_next()
+        AnalysisJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_next().attempts, 2)
+
+    def test_success_records_history_and_commits_the_hold(self):
+        enqueue(self.user, 'An essay to analyse in the background. ' * 5)
+        run_job(claim_next())
+        job = AnalysisJob.objects.select_related('credit_hold').get()
+        self.assertEqual(job.status, 'SUCCESS')
+        self.assertEqual(job.history, History.objects.get())
+        self.assertEqual(job.credit_hold.status, 'COMMITTED')
+        self.assertEqual(balance(self.user), 1)
+
+    @override_settings(ANALYSIS_JOB_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_then_refunded_once(self):
+        job = enqueue(self.user, 'An essay Gemini keeps failing on. ' * 5)
+        with mock.patch('analyzer.jobs.analyze_essay', side_effect=RuntimeError('boom')):
+            run_job(claim_next())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.error), ('QUEUED', 'boom'))
+            self.assertEqual(balance(self.user), 1)
+
+            AnalysisJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            claimed = claim_next()
+            run_job(claimed)
+            # A late duplicate of the final attempt must not refund again
+            run_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertFalse(job.credit_debited)
+        self.assertEqual(balance(self.user), 2)
+        self.assertEqual(LedgerEntry.objects.filter(kind='RELEASE').count(), 1)
+
+    @override_settings(ANALYSIS_JOB_MAX_ATTEMPTS=1)
+    def test_job_whose_worker_died_on_its_last_attempt_is_refunded(self):
+        job = enqueue(self.user, 'An essay that crashes its worker. ' * 5)
+        claim_next()
+        AnalysisJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(claim_next())
+        self.assertIsNone(claim_next())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 1))
+        self.assertEqual(balance(self.user), 2)
+        self.assertEqual(LedgerEntry.objects.filter(kind='RELEASE').count(), 1)
+
+    @override_settings(ANALYSIS_JOB_MAX_WAIT=0.2)
+    def test_status_wait_must_be_finite(self):
+        job = enqueue(self.user, 'An essay nobody picks up. ' * 5)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(f'/api/analyze/jobs/{job.pk}/?wait=3600').json()['status'], 'QUEUED')
+        for wait in ('nan', 'inf', 'later'):
+            with self.subTest(wait=wait):
+                self.assertEqual(client.get(f'/api/analyze/jobs/{job.pk}/?wait={wait}').status_code, 400)
@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from analyzer.models import EssayBlob, History, decompress_text, text_digest
+
+User = get_user_model()
+
+
+class EssayBlobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='pw')
+
+    def history(self, text, **fields):
+        return History(user=self.user, essay_text=text, ai_probability=0.5, reasoning='r', **fields)
+
+    def test_identical_essays_share_one_blob(self):
+        first = History.objects.create(user=self.user, essay_text='Same essay.', ai_probability=0.1, reasoning='r')
+        second = History.objects.create(user=self.user, essay_text='Same essay.', ai_probability=0.2, reasoning='r')
+        self.assertEqual(first.essay_id, second.essay_id)
+        blob = EssayBlob.objects.get()
+        self.assertEqual((blob.digest, blob.size), (text_digest('Same essay.'), len('Same essay.')))
+        self.assertEqual(decompress_text(blob.data), 'Same essay.')
+        self.assertEqual(History.objects.get(pk=second.pk).essay_text, 'Same essay.')
+
+    def test_bulk_create_resolves_texts(self):
+        History.objects.create(user=self.user, essay_text='Known essay.', ai_probability=0.1, reasoning='r')
+        with self.assertNumQueries(4):  # look up, insert new blobs, fetch their ids, insert rows
+            History.objects.bulk_create([self.history('Known essay.'), self.history('New essay.'), self.history('New essay.')])
+        self.assertEqual(EssayBlob.objects.count(), 2)
+        self.assertEqual(
+            sorted(h.essay_text for h in History.objects.select_related('essay')),
+            ['Known essay.', 'Known essay.', 'New essay.', 'New essay.'],
+        )
+
+    def test_text_change_on_save_points_at_a_new_blob(self):
+        item = History.objects.create(user=self.user, essay_text='Draft.', ai_probability=0.1, reasoning='r')
+        item.essay_text = 'Final.'
+        item.save(update_fields=['ai_probability'])
+        self.assertEqual(History.objects.get(pk=item.pk).essay_text, 'Final.')
+
+    def test_deleting_the_last_reference_deletes_the_blob(self):
+        shared = [History.objects.create(user=self.user, essay_text='Shared.', ai_probability=0.1, reasoning='r')
+                  for _ in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            shared[0].delete()
+        self.assertTrue(EssayBlob.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            shared[1].delete()
+        self.assertFalse(EssayBlob.objects.exists())
+
+
+class MoveEssayTextToBlobsMigrationTests(TransactionTestCase):
+    before = [('analyzer', '0008_essayblob')]
+    after = [('analyzer', '0009_move_essay_text_to_blobs')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_forwards_and_backwards(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('auth', 'User').objects.create(username='legacy')
+        OldHistory = apps.get_model('analyzer', 'History')
+        for text in ('First essay.', 'Second essay.', 'First essay.'):
+            OldHistory.objects.create(user=user, essay_text=text, ai_probability=0.5, reasoning='r')
+
+        apps = self.migrate(self.after)
+        Blob = apps.get_model('analyzer', 'EssayBlob')
+        rows = list(apps.get_model('analyzer', 'History').objects.select_related('essay').order_by('id'))
+        self.assertEqual(Blob.objects.count(), 2)
+        self.assertEqual(rows[0].essay_id, rows[2].essay_id)
+        self.assertEqual([decompress_text(row.essay.data) for row in rows], ['First essay.', 'Second essay.', 'First essay.'])
+
+        apps = self.migrate(self.before)
+        texts = apps.get_model('analyzer', 'History').objects.order_by('id').values_list('essay_text', flat=True)
+        self.assertEqual(list(texts), ['First essay.', 'Second essay.', 'First essay.'])
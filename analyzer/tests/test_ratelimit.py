@@ -0,0 +1,86 @@
+import os
+import tempfile
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from payments.models import Wallet
+from analyzer.ratelimit import NoLimit, RateLimited, RateLimiter, get_rate_limiter
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'ratelimit.sqlite3')
+
+    def limiter(self, **kwargs):
+        return RateLimiter(self.path, **{'per_minute': 6, 'burst': 3, 'max_in_flight': 10, 'lease': 300, **kwargs})
+
+    def test_bucket_empties_and_says_when_to_retry(self):
+        limiter = self.limiter()
+        for _ in range(3):
+            limiter.release(limiter.acquire('u'))
+        with self.assertRaises(RateLimited) as raised:
+            limiter.acquire('u')
+        self.assertAlmostEqual(raised.exception.retry_after, 10, delta=0.1)
+        limiter.acquire('someone else')
+
+    def test_limits_are_shared_through_the_file(self):
+        self.limiter().acquire('u', cost=3)
+        with self.assertRaises(RateLimited):
+            self.limiter().acquire('u')
+
+    def test_in_flight_slots_are_released(self):
+        limiter = self.limiter(max_in_flight=1, burst=10)
+        with limiter.limit('u'):
+            with self.assertRaisesMessage(RateLimited, 'At most 1'):
+                limiter.acquire('u')
+        with self.assertRaisesMessage(RuntimeError, 'boom'), limiter.limit('u'):
+            raise RuntimeError('boom')
+        limiter.release(limiter.acquire('u'))
+
+    def test_expired_slots_are_reclaimed(self):
+        limiter = self.limiter(max_in_flight=1, lease=-1)
+        limiter.acquire('u')
+        limiter.acquire('u')
+
+    def test_store_failure_lets_requests_through(self):
+        limiter = RateLimiter(os.path.join(self.path, 'missing', 'x'), per_minute=6, burst=1, max_in_flight=1, lease=300)
+        with self.assertLogs('analyzer.ratelimit', 'WARNING'):
+            self.assertIsNone(limiter.acquire('u'))
+
+    def test_zero_rate_turns_the_limiter_off(self):
+        with override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_PER_MINUTE=0):
+            self.assertIsInstance(get_rate_limiter(), NoLimit)
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            self.assertIsInstance(get_rate_limiter(), NoLimit)
+        with self.assertRaises(ValueError):
+            self.limiter(per_minute=0)
+
+
+class RateLimitViewTests(TestCase):
+    def setUp(self):
+        self.settings_override = override_settings(
+            RATE_LIMIT_ENABLED=True, RATE_LIMIT_DB=os.path.join(tempfile.mkdtemp(), 'ratelimit.sqlite3'),
+            RATE_LIMIT_PER_MINUTE=6, RATE_LIMIT_BURST=2, RATE_LIMIT_MAX_IN_FLIGHT=4,
+            GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=0, STYLOMETRY_PRESCREEN=False,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = get_user_model().objects.create_user('hasty', password='pw')
+        Wallet.objects.create(user=self.user, balance=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def analyze(self, n):
+        return self.client.post('/api/analyze/', {'essay': f'Essay number {n} about rate limits. ' * 5}, format='json')
+
+    def test_429_with_retry_after_and_no_charge(self):
+        self.assertEqual([self.analyze(n).status_code for n in range(2)], [200, 200])
+        response = self.analyze(2)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['code'], 'RATE_LIMITED')
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, 8)
+
+    def test_slots_are_released_after_each_request(self):
+        with override_settings(RATE_LIMIT_MAX_IN_FLIGHT=1, RATE_LIMIT_BURST=5):
+            self.assertEqual([self.analyze(n).status_code for n in range(3)], [200, 200, 200])
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from payments.models import Wallet
+from analyzer import gemini
+from analyzer.scheduler import (
+    BACKGROUND, BATCH, FAILED, INTERACTIVE, OK, THROTTLED, GeminiScheduler, KeySlot, QueueTimeout, SharedKeyState,
+)
+
+
+def scheduler(keys=1, **kwargs):
+    return GeminiScheduler([KeySlot(f'k{i}', None) for i in range(keys)], **kwargs)
+
+
+class AimdTests(SimpleTestCase):
+    def test_successes_raise_the_limit_by_about_one_per_window(self):
+        s = scheduler(initial_concurrency=4, max_concurrency=64)
+        for _ in range(4):
+            s.release(s.acquire(), OK)
+        self.assertAlmostEqual(s.limit, 5.0, delta=0.1)
+
+    def test_limit_stays_within_bounds(self):
+        s = scheduler(initial_concurrency=2, min_concurrency=2, max_concurrency=2)
+        s.release(s.acquire(), OK)
+        self.assertEqual(s.limit, 2)
+        s.release(s.acquire(), THROTTLED)
+        self.assertEqual(s.limit, 2)
+
+    def test_429s_from_one_window_decrease_once(self):
+        s = scheduler(initial_concurrency=8, decrease=0.5)
+        leases = [s.acquire() for _ in range(4)]
+        for lease in leases:
+            s.release(lease, THROTTLED)
+        self.assertEqual((s.limit, s.decreases, s.throttled), (4.0, 1, 4))
+        # A call started after the decrease can decrease the limit again
+        s.release(s.acquire(), THROTTLED)
+        self.assertEqual((s.limit, s.decreases), (2.0, 2))
+
+    def test_failures_leave_the_limit_alone(self):
+        s = scheduler(initial_concurrency=4)
+        s.release(s.acquire(), FAILED)
+        self.assertEqual(s.limit, 4.0)
+
+
+class KeyTests(SimpleTestCase):
+    def test_least_busy_key_first(self):
+        s = scheduler(keys=2, initial_concurrency=4)
+        first, second = s.acquire(), s.acquire()
+        self.assertEqual({first.key.name, second.key.name}, {'k0', 'k1'})
+
+    def test_repeated_429s_bench_the_key(self):
+        s = scheduler(initial_concurrency=4, cooldown=30)
+        s.release(s.acquire(), THROTTLED)
+        self.assertFalse(s.stats()['keys'][0]['cooling_down'])  # a lone 429 doesn't bench a key
+        s.release(s.acquire(), THROTTLED)
+        self.assertTrue(s.stats()['keys'][0]['cooling_down'])
+        self.assertFalse(s.other_key_available(KeySlot('other', None)))
+        with self.assertRaises(QueueTimeout):
+            s.acquire(timeout=0.05)
+
+    def test_retry_after_a_429_prefers_another_key(self):
+        s = scheduler(keys=2, initial_concurrency=4)
+        lease = s.acquire()
+        s.release(lease, THROTTLED)
+        self.assertNotEqual(s.acquire().key, lease.key)
+
+    def test_success_clears_the_strikes(self):
+        s = scheduler(cooldown=30)
+        s.release(s.acquire(), THROTTLED)
+        s.release(s.acquire(), OK)
+        s.release(s.acquire(), THROTTLED)
+        self.assertTrue(s.other_key_available(KeySlot('other', None)))
+
+    def test_key_rpm(self):
+        s = scheduler(initial_concurrency=4, key_rpm=2)
+        s.release(s.acquire(), OK)
+        s.release(s.acquire(), OK)
+        with self.assertRaises(QueueTimeout):
+            s.acquire(timeout=0.05)
+        self.assertEqual(s.stats()['keys'][0]['calls_last_minute'], 2)
+
+
+class QueueTests(SimpleTestCase):
+    def test_priority_order(self):
+        s = scheduler(initial_concurrency=1, max_concurrency=1)
+        held = s.acquire()
+        granted = []
+
+        def wait(priority):
+            lease = s.acquire(priority, timeout=5)
+            granted.append(priority)
+            s.release(lease, FAILED)
+
+        threads = []
+        for priority in (BACKGROUND, BATCH, INTERACTIVE, BACKGROUND):
+            threads.append(threading.Thread(target=wait, args=(priority,)))
+            threads[-1].start()
+            while sum(s.stats()['queued'].values()) < len(threads):
+                time.sleep(0.001)
+        s.release(held, FAILED)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(granted, [INTERACTIVE, BATCH, BACKGROUND, BACKGROUND])
+
+    def test_timeout_raises_and_drops_the_waiter(self):
+        s = scheduler(initial_concurrency=1, max_concurrency=1)
+        held = s.acquire()
+        with self.assertRaises(QueueTimeout):
+            s.acquire(timeout=0.05)
+        s.release(held, OK)
+        self.assertEqual(s.in_flight, 0)
+        self.assertEqual(s.acquire(timeout=0.05).key.name, 'k0')
+
+    def test_lease_granted_as_the_wait_times_out_is_kept(self):
+        s = scheduler(initial_concurrency=1, max_concurrency=1)
+        held = s.acquire()
+        waiter = s._enqueue(INTERACTIVE, lambda: None)
+        s.release(held, OK)
+        self.assertIs(s._give_up(waiter, 0.05), waiter.lease)
+        self.assertEqual(s.in_flight, 1)
+
+    def test_cancelled_async_waiter_is_skipped(self):
+        s = scheduler(initial_concurrency=1, max_concurrency=1)
+
+        async def run():
+            held = s.acquire()
+            task = asyncio.ensure_future(s.acquire_async(timeout=5))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            s.release(held, OK)
+            return await s.acquire_async(timeout=0.1)
+
+        lease = asyncio.run(run())
+        self.assertEqual((s.in_flight, lease.key.name), (1, 'k0'))
+
+    def test_lease_granted_to_a_cancelled_async_waiter_is_returned(self):
+        s = scheduler(initial_concurrency=1, max_concurrency=1)
+
+        async def run():
+            held = s.acquire()
+            task = asyncio.ensure_future(s.acquire_async(timeout=5))
+            await asyncio.sleep(0.01)
+            # The lease is granted, but the request goes away before the waiter resumes
+            s.release(held, OK)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        self.assertEqual(s.in_flight, 0)
+
+
+class SharedKeyStateTests(SimpleTestCase):
+    """Two schedulers over one store stand in for two worker processes."""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'keys.sqlite3')
+
+    def processes(self, **kwargs):
+        return [
+            GeminiScheduler([KeySlot('k0', None)], key_state=SharedKeyState(self.path), initial_concurrency=4, **kwargs)
+            for _ in range(2)
+        ]
+
+    def test_key_rpm_is_shared(self):
+        a, b = self.processes(key_rpm=3)
+        a.release(a.acquire(), OK)
+        b.release(b.acquire(), OK)
+        a.release(a.acquire(), OK)
+        with self.assertRaises(QueueTimeout):
+            b.acquire(timeout=0.05)
+        self.assertEqual(b.stats()['keys'][0]['calls_last_minute'], 3)
+
+    def test_cooldown_is_shared(self):
+        a, b = self.processes(cooldown=30)
+        a.release(a.acquire(), THROTTLED)
+        a.release(a.acquire(), THROTTLED)
+        self.assertTrue(b.stats()['keys'][0]['cooling_down'])
+        with self.assertRaises(QueueTimeout):
+            b.acquire(timeout=0.05)
+
+    def test_store_failure_falls_back_to_the_process(self):
+        s = GeminiScheduler([KeySlot('k0', None)], key_state=SharedKeyState(os.path.join(self.path, 'missing', 'x')))
+        with self.assertLogs('analyzer.scheduler', 'WARNING'):
+            s.release(s.acquire(timeout=0.05), OK)
+
+
+@override_settings(
+    GEMINI_BACKEND='fake', GEMINI_FAKE_LATENCY=0, GEMINI_MAX_RETRIES=0, GEMINI_QUEUE_TIMEOUT=0.05,
+    GEMINI_INITIAL_CONCURRENCY=1, GEMINI_MAX_CONCURRENCY=1, STYLOMETRY_PRESCREEN=False, RATE_LIMIT_ENABLED=False,
+)
+class QueueTimeoutViewTests(TestCase):
+    def test_no_capacity_is_a_503_and_refunds(self):
+        user = get_user_model().objects.create_user('queued', password='pw')
+        Wallet.objects.create(user=user, balance=1)
+        client = APIClient()
+        client.force_authenticate(user)
+        held = gemini.get_client().scheduler.acquire()
+        try:
+            response = client.post('/api/analyze/', {'essay': 'An essay stuck behind a full queue. ' * 5}, format='json')
+        finally:
+            gemini.get_client().scheduler.release(held, OK)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['code'], 'GEMINI_UNAVAILABLE')
+        self.assertEqual(Wallet.objects.get(user=user).balance, 1)
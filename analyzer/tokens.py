@@ -0,0 +1,59 @@
+# analyzer/tokens.py
+"""
+Local prompt-token estimation and budget enforcement.
+
+Counting is done locally (no count_tokens round trip) with a conservative
+estimate of Gemini's tokenizer; exact usage is recorded from the response's
+usage_metadata after the call.
+"""
+
+import re
+
+# Gemini averages ~4 characters per token on English prose; words and punctuation
+# give a second estimate that holds up better for short-word or symbol-heavy text.
+CHARS_PER_TOKEN = 4
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+TRUNCATION_MARKER = "\n\n[...]\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    pieces = len(_TOKEN_PIECE_RE.findall(text))
+    return max(len(text) // CHARS_PER_TOKEN, int(pieces * 1.1))
+
+
+def _trim_partial_words(piece: str, start: bool, end: bool) -> str:
+    """Drop a word cut in half at either edge (unless that would lose a quarter of the piece)."""
+    if start:
+        space = piece.find(' ')
+        if 0 <= space < len(piece) // 4:
+            piece = piece[space + 1:]
+    if end:
+        space = piece.rfind(' ')
+        if space > len(piece) * 3 // 4:
+            piece = piece[:space]
+    return piece
+
+
+def fit_to_budget(essay_text: str, max_tokens: int) -> tuple[str, bool]:
+    """
+    Return (text, truncated). Essays over max_tokens are sampled deterministically:
+    equal shares from the head, the middle and the tail, joined by a [...] marker,
+    so the model still sees the opening, the body and the conclusion.
+    """
+    tokens = estimate_tokens(essay_text)
+    if tokens <= max_tokens:
+        return essay_text, False
+
+    # Scale the character length down to the budget, split it three ways, leave room for the markers
+    share = max(1, int(len(essay_text) * max_tokens / tokens) // 3 - len(TRUNCATION_MARKER))
+    while True:
+        middle_start = len(essay_text) // 2 - share // 2
+        head = _trim_partial_words(essay_text[:share], start=False, end=True)
+        middle = _trim_partial_words(essay_text[middle_start:middle_start + share], start=True, end=True)
+        tail = _trim_partial_words(essay_text[-share:], start=True, end=False)
+        text = TRUNCATION_MARKER.join([head.strip(), middle.strip(), tail.strip()])
+        sampled = estimate_tokens(text)
+        # The sample can be denser in words than the essay as a whole; shrink it until it fits
+        if sampled <= max_tokens or share == 1:
+            return text, True
+        share = max(1, min(share - 1, int(share * max_tokens / sampled)))
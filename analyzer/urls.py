@@ -1,13 +1,21 @@
 # analyzer/urls.py
 
 from django.urls import path
-from .views import EssayAnalysisView, RegisterView, LoginView, LogoutView, HistoryListView, UploadDocxView
+from .views import EssayAnalysisView, UploadAnalysisView, StreamingEssayAnalysisView, BatchEssayAnalysisView, AnalysisJobListView, AnalysisJobDetailView, AsyncEssayAnalysisView, AnalysisCacheStatsView, RegisterView, LoginView, LogoutView, HistoryListView, HistoryDetailView, UploadDocxView
 
 urlpatterns = [
     path('analyze/', EssayAnalysisView.as_view(), name='analyze-essay'),
+    path('analyze/upload/', UploadAnalysisView.as_view(), name='analyze-upload'),
+    path('analyze/stream/', StreamingEssayAnalysisView.as_view(), name='analyze-essay-stream'),
+    path('analyze/batch/', BatchEssayAnalysisView.as_view(), name='analyze-essay-batch'),
+    path('analyze/jobs/', AnalysisJobListView.as_view(), name='analyze-job-list'),
+    path('analyze/jobs/<int:job_id>/', AnalysisJobDetailView.as_view(), name='analyze-job-detail'),
+    path('analyze/async/', AsyncEssayAnalysisView.as_view(), name='analyze-essay-async'),
+    path('analyze/cache-stats/', AnalysisCacheStatsView.as_view(), name='analyze-cache-stats'),
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/login/', LoginView.as_view(), name='login'),
     path('auth/logout/', LogoutView.as_view(), name='logout'),
     path('history/', HistoryListView.as_view(), name='history-list'),
+    path('history/<int:history_id>/', HistoryDetailView.as_view(), name='history-detail'),
     path('upload-docx', UploadDocxView.as_view(), name='upload-docx'),  # no trailing slash to match frontend
 ]
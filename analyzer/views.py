@@ -1,42 +1,93 @@
 # analyzer/views.py
 
+import hmac
 import os
-import google.generativeai as genai
+import json
+import math
+import time
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import get_user_model, authenticate
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.authtoken.models import Token
-from .models import History
-from payments.models import Wallet
-from zipfile import ZipFile
+from .models import History, AnalysisJob, decompress_text
+from .jobs import enqueue
+from .longpoll import parse_wait
+from .analysis import history_fields, analyze_essay, analyze_essay_async, analyze_essay_chunked, analyze_many, stream_analysis
+from .cache import result_cache
+from .metrics import render as render_metrics, span
+from .authentication import CachedTokenAuthentication, token_cache
+from .routers import reads_from_replica
+from .ratelimit import RateLimited, get_rate_limiter
+from .stylometry import prescreen_stats
+from .gemini import GeminiUnavailable, get_client
+from .scheduler import BATCH
+from .pagination import InvalidCursor, after_cursor, paginate, parse_bound
+from .extractors import EXTRACTORS, extract_docx_text, extract_upload_text
+from payments.ledger import InsufficientCredits, commit, release, reserve
 from io import BytesIO
-import xml.etree.ElementTree as ET
 
-# Load environment variables (for the API key)
+# Load environment variables (for the API key, read by analyzer.gemini)
 load_dotenv()
 
-# Configure the Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+def insufficient_credits_response(response_class=Response, **extra):
+    return response_class(
+        {"error": "Insufficient credits. Please purchase credits to analyze.", "code": "INSUFFICIENT_CREDITS", **extra},
+        status=402
+    )
+
+def record_analysis(user, hold, essay_text, analysis_result, breakdown=None) -> History:
+    """Save the History row and consume the held credit together."""
+    with transaction.atomic():
+        with span('history'):
+            history = History.objects.create(
+                user=user,
+                essay_text=essay_text,
+                **history_fields(analysis_result),
+                breakdown=breakdown or None,
+            )
+        commit(hold)
+    return history
+
+def gemini_unavailable_response(error: GeminiUnavailable, response_class=Response):
+    response = response_class(
+        {"error": "The analysis service is temporarily unavailable. Please try again shortly.",
+         "code": "GEMINI_UNAVAILABLE", "details": str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = str(int(error.retry_after + 0.5))
+    return response
+
+def rate_limited_response(error: RateLimited, response_class=Response):
+    response = response_class(
+        {"error": "Too many analysis requests. Please slow down.", "code": "RATE_LIMITED", "details": str(error)},
+        status=status.HTTP_429_TOO_MANY_REQUESTS
+    )
+    response['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
 
 class EssayAnalysisView(APIView):
     """
     An API View to analyze an essay for AI-generated content using the Gemini API.
     Requires authentication and stores the result in the user's history.
+    Send "mode": "chunked" to score long essays paragraph segment by segment in parallel.
     """
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
         essay_text = request.data.get('essay', '')
 
-        # Require at least 1 credit
-        wallet, _ = Wallet.objects.get_or_create(user=request.user)
-        if wallet.balance <= 0:
-            return Response({"error": "Insufficient credits. Please purchase credits to analyze.", "code": "INSUFFICIENT_CREDITS"}, status=402)
-
         # print(f"reuest header: f{request.data}")
 
         if not essay_text:
@@ -45,57 +96,387 @@ class EssayAnalysisView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        mode = request.data.get('mode', 'single')
+        if mode not in ('single', 'chunked'):
+            return Response({"error": "'mode' must be 'single' or 'chunked'."}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            # Initialize the Gemini Model
-            model = genai.GenerativeModel('models/gemini-flash-latest')
-
-            # This is the crucial part: The prompt engineering.
-            # We ask the model to act as an expert and analyze the text based on specific criteria.
-            prompt = f"""
-            Analyze the following essay to determine the likelihood that it was written by an AI.
-            Provide your response as a JSON object with two keys: 'ai_probability' and 'reasoning'.
-            - 'ai_probability': A float value between 0.0 (definitely human) and 1.0 (definitely AI).
-            - 'reasoning': A brief explanation for your score, considering factors like perplexity (predictability of text), burstiness (variation in sentence structure), and linguistic patterns.
-
-            Essay to analyze:
-            ---
-            {essay_text}
-            ---
-            """
-
-            # Get the response from the model
-            response = model.generate_content(prompt)
-            
-            # The API returns a response that may contain markdown for JSON. 
-            # We need to clean it up to parse it correctly.
-            # Example response text: ```json\n{"key": "value"}\n```
-            cleaned_json_str = response.text.replace('```json', '').replace('```', '').strip()
-
-            # Convert the cleaned string to a Python dictionary
-            import json
-            analysis_result = json.loads(cleaned_json_str)
-
-            # Persist to history
-            History.objects.create(
-                user=request.user,
-                essay_text=essay_text,
-                ai_probability=float(analysis_result.get("ai_probability", 0.0)),
-                reasoning=str(analysis_result.get("reasoning", "")),
-            )
-            
-            # Consume 1 credit on successful analysis
-            wallet.balance = max(0, wallet.balance - 1)
-            wallet.save(update_fields=['balance'])
+            with get_rate_limiter().limit(request.user.pk):
+                # Hold 1 credit for the duration of the analysis (no lock is held meanwhile)
+                try:
+                    hold = reserve(request.user, reference='analyze')
+                except InsufficientCredits:
+                    return insufficient_credits_response()
+                return self.analyze(request, hold, essay_text, mode)
+        except RateLimited as e:
+            return rate_limited_response(e)
+
+    def analyze(self, request, hold, essay_text, mode, **extra):
+        """Run the pipeline, record History, consume the held credit; `extra` is merged into the response."""
+        try:
+            breakdown = None
+            if mode == 'chunked':
+                # Long essays: score paragraph segments in parallel
+                analysis_result, cached, breakdown = analyze_essay_chunked(essay_text)
+            else:
+                # Repeated essays are answered from the result cache without calling Gemini
+                analysis_result, cached = analyze_essay(essay_text)
 
-            return Response({"success": True, "results": analysis_result}, status=status.HTTP_200_OK)
+            # Persist to history and consume the credit
+            history = record_analysis(request.user, hold, essay_text, analysis_result, breakdown)
 
+            data = {"success": True, "results": analysis_result, "cached": cached, "history_id": history.id, **extra}
+            if breakdown:
+                data["breakdown"] = breakdown
+            return Response(data, status=status.HTTP_200_OK)
+
+        except GeminiUnavailable as e:
+            # Circuit breaker is open: fail fast and tell the client when to come back
+            release(hold)
+            return gemini_unavailable_response(e)
         except Exception as e:
             # Handle potential errors from the API or JSON parsing
+            release(hold)
             return Response(
                 {"error": "An error occurred during analysis.", "details": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class UploadAnalysisView(EssayAnalysisView):
+    """
+    Upload a .docx/.pdf and analyze it in one request (form fields: file, mode).
+    Send async=true to queue it instead: 202 {"job_id": ...}, as analyze/jobs/.
+    """
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"error": "No file uploaded. Expected form field 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+        extension = os.path.splitext(upload.name or '')[1].lower()
+        if extension not in EXTRACTORS:
+            return Response({"error": "Only .docx and .pdf files are supported."}, status=status.HTTP_400_BAD_REQUEST)
+        mode = request.data.get('mode', 'single')
+        if mode not in ('single', 'chunked'):
+            return Response({"error": "'mode' must be 'single' or 'chunked'."}, status=status.HTTP_400_BAD_REQUEST)
+        run_async = str(request.data.get('async', '')).lower() in ('1', 'true', 'yes')
+
+        try:
+            with get_rate_limiter().limit(request.user.pk):
+                return self._extract_and_analyze(request, upload, extension, mode, run_async)
+        except RateLimited as e:
+            return rate_limited_response(e)
+
+    def _extract_and_analyze(self, request, upload, extension, mode, run_async):
+        # Reserve the credit before spending time on extraction
+        try:
+            hold = reserve(request.user, reference='upload')
+        except InsufficientCredits:
+            return insufficient_credits_response()
+
+        try:
+            essay_text = extract_upload_text(upload)
+        except Exception as e:
+            release(hold)
+            return Response({"error": f"Failed to read {extension} file.", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not essay_text:
+            release(hold)
+            return Response({"error": "No text found in the uploaded file."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if run_async:
+            job = enqueue(request.user, essay_text, hold=hold, mode=mode)
+            return Response({"job_id": job.id, "status": job.status, "characters": len(essay_text)}, status=status.HTTP_202_ACCEPTED)
+        return self.analyze(request, hold, essay_text, mode, characters=len(essay_text))
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _iterate_in_thread(events):
+    """Async iterator over a sync generator, advancing it one event at a time in the request's worker thread."""
+    next_event = sync_to_async(next)
+    done = object()
+    try:
+        while (event := await next_event(events, done)) is not done:
+            yield event
+    finally:
+        # Also runs on client disconnect, so the generator's own cleanup happens
+        await sync_to_async(events.close)()
+
+def streaming_body(request, events):
+    """
+    The response body for `events` on the server in use. Under ASGI, Django
+    reads a sync iterator to the end (sync_to_async(list)) before sending
+    anything, so it is handed an async iterator there instead.
+    """
+    if isinstance(request._request, ASGIRequest):
+        return _iterate_in_thread(events)
+    return events
+
+class StreamingEssayAnalysisView(APIView):
+    """
+    Streaming variant of EssayAnalysisView over Server-Sent Events.
+    Emits `reasoning` events with partial text as Gemini generates it, then one
+    `result` event with the parsed analysis (or an `error` event). History is
+    written and the held credit consumed only after the full reply has been parsed.
+    Streams under both WSGI and ASGI (see streaming_body).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        essay_text = request.data.get('essay', '')
+        if not essay_text:
+            return Response({"error": "Essay text is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The in-flight slot is held until the stream ends (or its lease expires)
+        limiter = get_rate_limiter()
+        try:
+            slot = limiter.acquire(request.user.pk)
+        except RateLimited as e:
+            return rate_limited_response(e)
+        try:
+            hold = reserve(request.user, reference='stream')
+        except InsufficientCredits:
+            limiter.release(slot)
+            return insufficient_credits_response()
+
+        response = StreamingHttpResponse(
+            streaming_body(request, self._events(request.user, hold, essay_text, slot)), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # let nginx pass events through as they are written
+        return response
+
+    @staticmethod
+    def _events(user, hold, essay_text, slot=None):
+        try:
+            for kind, payload in stream_analysis(essay_text):
+                if kind == "reasoning":
+                    yield sse_event("reasoning", {"text": payload})
+                    continue
+
+                analysis_result, cached = payload
+                record_analysis(user, hold, essay_text, analysis_result)
+                yield sse_event("result", {"success": True, "results": analysis_result, "cached": cached})
+        except Exception as e:
+            yield sse_event("error", {"error": "An error occurred during analysis.", "details": str(e)})
+        finally:
+            # Errors and client disconnects give the credit back (a no-op once committed)
+            release(hold)
+            get_rate_limiter().release(slot)
+
+class BatchEssayAnalysisView(APIView):
+    """
+    Analyze a list of essays in one request: {"essays": ["...", "..."]}.
+    Credits for the whole batch are reserved up front in one hold, Gemini calls fan
+    out with ANALYSIS_BATCH_CONCURRENCY in flight, and the hold is committed for the
+    items that succeeded (failed items are returned). Returns one result or error per essay, in order.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        essays = request.data.get('essays')
+        if not isinstance(essays, list) or not essays:
+            return Response({"error": "'essays' must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(essays) > settings.ANALYSIS_BATCH_MAX_SIZE:
+            return Response(
+                {"error": f"At most {settings.ANALYSIS_BATCH_MAX_SIZE} essays per batch."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        items = [{"index": i} for i in range(len(essays))]
+        pending = []  # indexes of essays that will be analyzed (and charged)
+        for i, essay_text in enumerate(essays):
+            if isinstance(essay_text, str) and essay_text.strip():
+                pending.append(i)
+            else:
+                items[i].update(success=False, error="Essay text is required.")
+
+        if not pending:
+            return Response({"success": True, "charged": 0, "results": items}, status=status.HTTP_200_OK)
+        # One token per essay (capped at the burst) and a single in-flight slot for the whole batch
+        try:
+            with get_rate_limiter().limit(request.user.pk, cost=len(pending)):
+                return self._analyze_batch(request, essays, items, pending)
+        except RateLimited as e:
+            return rate_limited_response(e)
+
+    def _analyze_batch(self, request, essays, items, pending):
+        try:
+            hold = reserve(request.user, amount=len(pending), reference='batch')
+        except InsufficientCredits as e:
+            return insufficient_credits_response(required=e.required, balance=e.balance)
+
+        try:
+            outcomes = analyze_many([essays[i] for i in pending], settings.ANALYSIS_BATCH_CONCURRENCY, priority=BATCH)
+        except Exception:
+            release(hold)
+            raise
+
+        rows = []
+        for i, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                items[i].update(success=False, error="An error occurred during analysis.", details=str(outcome))
+                continue
+            analysis_result, cached = outcome
+            items[i].update(success=True, results=analysis_result, cached=cached)
+            rows.append(History(
+                user=request.user,
+                essay_text=essays[i],
+                **history_fields(analysis_result),
+            ))
+        # Charge the items that succeeded; the rest of the hold goes back to the wallet
+        with transaction.atomic():
+            History.objects.bulk_create(rows)
+            commit(hold, used=len(rows))
+
+        return Response({"success": True, "charged": len(rows), "results": items}, status=status.HTTP_200_OK)
+
+class AnalysisJobListView(APIView):
+    """
+    Queue an essay for background analysis: {"essay": "...", "mode": "single"|"chunked"} -> 202 {"job_id": ...}.
+    The credit is taken at submission and refunded if the job finally fails.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        essay_text = request.data.get('essay', '')
+        if not essay_text:
+            return Response({"error": "Essay text is required."}, status=status.HTTP_400_BAD_REQUEST)
+        mode = request.data.get('mode', 'single')
+        if mode not in ('single', 'chunked'):
+            return Response({"error": "'mode' must be 'single' or 'chunked'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with get_rate_limiter().limit(request.user.pk):
+                job = enqueue(request.user, essay_text, mode=mode)
+        except RateLimited as e:
+            return rate_limited_response(e)
+        except InsufficientCredits:
+            return insufficient_credits_response()
+        return Response({"job_id": job.id, "status": job.status}, status=status.HTTP_202_ACCEPTED)
+
+class AnalysisJobDetailView(APIView):
+    """
+    Status of a queued analysis. Pass ?wait=<seconds> to long-poll until the job
+    finishes (capped at ANALYSIS_JOB_MAX_WAIT).
+    """
+    permission_classes = [IsAuthenticated]
+    poll_interval = 0.5
+
+    def get(self, request, job_id):
+        try:
+            wait = parse_wait(request.query_params.get("wait"), settings.ANALYSIS_JOB_MAX_WAIT)
+        except ValueError:
+            return Response({"error": "'wait' must be a finite number of seconds."}, status=status.HTTP_400_BAD_REQUEST)
+        deadline = time.monotonic() + wait
+        jobs = AnalysisJob.objects.select_related("history").filter(user=request.user)
+        while True:
+            job = jobs.filter(pk=job_id).first()
+            if job is None:
+                return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+            if job.status in ('SUCCESS', 'FAILED') or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+
+        data = {"job_id": job.id, "status": job.status, "attempts": job.attempts}
+        if job.status == 'SUCCESS' and job.history:
+            data["history_id"] = job.history.id
+            history = job.history
+            data["results"] = {
+                "ai_probability": history.ai_probability,
+                "reasoning": history.reasoning,
+                "usage": {
+                    "model": history.model_name,
+                    "prompt_tokens": history.prompt_tokens,
+                    "response_tokens": history.response_tokens,
+                    "truncated": history.prompt_truncated,
+                },
+            }
+            if job.history.breakdown:
+                data["breakdown"] = job.history.breakdown
+        elif job.error:
+            data["error"] = job.error
+        return Response(data, status=status.HTTP_200_OK)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncEssayAnalysisView(View):
+    """
+    Async twin of EssayAnalysisView for ASGI deployments (aiAnalyzerGemini.asgi).
+    The Gemini call is awaited instead of blocking a worker thread, so one process
+    can keep many analyses in flight. Token authentication only.
+    """
+    authenticator = CachedTokenAuthentication()
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            auth = await sync_to_async(self.authenticator.authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if auth is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+        user = auth[0]
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = request.POST
+        essay_text = data.get('essay', '')
+
+        if not essay_text:
+            return JsonResponse({"error": "Essay text is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        limiter = get_rate_limiter()
+        try:
+            slot = await sync_to_async(limiter.acquire)(user.pk)
+        except RateLimited as e:
+            return rate_limited_response(e, response_class=JsonResponse)
+        try:
+            return await self._analyze(user, essay_text)
+        finally:
+            await sync_to_async(limiter.release)(slot)
+
+    async def _analyze(self, user, essay_text):
+        try:
+            hold = await sync_to_async(reserve)(user, reference='async')
+        except InsufficientCredits:
+            return insufficient_credits_response(response_class=JsonResponse)
+
+        try:
+            analysis_result, cached = await analyze_essay_async(essay_text)
+            await sync_to_async(record_analysis)(user, hold, essay_text, analysis_result)
+            return JsonResponse({"success": True, "results": analysis_result, "cached": cached}, status=status.HTTP_200_OK)
+
+        except GeminiUnavailable as e:
+            await sync_to_async(release)(hold)
+            return gemini_unavailable_response(e, response_class=JsonResponse)
+        except Exception as e:
+            await sync_to_async(release)(hold)
+            return JsonResponse(
+                {"error": "An error occurred during analysis.", "details": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class MetricsView(View):
+    """Prometheus scrape endpoint (text format). Requires the METRICS_TOKEN bearer token; 404 until one is set."""
+
+    def get(self, request):
+        if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+            return HttpResponse(status=404)
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+            return HttpResponse(status=401)
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class AnalysisCacheStatsView(APIView):
+    """Counters of this worker: result cache, pre-screen, token auth cache and Gemini scheduler (staff only)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {**result_cache.stats(), "prescreen": prescreen_stats.as_dict(), "auth": token_cache.stats(),
+             "gemini": get_client().scheduler.stats()},
+            status=status.HTTP_200_OK
+        )
+
 class RegisterView(APIView):
     """Register a new user and return an auth token."""
     @transaction.atomic
@@ -136,65 +517,86 @@ class LogoutView(APIView):
             request.auth.delete()
         except Exception:
             pass
+        if request.auth is not None:
+            token_cache.invalidate(request.auth.key)
         return Response({"success": True}, status=status.HTTP_200_OK)
 
 class HistoryListView(APIView):
-    """List the authenticated user's history."""
+    """
+    List the authenticated user's history, newest first, one page at a time.
+    Query params: limit, cursor (the previous page's next_cursor), since/until
+    (ISO date or datetime; until is exclusive, a bare date includes that day),
+    min_prob/max_prob, include_text=1.
+    """
     permission_classes = [IsAuthenticated]
 
+    @reads_from_replica
     def get(self, request):
-        items = History.objects.filter(user=request.user).values(
-            "id", "ai_probability", "reasoning", "created_at"
-        )
+        params = request.query_params
+        try:
+            limit = min(int(params.get("limit") or settings.HISTORY_PAGE_SIZE), settings.HISTORY_MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("'limit' must be positive.")
+            items = History.objects.filter(user=request.user)
+            if params.get("cursor"):
+                items = items.filter(after_cursor(params["cursor"]))
+            if params.get("since"):
+                items = items.filter(created_at__gte=parse_bound(params["since"]))
+            if params.get("until"):
+                items = items.filter(created_at__lt=parse_bound(params["until"], end_of_day=True))
+            if params.get("min_prob"):
+                items = items.filter(ai_probability__gte=float(params["min_prob"]))
+            if params.get("max_prob"):
+                items = items.filter(ai_probability__lte=float(params["max_prob"]))
+        except InvalidCursor as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": "Invalid query parameter.", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = ["id", "ai_probability", "reasoning", "created_at"]
         # For privacy, don't return essay_text by default; toggle via query if needed
-        include_text = request.query_params.get("include_text") == "1"
+        include_text = params.get("include_text") == "1"
         if include_text:
-            items = History.objects.filter(user=request.user).values(
-                "id", "essay_text", "ai_probability", "reasoning", "created_at"
-            )
-        return Response({"results": list(items)}, status=status.HTTP_200_OK)
+            fields.append("essay__data")
+        results, next_cursor = paginate(items.values(*fields), limit)
+        if include_text:
+            for row in results:
+                row["essay_text"] = decompress_text(row.pop("essay__data"))
+        return Response({"results": results, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+
+class HistoryDetailView(APIView):
+    """One history entry of the authenticated user, including the essay text."""
+    permission_classes = [IsAuthenticated]
+
+    @reads_from_replica
+    def get(self, request, history_id):
+        item = History.objects.filter(user=request.user, pk=history_id).values(
+            "id", "essay__data", "ai_probability", "reasoning", "breakdown", "scored_locally", "created_at"
+        ).first()
+        if item is None:
+            return Response({"error": "History entry not found."}, status=status.HTTP_404_NOT_FOUND)
+        item["essay_text"] = decompress_text(item.pop("essay__data"))
+        return Response(item, status=status.HTTP_200_OK)
 
 class UploadDocxView(APIView):
-    """Accept a .docx upload and return extracted plain text."""
+    """Accept a .docx or .pdf upload and return extracted plain text."""
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         upload = request.FILES.get('file')
         if not upload:
             return Response({"error": "No file uploaded. Expected form field 'file'."}, status=status.HTTP_400_BAD_REQUEST)
-        filename = getattr(upload, 'name', '') or ''
-        if not filename.lower().endswith('.docx'):
-            return Response({"error": "Only .docx files are supported."}, status=status.HTTP_400_BAD_REQUEST)
+        extension = os.path.splitext(getattr(upload, 'name', '') or '')[1].lower()
+        if extension not in EXTRACTORS:
+            return Response({"error": "Only .docx and .pdf files are supported."}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            data = upload.read()
-            text = self._extract_docx_text(data)
+            # Read straight from the uploaded file (spooled to disk when large) instead of copying it
+            text = extract_upload_text(upload)
             return Response({"success": True, "text": text}, status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({"error": "Failed to read .docx file.", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": f"Failed to read {extension} file.", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     @staticmethod
     def _extract_docx_text(blob: bytes) -> str:
-        """
-        Minimal .docx text extractor with no external deps:
-        - Opens the OOXML zip
-        - Reads word/document.xml
-        - Concatenates text from w:t nodes with basic paragraph separation
-        """
-        with ZipFile(BytesIO(blob)) as zf:
-            with zf.open('word/document.xml') as doc_xml:
-                xml_bytes = doc_xml.read()
-        # Parse XML
-        # The XML uses namespaces; we need to map w: prefix
-        ns = {
-            'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-        }
-        root = ET.fromstring(xml_bytes)
-        parts = []
-        for para in root.findall('.//w:p', ns):
-            runs = []
-            for t in para.findall('.//w:t', ns):
-                if t.text:
-                    runs.append(t.text)
-            if runs:
-                parts.append(''.join(runs))
-        return '\n\n'.join(parts).strip()
+        """Extract text from in-memory .docx bytes (see analyzer.extractors.extract_docx_text)."""
+        return extract_docx_text(BytesIO(blob))
@@ -0,0 +1,107 @@
+# payments/callbacks.py
+"""
+Applying M-Pesa results to PaymentTransaction, exactly once.
+
+The callback view appends to the MpesaCallback inbox and returns at once;
+process_pending() (run by manage.py process_mpesa_callbacks) applies the
+inbox in arrival order. settle_transaction() only moves a PENDING transaction,
+so a transaction is credited at most once whichever path settles it.
+"""
+
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .ledger import credit
+from .models import MpesaCallback, PaymentTransaction
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCallback(ValueError):
+    pass
+
+
+def parse_callback(data) -> tuple[str, int]:
+    """Return (CheckoutRequestID, ResultCode) from a Daraja STK callback body."""
+    try:
+        stk_callback = data['Body']['stkCallback']
+        return str(stk_callback['CheckoutRequestID']), int(stk_callback['ResultCode'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidCallback(f"Malformed STK callback: {e!r}") from e
+
+
+def settle_transaction(checkout_request_id: str, result_code: int, result_desc: str = None):
+    """
+    Mark the PENDING transaction SUCCESS (crediting the wallet) or FAILED.
+    Returns the settled transaction, or None if none was pending under that id.
+    """
+    new_status = 'SUCCESS' if result_code == 0 else 'FAILED'
+    with transaction.atomic():
+        settled = PaymentTransaction.objects.filter(checkout_request_id=checkout_request_id, status='PENDING').update(
+            status=new_status, result_code=result_code, result_desc=result_desc, updated_at=timezone.now(),
+        )
+        if not settled:
+            return None
+        txn = PaymentTransaction.objects.select_related('user').get(checkout_request_id=checkout_request_id)
+        if new_status == 'SUCCESS':
+            credit(txn.user, txn.credits, 'PURCHASE', reference=f'payment:{txn.pk}')
+    return txn
+
+
+def _defer(callback: MpesaCallback, now) -> None:
+    """
+    Push an unknown callback back, counting the deferral as an attempt. The
+    remaining attempts are spread over what is left of the grace period, so the
+    last one comes after it and settles the entry as unknown.
+    """
+    grace_ends = callback.received_at + timedelta(seconds=settings.MPESA_CALLBACK_UNKNOWN_GRACE)
+    attempts_left = max(1, settings.MPESA_CALLBACK_MAX_ATTEMPTS - 1 - callback.attempts)
+    MpesaCallback.objects.filter(pk=callback.pk, processed_at=None).update(
+        attempts=F('attempts') + 1,
+        next_attempt_at=now + (grace_ends - now) / attempts_left,
+        error='Unknown CheckoutRequestID (waiting for the STK push to be recorded)',
+    )
+
+
+def apply_callback(callback: MpesaCallback) -> bool:
+    """Apply one inbox entry; returns False if it was deferred or already applied."""
+    stk_callback = callback.payload['Body']['stkCallback']
+    now = timezone.now()
+    with transaction.atomic():
+        known = PaymentTransaction.objects.filter(checkout_request_id=callback.checkout_request_id).exists()
+        if not known and now - callback.received_at < timedelta(seconds=settings.MPESA_CALLBACK_UNKNOWN_GRACE):
+            # The STK push response (which records the id) may not have been saved yet. Deferring moves
+            # the entry out of the next batches, so a flood of unknown ids can't starve real callbacks.
+            _defer(callback, now)
+            return False
+        # Claim the entry in the same transaction, so a second worker can't apply it too
+        if not MpesaCallback.objects.filter(pk=callback.pk, processed_at=None).update(
+            processed_at=now, attempts=F('attempts') + 1,
+            error=None if known else 'Unknown CheckoutRequestID',
+        ):
+            return False
+        if known and settle_transaction(callback.checkout_request_id, callback.result_code, stk_callback.get('ResultDesc')) is None:
+            logger.info("Callback %s: transaction already settled", callback.checkout_request_id)
+    return True
+
+
+def process_pending(limit: int) -> int:
+    """Apply up to `limit` due callbacks, oldest first; returns how many were applied."""
+    pending = MpesaCallback.objects.filter(
+        processed_at=None, attempts__lt=settings.MPESA_CALLBACK_MAX_ATTEMPTS, next_attempt_at__lte=timezone.now(),
+    )
+    applied = 0
+    for callback in pending.order_by('id')[:limit]:
+        try:
+            applied += apply_callback(callback)
+        except Exception as e:
+            # Retried with backoff; left unprocessed (with the error) once it runs out of attempts
+            logger.exception("Applying M-Pesa callback %s failed", callback.checkout_request_id)
+            MpesaCallback.objects.filter(pk=callback.pk).update(
+                attempts=F('attempts') + 1, error=str(e),
+                next_attempt_at=timezone.now() + timedelta(seconds=2 ** callback.attempts),
+            )
+    return applied
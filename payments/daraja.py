@@ -0,0 +1,168 @@
+# payments/daraja.py
+"""
+Safaricom Daraja (M-Pesa) API client shared by every payment path.
+
+- One pooled requests.Session: connections to Daraja are kept alive between
+  calls instead of a new TCP/TLS handshake per request. Connection failures are
+  retried; GETs (the OAuth call) are also retried on 429/5xx, POSTs are not
+  because an STK push must not be sent twice.
+- OAuth access tokens are cached until MPESA_TOKEN_SKEW seconds before they
+  expire. Concurrent refreshes collapse into a single request (single flight).
+- MPESA_BASE_URL points the client at the sandbox, production or a local stub
+  (payments.daraja_stub) for tests and load tests.
+"""
+
+import base64
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from analyzer.metrics import span
+
+
+class DarajaError(Exception):
+    pass
+
+
+def mpesa_password(short_code: str, passkey: str, timestamp: str) -> str:
+    data = f"{short_code}{passkey}{timestamp}"
+    return base64.b64encode(data.encode()).decode()
+
+
+def build_session(pool_size: int, retries: int) -> requests.Session:
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET'}),  # read/status retries only for idempotent calls
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class TokenManager:
+    """Caches one OAuth access token; refreshes it at most once at a time."""
+
+    def __init__(self, fetch, skew: float):
+        self._fetch = fetch  # () -> (token, expires_in_seconds)
+        self.skew = skew
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self.refreshes = 0
+
+    def _valid(self):
+        return self._token if time.monotonic() < self._expires_at - self.skew else None
+
+    def get(self) -> str:
+        token = self._valid()
+        if token:
+            return token
+        with self._lock:
+            # Whoever waited on the lock finds the token the first caller fetched
+            token = self._valid()
+            if token:
+                return token
+            token, expires_in = self._fetch()
+            self._token, self._expires_at = token, time.monotonic() + expires_in
+            self.refreshes += 1
+            return token
+
+    def invalidate(self, token: str) -> None:
+        """Drop `token` (e.g. after a 401) unless it has already been replaced."""
+        with self._lock:
+            if self._token == token:
+                self._token, self._expires_at = None, 0.0
+
+
+class DarajaClient:
+    def __init__(self, base_url: str, session: requests.Session, timeout: float, token_skew: float,
+                 consumer_key=None, consumer_secret=None, basic_auth=None, static_token=None):
+        self.base_url = base_url.rstrip('/')
+        self.session = session
+        self.timeout = timeout
+        self._consumer = (consumer_key, consumer_secret) if consumer_key and consumer_secret else None
+        self._basic_auth = basic_auth
+        self._static_token = static_token
+        self.tokens = TokenManager(self._fetch_token, token_skew)
+
+    def _fetch_token(self):
+        if self._basic_auth:
+            auth, headers = None, {'Authorization': f'Basic {self._basic_auth}'}
+        elif self._consumer:
+            auth, headers = self._consumer, {}
+        else:
+            raise DarajaError('MPESA credentials missing. Provide MPESA_BEARER_TOKEN or MPESA_BASIC_AUTH or CONSUMER_KEY/SECRET')
+        with span('mpesa.oauth'):
+            resp = self.session.get(f'{self.base_url}/oauth/v1/generate', params={'grant_type': 'client_credentials'},
+                                    auth=auth, headers=headers, timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        return data['access_token'], float(data.get('expires_in') or 3599)
+
+    def access_token(self) -> str:
+        return self._static_token or self.tokens.get()
+
+    def post(self, path: str, payload: dict) -> requests.Response:
+        """POST with the cached bearer token; a 401 refreshes the token and retries once."""
+        for attempt in range(2):
+            token = self.access_token()
+            resp = self.session.post(f'{self.base_url}{path}', json=payload, timeout=self.timeout,
+                                     headers={'Authorization': f'Bearer {token}'})
+            if resp.status_code != 401 or self._static_token or attempt:
+                return resp
+            self.tokens.invalidate(token)
+        return resp
+
+    def stk_push(self, payload: dict) -> requests.Response:
+        with span('mpesa.stk_push'):
+            return self.post('/mpesa/stkpush/v1/processrequest', payload)
+
+    def stk_query(self, payload: dict) -> requests.Response:
+        with span('mpesa.stk_query'):
+            return self.post('/mpesa/stkpushquery/v1/query', payload)
+
+
+def build_client() -> DarajaClient:
+    return DarajaClient(
+        base_url=settings.MPESA_BASE_URL,
+        session=build_session(settings.MPESA_POOL_SIZE, settings.MPESA_RETRIES),
+        timeout=settings.MPESA_TIMEOUT,
+        token_skew=settings.MPESA_TOKEN_SKEW,
+        consumer_key=os.getenv('MPESA_CONSUMER_KEY'),
+        consumer_secret=os.getenv('MPESA_CONSUMER_SECRET'),
+        basic_auth=os.getenv('MPESA_BASIC_AUTH'),
+        static_token=os.getenv('MPESA_BEARER_TOKEN'),
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_daraja() -> DarajaClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_client()
+    return _client
+
+
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    global _client
+    if setting.startswith('MPESA_'):
+        _client = None
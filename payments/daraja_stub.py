@@ -0,0 +1,129 @@
+# payments/daraja_stub.py
+"""
+Local stand-in for the Daraja API, for tests and load tests:
+
+    with DarajaStub(latency=0.05) as stub:
+        with override_settings(MPESA_BASE_URL=stub.url): ...
+
+Implements the OAuth, STK push and STK query endpoints with configurable latency and
+counts requests and TCP connections, so token caching and connection reuse
+can be asserted. Also runnable on its own: manage.py run_daraja_stub.
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    # Headers and body go out in separate writes; with Nagle on, the client's delayed ACK adds ~40 ms to each
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stub.record('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        stub = self.server.stub
+        if urlparse(self.path).path != '/oauth/v1/generate':
+            return self._send(404, {"errorMessage": "Not found"})
+        stub.record('oauth')
+        time.sleep(stub.latency)
+        self._send(200, {"access_token": stub.issue_token(), "expires_in": str(stub.expires_in)})
+
+    def do_POST(self):
+        stub = self.server.stub
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if self.headers.get('Authorization') != f'Bearer {stub.token}':
+            return self._send(401, {"errorCode": "404.001.03", "errorMessage": "Invalid Access Token"})
+        time.sleep(stub.latency)
+        if self.path == '/mpesa/stkpush/v1/processrequest':
+            stub.record('stk_push')
+            checkout_id = f"ws_CO_{uuid.uuid4().hex[:20]}"
+            stub.pushes[checkout_id] = payload
+            return self._send(200, {
+                "MerchantRequestID": uuid.uuid4().hex[:12],
+                "CheckoutRequestID": checkout_id,
+                "ResponseCode": "0",
+                "ResponseDescription": "Success. Request accepted for processing",
+                "CustomerMessage": "Success. Request accepted for processing",
+            })
+        if self.path == '/mpesa/stkpushquery/v1/query':
+            stub.record('stk_query')
+            checkout_id = payload.get('CheckoutRequestID')
+            if checkout_id not in stub.results:
+                return self._send(500, {"errorCode": "500.001.1001", "errorMessage": "The transaction is being processed"})
+            code, desc = stub.results[checkout_id]
+            return self._send(200, {
+                "ResponseCode": "0",
+                "ResponseDescription": "The service request has been accepted successsfully",
+                "MerchantRequestID": "stub",
+                "CheckoutRequestID": checkout_id,
+                "ResultCode": str(code),
+                "ResultDesc": desc,
+            })
+        self._send(404, {"errorMessage": "Not found"})
+
+
+class DarajaStub:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, expires_in: int = 3599):
+        self.latency = latency
+        self.expires_in = expires_in
+        self.token = None
+        self.pushes = {}  # CheckoutRequestID -> STK push payload
+        self.results = {}  # CheckoutRequestID -> (ResultCode, ResultDesc); absent = still processing
+        self.counts = {'connections': 0, 'oauth': 0, 'stk_push': 0, 'stk_query': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def complete(self, checkout_request_id: str, result_code: int = 0, result_desc: str = None) -> None:
+        """Finish a push as the customer would (0 = paid); later queries report it."""
+        self.results[checkout_request_id] = (
+            result_code, result_desc or ("The service request is processed successfully." if result_code == 0
+                                         else "Request cancelled by user"))
+
+    def issue_token(self) -> str:
+        self.token = uuid.uuid4().hex
+        return self.token
+
+    def start(self) -> 'DarajaStub':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,142 @@
+# payments/ledger.py
+"""
+Credit ledger: every change to a wallet is an append-only LedgerEntry, and
+Wallet.balance is kept equal to the sum of the user's entries.
+
+Analyses don't hold a lock across the Gemini call. They reserve credits up
+front with a conditional UPDATE (balance >= amount), which either succeeds
+atomically or reports insufficient credits, then commit or release the hold
+when the work is done:
+
+    hold = reserve(user)
+    try:
+        ...call Gemini...
+    except Exception:
+        release(hold)
+        raise
+    commit(hold)
+
+commit() and release() are conditional on the hold still being HELD, so each
+takes effect at most once however often it is called. Committing a hold that
+was already released raises HoldReleased: the work was done but the credits
+went back to the wallet, which must not pass silently.
+
+Balances are read through a per-user cache (cached_balance); every write here
+invalidates it once the transaction commits. The invalidation only reaches
+other processes through a shared cache backend, so WALLET_CACHE_TTL defaults
+to 0 (no caching) otherwise.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from analyzer.metrics import span
+from .models import CreditHold, LedgerEntry, Wallet
+
+
+class InsufficientCredits(Exception):
+    def __init__(self, required: int = 1, balance: int = 0):
+        super().__init__(f"{required} credit(s) required, {balance} available.")
+        self.required = required
+        self.balance = balance
+
+
+class HoldReleased(Exception):
+    """commit() was called on a hold whose credits were already returned to the wallet."""
+
+    def __init__(self, hold: CreditHold):
+        super().__init__(f"Credit hold {hold.pk} was released before it could be committed.")
+        self.hold = hold
+
+
+def _balance_key(user_id: int) -> str:
+    return f"wallet-balance:{user_id}"
+
+
+def cached_balance(user_id: int) -> int:
+    """The user's balance, from the cache when possible; never writes to the database."""
+    if not settings.WALLET_CACHE_TTL:
+        return Wallet.objects.filter(user_id=user_id).values_list('balance', flat=True).first() or 0
+    key = _balance_key(user_id)
+    balance = cache.get(key)
+    if balance is None:
+        balance = Wallet.objects.filter(user_id=user_id).values_list('balance', flat=True).first() or 0
+        cache.set(key, balance, settings.WALLET_CACHE_TTL)
+    return balance
+
+
+def invalidate_balance(user_id: int) -> None:
+    # After commit, so a concurrent reader can't re-cache the pre-transaction balance
+    transaction.on_commit(lambda: cache.delete(_balance_key(user_id)))
+
+
+def _apply(user_id: int, delta: int, kind: str, hold: CreditHold = None, reference: str = '') -> None:
+    Wallet.objects.filter(user_id=user_id).update(balance=F('balance') + delta)
+    LedgerEntry.objects.create(user_id=user_id, kind=kind, delta=delta, hold=hold, reference=reference)
+    invalidate_balance(user_id)
+
+
+def reserve(user, amount: int = 1, reference: str = '') -> CreditHold:
+    """Take `amount` credits from the wallet into a hold; raises InsufficientCredits."""
+    with span('credits.reserve'), transaction.atomic():
+        Wallet.objects.get_or_create(user=user)
+        if not Wallet.objects.filter(user=user, balance__gte=amount).update(balance=F('balance') - amount):
+            balance = Wallet.objects.filter(user=user).values_list('balance', flat=True).first() or 0
+            raise InsufficientCredits(amount, balance)
+        hold = CreditHold.objects.create(user=user, amount=amount, reference=reference)
+        LedgerEntry.objects.create(user=user, kind='RESERVE', delta=-amount, hold=hold, reference=reference)
+        invalidate_balance(user.pk)
+    return hold
+
+
+def commit(hold: CreditHold, used: int = None) -> bool:
+    """
+    Consume `used` credits of the hold (default: all) and return the rest to the
+    wallet. Returns False if it was already committed; raises HoldReleased if it was released.
+    """
+    used = hold.amount if used is None else max(0, min(used, hold.amount))
+    with span('credits.commit'), transaction.atomic():
+        if not CreditHold.objects.filter(pk=hold.pk, status='HELD').update(status='COMMITTED', used=used):
+            if CreditHold.objects.filter(pk=hold.pk, status='RELEASED').exists():
+                raise HoldReleased(hold)
+            return False
+        if used < hold.amount:
+            _apply(hold.user_id, hold.amount - used, 'RELEASE', hold, hold.reference)
+    hold.status, hold.used = 'COMMITTED', used
+    return True
+
+
+def release(hold: CreditHold) -> bool:
+    """Return all credits of an uncommitted hold to the wallet."""
+    with transaction.atomic():
+        if not CreditHold.objects.filter(pk=hold.pk, status='HELD').update(status='RELEASED'):
+            return False
+        _apply(hold.user_id, hold.amount, 'RELEASE', hold, hold.reference)
+    hold.status = 'RELEASED'
+    return True
+
+
+def credit(user, amount: int, kind: str, reference: str = '') -> None:
+    """Add credits (a purchase or a grant)."""
+    with transaction.atomic():
+        Wallet.objects.get_or_create(user=user)
+        _apply(user.pk, amount, kind, reference=reference)
+
+
+def ledger_balance(user) -> int:
+    return LedgerEntry.objects.filter(user=user).aggregate(total=Sum('delta'))['total'] or 0
+
+
+def release_stale_holds(older_than: timedelta) -> int:
+    """
+    Release holds left HELD by a process that died mid-analysis; returns how many.
+    Holds of queued or running analysis jobs are not stale, however old: the
+    worker commits them, or releases them once the job runs out of attempts.
+    """
+    stale = CreditHold.objects.filter(status='HELD', created_at__lt=timezone.now() - older_than).exclude(
+        job__status__in=['QUEUED', 'RUNNING']
+    )
+    return sum(release(hold) for hold in stale.iterator())
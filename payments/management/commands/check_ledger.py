@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from payments.ledger import release_stale_holds
+from payments.models import LedgerEntry, Wallet
+
+
+class Command(BaseCommand):
+    help = "Check that every wallet balance equals the sum of its ledger entries; optionally release stale holds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--release-stale', type=int, metavar='MINUTES',
+                            help='First release holds still HELD after this many minutes (crashed requests).')
+
+    def handle(self, *args, **opts):
+        if opts['release_stale']:
+            released = release_stale_holds(timedelta(minutes=opts['release_stale']))
+            self.stdout.write(f"released {released} stale holds")
+
+        totals = (
+            LedgerEntry.objects.filter(user_id=OuterRef('user_id'))
+            .values('user_id').annotate(total=Sum('delta')).values('total')
+        )
+        wallets = Wallet.objects.annotate(ledger=Coalesce(Subquery(totals), 0)).select_related('user')
+        mismatched = 0
+        for wallet in wallets.iterator():
+            if wallet.balance != wallet.ledger:
+                mismatched += 1
+                self.stdout.write(f"{wallet.user.username:<24} balance {wallet.balance:>8}  ledger {wallet.ledger:>8}")
+        if mismatched:
+            raise CommandError(f"{mismatched} wallet(s) don't match their ledger.")
+        self.stdout.write("all wallets match their ledger")
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from payments.callbacks import process_pending
+
+
+class Command(BaseCommand):
+    help = "Apply M-Pesa STK callbacks from the MpesaCallback inbox (credits wallets exactly once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='Callbacks applied per pass.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the inbox has nothing to apply.')
+        parser.add_argument('--once', action='store_true', help='Apply what is pending and exit.')
+
+    def handle(self, *args, **opts):
+        try:
+            while True:
+                close_old_connections()
+                applied = process_pending(opts['batch'])
+                if applied:
+                    self.stdout.write(f"Applied {applied} callback(s)")
+                if opts['once'] and applied < opts['batch']:
+                    return
+                if applied < opts['batch']:
+                    time.sleep(opts['poll_interval'])
+        except KeyboardInterrupt:
+            pass
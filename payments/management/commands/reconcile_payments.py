@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from payments.reconcile import reconcile_pending
+
+
+class Command(BaseCommand):
+    help = "Settle PENDING payments whose callback never arrived, using the STK Push Query API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.MPESA_RECONCILE_AFTER,
+                            help='Seconds since the last update before a payment is queried.')
+        parser.add_argument('--batch', type=int, default=settings.MPESA_RECONCILE_BATCH)
+        parser.add_argument('--concurrency', type=int, default=settings.MPESA_RECONCILE_CONCURRENCY,
+                            help='STK queries in flight at once.')
+        parser.add_argument('--interval', type=float, default=30.0, help='Seconds between passes.')
+        parser.add_argument('--once', action='store_true', help='Run until nothing is left to query, then exit.')
+
+    def handle(self, *args, **opts):
+        older_than = timedelta(seconds=opts['older_than'])
+        try:
+            while True:
+                close_old_connections()
+                counts = reconcile_pending(older_than, opts['batch'], opts['concurrency'])
+                if any(counts.values()):
+                    self.stdout.write(f"queried {counts['queried']}, settled {counts['settled']}, "
+                                      f"abandoned {counts['abandoned']}")
+                if counts['queried'] < opts['batch']:
+                    if opts['once']:
+                        return
+                    time.sleep(opts['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from payments.daraja_stub import DarajaStub
+
+
+class Command(BaseCommand):
+    help = "Run a local Daraja API stub; point MPESA_BASE_URL at it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every call.')
+
+    def handle(self, *args, **opts):
+        with DarajaStub(port=opts['port'], latency=opts['latency']) as stub:
+            self.stdout.write(f"Daraja stub listening on {stub.url} (Ctrl+C to stop)")
+            try:
+                while True:
+                    time.sleep(5)
+                    self.stdout.write(f"requests: {stub.counts}")
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField()),
+                ('used', models.PositiveIntegerField(default=0)),
+                ('reference', models.CharField(blank=True, default='', max_length=64)),
+                ('status', models.CharField(choices=[('HELD', 'HELD'), ('COMMITTED', 'COMMITTED'), ('RELEASED', 'RELEASED')], default='HELD', max_length=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('OPENING', 'OPENING'), ('PURCHASE', 'PURCHASE'), ('GRANT', 'GRANT'), ('RESERVE', 'RESERVE'), ('RELEASE', 'RELEASE')], max_length=12)),
+                ('delta', models.IntegerField()),
+                ('reference', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('hold', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='payments.credithold')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='credithold',
+            index=models.Index(fields=['status', 'created_at'], name='payments_cr_status_001c01_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['user', 'created_at'], name='payments_le_user_id_38c09d_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def record_opening_balances(apps, schema_editor):
+    """One OPENING entry per funded wallet, so each balance equals the sum of its ledger."""
+    Wallet = apps.get_model('payments', 'Wallet')
+    LedgerEntry = apps.get_model('payments', 'LedgerEntry')
+    LedgerEntry.objects.bulk_create(
+        (LedgerEntry(user_id=user_id, kind='OPENING', delta=balance)
+         for user_id, balance in Wallet.objects.filter(balance__gt=0).values_list('user_id', 'balance').iterator()),
+        batch_size=500,
+    )
+
+
+def remove_opening_balances(apps, schema_editor):
+    apps.get_model('payments', 'LedgerEntry').objects.filter(kind='OPENING').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_credit_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_opening_balances, remove_opening_balances),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_ledger_opening_balances'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymenttransaction',
+            name='checkout_request_id',
+            field=models.CharField(blank=True, max_length=128, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='MpesaCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(max_length=128, unique=True)),
+                ('result_code', models.IntegerField()),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='payments_mp_process_1f7d6b_idx')],
+            },
+        ),
+    ]
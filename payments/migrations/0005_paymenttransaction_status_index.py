@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_mpesa_callback_inbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paymenttransaction',
+            index=models.Index(fields=['status', 'updated_at'], name='payments_pa_status_5c61d8_idx'),
+        ),
+    ]
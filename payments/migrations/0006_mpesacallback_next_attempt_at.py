@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_paymenttransaction_status_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='mpesacallback',
+            name='payments_mp_process_1f7d6b_idx',
+        ),
+        migrations.AddField(
+            model_name='mpesacallback',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='mpesacallback',
+            index=models.Index(fields=['processed_at', 'next_attempt_at'], name='payments_mp_process_919c90_idx'),
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
 class Wallet(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
     balance = models.PositiveIntegerField(default=0)  # credits
@@ -10,6 +12,7 @@ class Wallet(models.Model):
     def __str__(self):
         return f"Wallet(user={self.user.username}, balance={self.balance})"
 
+
 class PaymentTransaction(models.Model):
     STATUS_CHOICES = (
         ('PENDING', 'PENDING'),
@@ -20,7 +23,7 @@ class PaymentTransaction(models.Model):
     amount = models.PositiveIntegerField()  # amount charged in KES
     credits = models.PositiveIntegerField()  # credits to grant on success
     phone = models.CharField(max_length=20)
-    checkout_request_id = models.CharField(max_length=128, blank=True, null=True)
+    checkout_request_id = models.CharField(max_length=128, blank=True, null=True, unique=True)
     merchant_request_id = models.CharField(max_length=128, blank=True, null=True)
     status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='PENDING')
     result_code = models.IntegerField(blank=True, null=True)
@@ -30,6 +33,75 @@ class PaymentTransaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'updated_at'])]  # reconcile_payments scan
+
+    def __str__(self):
+        return f"Payment(user={self.user.username}, amount={self.amount}, status={self.status})"
+
+
+class CreditHold(models.Model):
+    """Credits reserved for work in progress (see payments.ledger)."""
+    STATUS_CHOICES = (
+        ('HELD', 'HELD'),
+        ('COMMITTED', 'COMMITTED'),
+        ('RELEASED', 'RELEASED'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_holds')
+    amount = models.PositiveIntegerField()
+    used = models.PositiveIntegerField(default=0)  # credits actually consumed once committed
+    reference = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='HELD')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"CreditHold(user={self.user.username}, amount={self.amount}, status={self.status})"
+
+
+class LedgerEntry(models.Model):
+    """Append-only record of every change to a wallet; the balance is the sum of `delta`."""
+    KIND_CHOICES = (
+        ('OPENING', 'OPENING'),    # balance carried over when the ledger was introduced
+        ('PURCHASE', 'PURCHASE'),  # M-Pesa payment settled
+        ('GRANT', 'GRANT'),        # credits given by staff
+        ('RESERVE', 'RESERVE'),    # credits held for an analysis
+        ('RELEASE', 'RELEASE'),    # unused held credits returned
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    delta = models.IntegerField()
+    hold = models.ForeignKey(CreditHold, on_delete=models.PROTECT, blank=True, null=True, related_name='entries')
+    reference = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [models.Index(fields=['user', 'created_at'])]
+
+    def __str__(self):
+        return f"LedgerEntry(user={self.user.username}, kind={self.kind}, delta={self.delta:+d})"
+
+
+class MpesaCallback(models.Model):
+    """
+    Inbox of raw STK callbacks. The callback view only appends here (one row per
+    CheckoutRequestID, so redeliveries are no-ops); process_mpesa_callbacks applies them.
+    """
+    checkout_request_id = models.CharField(max_length=128, unique=True)
+    result_code = models.IntegerField()
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)  # failed or deferred attempts, capped by MPESA_CALLBACK_MAX_ATTEMPTS
+    next_attempt_at = models.DateTimeField(default=timezone.now)  # not applied before this (deferral or retry backoff)
+    error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['processed_at', 'next_attempt_at'])]
 
     def __str__(self):
-        return f"Payment(user={self.user.username}, amount={self.amount}, status={self.status})"
\ No newline at end of file
+        return f"MpesaCallback(checkout={self.checkout_request_id}, result={self.result_code}, processed={self.processed_at is not None})"
@@ -0,0 +1,75 @@
+# payments/reconcile.py
+"""
+Settling PENDING payments whose callback never arrived.
+
+reconcile_pending() picks a batch of stale PENDING transactions, asks Daraja
+for each one's status (STK Push Query) with at most MPESA_RECONCILE_CONCURRENCY
+requests in flight, and settles the answered ones through the same
+settle_transaction() as the callback path, so a payment is still credited once.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.utils import timezone
+from .callbacks import settle_transaction
+from .daraja import get_daraja, mpesa_password
+from .models import PaymentTransaction
+
+logger = logging.getLogger(__name__)
+
+# Daraja answers a query for a push the customer hasn't completed yet with this error
+STILL_PROCESSING = '500.001.1001'
+
+
+def query_status(checkout_request_id: str):
+    """Return (result_code, result_desc) from STK Push Query, or None while the payment is still in progress."""
+    short_code = os.getenv('MPESA_SHORT_CODE', '174379')
+    passkey = os.getenv('MPESA_PASSKEY') or os.getenv('passkey') or ''
+    timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
+    resp = get_daraja().stk_query({
+        "BusinessShortCode": int(short_code),
+        "Password": os.getenv('MPESA_PASSWORD') or mpesa_password(short_code, passkey, timestamp),
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id,
+    })
+    data = resp.json() if resp.headers.get('content-type', '').startswith('application/json') else {}
+    if data.get('errorCode') == STILL_PROCESSING:
+        return None
+    if resp.status_code != 200 or 'ResultCode' not in data:
+        raise RuntimeError(data.get('errorMessage') or f"STK query failed with HTTP {resp.status_code}")
+    return int(data['ResultCode']), data.get('ResultDesc')
+
+
+def _query(checkout_request_id: str):
+    try:
+        return query_status(checkout_request_id)
+    except Exception as e:
+        logger.warning("STK query for %s failed: %s", checkout_request_id, e)
+        return None
+
+
+def reconcile_pending(older_than: timedelta, batch: int, concurrency: int) -> dict:
+    """Query and settle one batch of stale PENDING transactions; returns counters."""
+    cutoff = timezone.now() - older_than
+    stale = PaymentTransaction.objects.filter(status='PENDING', updated_at__lt=cutoff)
+
+    # Never reached Daraja (e.g. the request died before the push): nothing to query
+    abandoned = stale.filter(checkout_request_id=None).update(
+        status='FAILED', result_desc='STK push was never sent', updated_at=timezone.now()
+    )
+
+    candidates = list(stale.exclude(checkout_request_id=None).order_by('updated_at')
+                      .values_list('pk', 'checkout_request_id')[:batch])
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        answers = list(pool.map(_query, [checkout_id for _, checkout_id in candidates]))
+
+    settled = 0
+    for (pk, checkout_id), answer in zip(candidates, answers):
+        if answer is None:
+            # Still in progress or the query failed: look again after another interval
+            PaymentTransaction.objects.filter(pk=pk, status='PENDING').update(updated_at=timezone.now())
+            continue
+        settled += settle_transaction(checkout_id, *answer) is not None
+    return {"queried": len(candidates), "settled": settled, "abandoned": abandoned}
@@ -0,0 +1,138 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from analyzer.jobs import enqueue
+from payments.callbacks import apply_callback, settle_transaction
+from payments.ledger import HoldReleased, InsufficientCredits, commit, ledger_balance, release, release_stale_holds, reserve
+from payments.models import CreditHold, LedgerEntry, MpesaCallback, PaymentTransaction, Wallet
+
+User = get_user_model()
+
+
+def balance(user) -> int:
+    return Wallet.objects.get(user=user).balance
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ledger', password='pw')
+        Wallet.objects.create(user=self.user, balance=5)
+        LedgerEntry.objects.create(user=self.user, kind='GRANT', delta=5)
+
+    def test_reserve_takes_credits_into_a_hold(self):
+        hold = reserve(self.user, 2)
+        self.assertEqual(hold.status, 'HELD')
+        self.assertEqual(balance(self.user), 3)
+        self.assertEqual(ledger_balance(self.user), 3)
+
+    def test_reserve_beyond_balance_raises(self):
+        with self.assertRaises(InsufficientCredits) as raised:
+            reserve(self.user, 6)
+        self.assertEqual((raised.exception.required, raised.exception.balance), (6, 5))
+        self.assertEqual(balance(self.user), 5)
+        self.assertFalse(CreditHold.objects.exists())
+
+    def test_commit_consumes_once_and_returns_the_unused_part(self):
+        hold = reserve(self.user, 3)
+        self.assertTrue(commit(hold, used=1))
+        self.assertFalse(commit(hold))
+        self.assertEqual(balance(self.user), 4)
+        self.assertEqual(ledger_balance(self.user), 4)
+        self.assertEqual(CreditHold.objects.get(pk=hold.pk).used, 1)
+
+    def test_release_refunds_once(self):
+        hold = reserve(self.user, 2)
+        self.assertTrue(release(hold))
+        self.assertFalse(release(hold))
+        self.assertEqual(balance(self.user), 5)
+        self.assertEqual(ledger_balance(self.user), 5)
+
+    def test_commit_after_release_raises(self):
+        hold = reserve(self.user)
+        release(hold)
+        with self.assertRaises(HoldReleased):
+            commit(CreditHold.objects.get(pk=hold.pk))
+        self.assertEqual(balance(self.user), 5)
+
+    def test_stale_sweep_skips_holds_of_pending_jobs(self):
+        job = enqueue(self.user, 'queued essay')
+        stray = reserve(self.user)
+        CreditHold.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(release_stale_holds(timedelta(minutes=10)), 1)
+        self.assertEqual(CreditHold.objects.get(pk=stray.pk).status, 'RELEASED')
+        self.assertEqual(CreditHold.objects.get(pk=job.credit_hold_id).status, 'HELD')
+        self.assertEqual(balance(self.user), 4)
+
+
+class SettleTransactionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('payer', password='pw')
+        Wallet.objects.create(user=self.user, balance=0)
+        PaymentTransaction.objects.create(
+            user=self.user, amount=100, credits=10, phone='254700000000', checkout_request_id='ws_CO_1'
+        )
+
+    def test_success_credits_once(self):
+        self.assertIsNotNone(settle_transaction('ws_CO_1', 0, 'ok'))
+        self.assertIsNone(settle_transaction('ws_CO_1', 0, 'ok'))
+        self.assertIsNone(settle_transaction('ws_CO_1', 1032, 'cancelled'))
+        txn = PaymentTransaction.objects.get(checkout_request_id='ws_CO_1')
+        self.assertEqual(txn.status, 'SUCCESS')
+        self.assertEqual(balance(self.user), 10)
+        self.assertEqual(LedgerEntry.objects.filter(kind='PURCHASE').count(), 1)
+
+    def test_failure_credits_nothing(self):
+        self.assertEqual(settle_transaction('ws_CO_1', 1032, 'cancelled').status, 'FAILED')
+        self.assertEqual(balance(self.user), 0)
+
+    def test_unknown_id_settles_nothing(self):
+        self.assertIsNone(settle_transaction('ws_CO_unknown', 0))
+
+    def _callback(self, checkout_request_id):
+        return MpesaCallback.objects.create(
+            checkout_request_id=checkout_request_id, result_code=0,
+            payload={'Body': {'stkCallback': {'CheckoutRequestID': checkout_request_id, 'ResultCode': 0}}},
+        )
+
+    def test_callback_applies_once(self):
+        callback = self._callback('ws_CO_1')
+        self.assertTrue(apply_callback(callback))
+        self.assertFalse(apply_callback(callback))
+        self.assertEqual(balance(self.user), 10)
+
+    @override_settings(MPESA_CALLBACK_UNKNOWN_GRACE=300)
+    def test_unknown_callback_is_deferred(self):
+        callback = self._callback('ws_CO_unknown')
+        self.assertFalse(apply_callback(callback))
+        callback.refresh_from_db()
+        self.assertIsNone(callback.processed_at)
+        self.assertEqual(callback.attempts, 1)
+        self.assertGreater(callback.next_attempt_at, timezone.now())
+
+
+
+@override_settings(MPESA_STATUS_MAX_WAIT=0.2, RATE_LIMIT_ENABLED=False)
+class PaymentStatusTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('payer', password='pw')
+        Wallet.objects.create(user=self.user, balance=0)
+        PaymentTransaction.objects.create(
+            user=self.user, amount=10, credits=10, phone='254700000000', checkout_request_id='ws_CO_1'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pending_payment_is_returned_after_the_cap(self):
+        response = self.client.get('/api/payments/status/ws_CO_1/?wait=3600')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'PENDING')
+
+    def test_wait_must_be_finite(self):
+        for wait in ('nan', 'inf', '-inf', 'soon'):
+            with self.subTest(wait=wait):
+                self.assertEqual(self.client.get(f'/api/payments/status/ws_CO_1/?wait={wait}').status_code, 400)
+
+    def test_unknown_payment(self):
+        self.assertEqual(self.client.get('/api/payments/status/ws_CO_2/').status_code, 404)
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import InitiateStkPushView, MpesaCallbackView, WalletView
+from .views import InitiateStkPushView, MpesaCallbackView, PaymentStatusView, WalletView, WalletGrantView
 
 urlpatterns = [
     path('payments/initiate/', InitiateStkPushView.as_view(), name='payments-initiate'),
     path('payments/callback/', MpesaCallbackView.as_view(), name='payments-callback'),
+    path('payments/status/<str:checkout_request_id>/', PaymentStatusView.as_view(), name='payments-status'),
     path('wallet/', WalletView.as_view(), name='wallet'),
+    path('wallet/grant/', WalletGrantView.as_view(), name='wallet-grant'),
 ]
\ No newline at end of file
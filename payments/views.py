@@ -1,60 +1,35 @@
-import base64
 import datetime
 import json
 import os
-import requests
+import time
 from dotenv import load_dotenv
-from django.db import transaction
+from django.conf import settings
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import Wallet, PaymentTransaction
+from analyzer.longpoll import parse_wait
+from .models import MpesaCallback, PaymentTransaction
+from .callbacks import InvalidCallback, parse_callback
+from .ledger import cached_balance, credit
+from .daraja import get_daraja, mpesa_password
 
 User = get_user_model()
 
 # Load env from .env if available
 load_dotenv()
 
-# Helpers
-
-def get_or_create_wallet(user: User) -> Wallet:
-    wallet, _ = Wallet.objects.get_or_create(user=user)
-    return wallet
-
-
-def mpesa_oauth_token():
-    token = os.getenv('MPESA_BEARER_TOKEN')
-    if token:
-        return token
-    basic = os.getenv('MPESA_BASIC_AUTH')
-    if basic:
-        headers = {'Authorization': f'Basic {basic}'}
-        resp = requests.get('https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials', headers=headers, timeout=15)
-        resp.raise_for_status()
-        return resp.json().get('access_token')
-    # Fallback to consumer key/secret if provided
-    key = os.getenv('MPESA_CONSUMER_KEY')
-    secret = os.getenv('MPESA_CONSUMER_SECRET')
-    if not key or not secret:
-        raise RuntimeError('MPESA credentials missing. Provide MPESA_BEARER_TOKEN or MPESA_BASIC_AUTH or CONSUMER_KEY/SECRET')
-    auth = (key, secret)
-    resp = requests.get('https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials', auth=auth, timeout=15)
-    resp.raise_for_status()
-    return resp.json().get('access_token')
-
-
-def mpesa_password(short_code: str, passkey: str, timestamp: str) -> str:
-    data = f"{short_code}{passkey}{timestamp}"
-    return base64.b64encode(data.encode()).decode()
-
 
 class InitiateStkPushView(APIView):
+    """
+    Start an STK push. No transaction is held across the Daraja call (it would
+    hold the database's write lock for up to MPESA_TIMEOUT): the PENDING record
+    is saved first, and the push result is written to it in one UPDATE afterwards.
+    """
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request):
         # Expect {"credits": 10|20|50|100, "phone": "2547..."}
         credits = int(request.data.get('credits') or 0)
@@ -82,11 +57,6 @@ class InitiateStkPushView(APIView):
             status='PENDING'
         )
 
-        token = mpesa_oauth_token()
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
         payload = {
             "BusinessShortCode": int(short_code),
             "Password": password,
@@ -102,8 +72,8 @@ class InitiateStkPushView(APIView):
         }
 
         try:
-            resp = requests.post('https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest',
-                                 headers=headers, json=payload, timeout=30)
+            # Shared pooled session and cached OAuth token (payments.daraja)
+            resp = get_daraja().stk_push(payload)
             data = resp.json() if resp.headers.get('content-type', '').startswith('application/json') else {}
             if resp.status_code != 200:
                 txn.status = 'FAILED'
@@ -125,44 +95,73 @@ class InitiateStkPushView(APIView):
 
 
 class MpesaCallbackView(APIView):
+    """
+    Daraja STK callback. Validates the payload, appends it to the MpesaCallback
+    inbox and acknowledges; process_mpesa_callbacks credits the wallet. A
+    redelivered callback hits the unique CheckoutRequestID and is a no-op.
+    """
     permission_classes = [AllowAny]  # MPESA will call without auth
 
-    @transaction.atomic
     def post(self, request):
         # Expect standard Daraja callback payload
         data = request.data if isinstance(request.data, dict) else json.loads(request.body.decode())
-        body = data.get('Body', {})
-        stk_callback = body.get('stkCallback', {})
-        result_code = stk_callback.get('ResultCode')
-        result_desc = stk_callback.get('ResultDesc')
-        checkout_request_id = stk_callback.get('CheckoutRequestID')
+        try:
+            checkout_request_id, result_code = parse_callback(data)
+        except InvalidCallback as e:
+            return Response({"ResultCode": 1, "ResultDesc": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        MpesaCallback.objects.bulk_create(
+            [MpesaCallback(checkout_request_id=checkout_request_id, result_code=result_code, payload=data)],
+            ignore_conflicts=True,
+        )
+        return Response({"ResultCode": 0, "ResultDesc": "Accepted"}, status=status.HTTP_200_OK)
 
+
+class PaymentStatusView(APIView):
+    """
+    Status of the user's payment by CheckoutRequestID. Pass ?wait=<seconds> to
+    long-poll until it is settled (capped at MPESA_STATUS_MAX_WAIT).
+    """
+    permission_classes = [IsAuthenticated]
+    poll_interval = 0.5
+
+    def get(self, request, checkout_request_id):
         try:
-            txn = PaymentTransaction.objects.select_for_update().get(checkout_request_id=checkout_request_id)
-        except PaymentTransaction.DoesNotExist:
-            # Unknown transaction; accept but do nothing
-            return Response({"status": "ignored"}, status=status.HTTP_200_OK)
-
-        txn.result_code = result_code
-        txn.result_desc = result_desc
-        if result_code == 0 or str(result_code) == '0':
-            txn.status = 'SUCCESS'
-            # Credit the wallet
-            wallet = get_or_create_wallet(txn.user)
-            wallet.balance = wallet.balance + txn.credits
-            wallet.save(update_fields=['balance'])
-        else:
-            txn.status = 'FAILED'
-        txn.save(update_fields=['status', 'result_code', 'result_desc'])
-        return Response({"status": "ok"}, status=status.HTTP_200_OK)
+            wait = parse_wait(request.query_params.get("wait"), settings.MPESA_STATUS_MAX_WAIT)
+        except ValueError:
+            return Response({"error": "'wait' must be a finite number of seconds."}, status=status.HTTP_400_BAD_REQUEST)
+        deadline = time.monotonic() + wait
+        payments = PaymentTransaction.objects.filter(user=request.user, checkout_request_id=checkout_request_id)
+        while True:
+            txn = payments.values("checkout_request_id", "status", "credits", "amount", "result_desc").first()
+            if txn is None:
+                return Response({"error": "Payment not found."}, status=status.HTTP_404_NOT_FOUND)
+            if txn["status"] != 'PENDING' or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+        return Response(txn, status=status.HTTP_200_OK)
 
 
 class WalletView(APIView):
+    """The user's credit balance. Read-only; served from the cache when it is shared (see payments.ledger)."""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        wallet = get_or_create_wallet(request.user)
-        wallet.balance = 10
-        wallet.save(update_fields=['balance'])
-        return Response({"balance": wallet.balance})
-        # return Response({"balance": wallet.balance})
\ No newline at end of file
+        return Response({"balance": cached_balance(request.user.pk)})
+
+
+class WalletGrantView(APIView):
+    """Staff-only: add credits to a user's wallet, e.g. for testing. {"username": "...", "credits": 10}"""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        try:
+            credits = int(request.data.get('credits') or 0)
+        except (TypeError, ValueError):
+            credits = 0
+        if credits <= 0:
+            return Response({"error": "'credits' must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+        user = User.objects.filter(username=request.data.get('username') or '').first()
+        if user is None:
+            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        credit(user, credits, 'GRANT', reference=f'staff:{request.user.pk}')
+        return Response({"success": True, "username": user.username, "granted": credits}, status=status.HTTP_200_OK)